@@ -0,0 +1,115 @@
+import asyncio
+import logging
+
+from async_db import (
+    archive_idle_forms, archive_inactive_forms, enable_incremental_vacuum,
+    purge_archive, prune_form_changes, run_maintenance
+)
+from database import FORM_CACHE_SIZE
+
+# Как часто запускать обслуживание базы (секунды)
+ARCHIVE_INTERVAL = 3600
+
+# Одобренные анкеты пользователей, заблокировавших бота больше
+# ARCHIVE_INACTIVE_DAYS дней назад или не писавших боту больше
+# ARCHIVE_IDLE_DAYS дней, уходят из рабочей таблицы в архив. Пока анкета
+# там, меню, рассылки и поиск дублей видят её в архиве; при первом же
+# сообщении пользователя она возвращается в forms (touch_user)
+ARCHIVE_INACTIVE_DAYS = 30
+ARCHIVE_IDLE_DAYS = 90
+
+# Сколько дней хранить архивные анкеты по причине попадания в архив;
+# 0 — хранить всегда
+ARCHIVE_RETENTION_DAYS = {
+    "deleted": 90,
+    "rejected": 365,
+    "inactive": 0,
+    "idle": 0,
+}
+
+# Сколько последних записей журнала form_changes хранить. Его читают
+# выгрузки (до своих отметок — их записи не удаляются) и кэши анкет
+# других процессов; кэш, отставший больше чем на FORM_CACHE_SIZE
+# изменений, всё равно сбрасывается целиком
+FORM_CHANGES_KEEP = FORM_CACHE_SIZE
+
+# Строк за одну транзакцию: короткие транзакции не держат запись надолго
+ARCHIVE_BATCH_SIZE = 500
+
+# Сколько свободных страниц возвращать за проход и сколько строк
+# индекса смотреть ANALYZE
+VACUUM_PAGES = 2000
+ANALYSIS_LIMIT = 1000
+
+
+class ArchiveJob:
+    """Фоновое обслуживание базы: переносит анкеты ушедших и давно
+    не заходивших пользователей в архив, чистит архив по срокам хранения
+    и журнал изменений анкет, возвращает место инкрементальным VACUUM и обновляет статистику
+    для планировщика"""
+
+    def __init__(self):
+        self.stats = {"archived": 0, "purged": 0, "pruned_changes": 0, "vacuumed_pages": 0}
+        self._stopping = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановиться после текущей пачки"""
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await self.run_once()
+            except Exception as e:
+                logging.error(f"Ошибка обслуживания базы: {e}")
+
+            try:
+                await asyncio.wait_for(self._stopping.wait(), ARCHIVE_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _batches(self, func, *args):
+        """Вызывать func пачками, пока она что-то обрабатывает"""
+        total = 0
+        while not self._stopping.is_set():
+            count = await func(*args, ARCHIVE_BATCH_SIZE)
+            total += count
+            if count < ARCHIVE_BATCH_SIZE:
+                break
+        return total
+
+    async def run_once(self):
+        archived = await self._batches(archive_inactive_forms, ARCHIVE_INACTIVE_DAYS)
+        archived += await self._batches(archive_idle_forms, ARCHIVE_IDLE_DAYS)
+
+        purged = 0
+        for reason, keep_days in ARCHIVE_RETENTION_DAYS.items():
+            if keep_days:
+                purged += await self._batches(purge_archive, reason, keep_days)
+
+        pruned = await self._batches(prune_form_changes, FORM_CHANGES_KEEP)
+
+        vacuumed = 0
+        if not self._stopping.is_set():
+            # Один раз для базы, созданной до auto_vacuum = INCREMENTAL;
+            # дальше это одна прагма
+            await enable_incremental_vacuum()
+            vacuumed = await run_maintenance(VACUUM_PAGES, ANALYSIS_LIMIT)
+
+        self.stats["archived"] += archived
+        self.stats["purged"] += purged
+        self.stats["pruned_changes"] += pruned
+        self.stats["vacuumed_pages"] += vacuumed
+        if archived or purged or pruned:
+            logging.info(
+                f"Обслуживание базы: в архив {archived}, удалено из архива {purged}, "
+                f"из журнала изменений {pruned}, освобождено страниц {vacuumed}"
+            )
\ No newline at end of file
@@ -0,0 +1,71 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+from metrics import timed_call
+
+# Все запросы к SQLite выполняются в одном отдельном потоке:
+# обработчики ждут результат, а event loop продолжает принимать апдейты.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+
+
+async def run_db(func, *args, **kwargs):
+    """Выполнить синхронную функцию БД в потоке базы данных"""
+    loop = asyncio.get_running_loop()
+    # Время меряется в самом потоке БД, без ожидания в очереди к нему
+    return await loop.run_in_executor(_executor, functools.partial(timed_call, func, *args, **kwargs))
+
+
+def _async(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_db(func, *args, **kwargs)
+    return wrapper
+
+
+def shutdown():
+    """Дождаться завершения всех запросов, остановить поток БД и закрыть соединение"""
+    _executor.shutdown(wait=True)
+    database.close_connection()
+
+
+init_db = _async(database.init_db)
+save_form = _async(database.save_form)
+get_all_forms = _async(database.get_all_forms)
+get_forms_page = _async(database.get_forms_page)
+get_user_form = _async(database.get_user_form)
+update_form_field = _async(database.update_form_field)
+delete_form = _async(database.delete_form)
+delete_user_form = _async(database.delete_user_form)
+update_form_status = _async(database.update_form_status)
+ban_user = _async(database.ban_user)
+is_banned = _async(database.is_banned)
+unban_user = _async(database.unban_user)
+get_admin_message_id = _async(database.get_admin_message_id)
+update_admin_message_id = _async(database.update_admin_message_id)
+accept_forms = _async(database.accept_forms)
+reject_forms = _async(database.reject_forms)
+create_broadcast = _async(database.create_broadcast)
+get_broadcast = _async(database.get_broadcast)
+get_running_broadcasts = _async(database.get_running_broadcasts)
+get_broadcast_recipients = _async(database.get_broadcast_recipients)
+save_broadcast_checkpoint = _async(database.save_broadcast_checkpoint)
+finish_broadcast = _async(database.finish_broadcast)
+touch_user = _async(database.touch_user)
+load_fsm_session = _async(database.load_fsm_session)
+save_fsm_sessions = _async(database.save_fsm_sessions)
+delete_expired_fsm_sessions = _async(database.delete_expired_fsm_sessions)
+get_outbox_batch = _async(database.get_outbox_batch)
+complete_outbox = _async(database.complete_outbox)
+retry_outbox = _async(database.retry_outbox)
+reconcile_outbox = _async(database.reconcile_outbox)
+search_forms = _async(database.search_forms)
+get_stats = _async(database.get_stats)
+archive_inactive_forms = _async(database.archive_inactive_forms)
+archive_idle_forms = _async(database.archive_idle_forms)
+purge_archive = _async(database.purge_archive)
+prune_form_changes = _async(database.prune_form_changes)
+enable_incremental_vacuum = _async(database.enable_incremental_vacuum)
+run_maintenance = _async(database.run_maintenance)
+get_form_history = _async(database.get_form_history)
\ No newline at end of file
@@ -0,0 +1,94 @@
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+# Микробенчмарк соединений с базой: те же запросы, что на каждом апдейте
+# (бан-лист, последняя анкета пользователя, правка поля), через новое
+# соединение на каждый вызов — как было раньше — и через постоянное
+# настроенное соединение database.get_connection().
+#
+#   python bench_connection.py --ops 20000 --forms 50000
+
+IS_BANNED = "SELECT 1 FROM banned_users WHERE user_id = ?"
+USER_FORM = "SELECT * FROM forms WHERE user_id = ? ORDER BY id DESC LIMIT 1"
+UPDATE_FIELD = "UPDATE forms SET call_as = ? WHERE id = (SELECT MAX(id) FROM forms WHERE user_id = ?)"
+
+
+def _fill(database, forms):
+    conn = database.get_connection()
+    with conn:
+        conn.executemany(
+            "INSERT INTO forms (user_id, name, tg_username, mc_nick, call_as, age, extra, status, created_at) "
+            "VALUES (?, ?, ?, ?, ?, 20, 'Бенчмарк', 'accepted', '2024-01-01 00:00:00')",
+            ((user_id, f"Игрок {user_id}", f"user{user_id}", f"mc_{user_id}", "Игрок") for user_id in range(forms))
+        )
+
+
+def _update(conn, ops, forms):
+    """Один «апдейт»: две проверки на чтение и одна запись"""
+    user_id = ops % forms
+    conn.execute(IS_BANNED, (user_id,)).fetchone()
+    conn.execute(USER_FORM, (user_id,)).fetchone()
+    conn.execute(UPDATE_FIELD, (f"Игрок {ops}", user_id))
+    conn.commit()
+
+
+def per_call(database, ops, forms):
+    """Как до постоянного соединения: connect/close на каждый вызов"""
+    for index in range(ops):
+        user_id = index % forms
+        for sql, params in ((IS_BANNED, (user_id,)), (USER_FORM, (user_id,))):
+            conn = sqlite3.connect(database.DB_PATH)
+            conn.execute(sql, params).fetchone()
+            conn.close()
+        conn = sqlite3.connect(database.DB_PATH)
+        conn.execute(UPDATE_FIELD, (f"Игрок {index}", user_id))
+        conn.commit()
+        conn.close()
+
+
+def persistent(database, ops, forms):
+    conn = database.get_connection()
+    for index in range(ops):
+        _update(conn, index, forms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение соединения на вызов и постоянного соединения")
+    parser.add_argument("--ops", type=int, default=5000, help="сколько апдейтов (3 запроса каждый) прогнать")
+    parser.add_argument("--forms", type=int, default=10000, help="сколько анкет в базе")
+    parser.add_argument("--min-speedup", type=float, default=0, help="минимальное ускорение, раз")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    workdir = tempfile.mkdtemp(prefix="anketolog-bench-")
+    os.chdir(workdir)
+    try:
+        import database
+
+        database.init_db()
+        _fill(database, args.forms)
+
+        results = {}
+        for name, func in (("соединение на вызов", per_call), ("постоянное соединение", persistent)):
+            started = time.perf_counter()
+            func(database, args.ops, args.forms)
+            results[name] = args.ops * 3 / (time.perf_counter() - started)
+            print(f"{name}: {results[name]:.0f} запросов/с")
+        database.close_connection()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    speedup = results["постоянное соединение"] / results["соединение на вызов"]
+    print(f"Ускорение: {speedup:.1f}×")
+    if args.min_speedup and speedup < args.min_speedup:
+        print(f"ПРОВАЛ: ускорение {speedup:.1f}× < {args.min_speedup}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
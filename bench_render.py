@@ -0,0 +1,141 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Бенчмарк рендеринга анкет: чтение N анкет из базы и сборка карточек
+# для админ-группы и строк списка. «До» — строки sqlite3.Row и шаблоны,
+# которые были в bot.py до models.Form и cards.py (без экранирования),
+# «после» — Form через row_factory и рендеры из cards.py.
+#
+#   python bench_render.py --forms 10000
+#   python bench_render.py --forms 10000 --html     # поля, которые надо экранировать
+
+
+# ------------------------------- КАК БЫЛО -------------------------------
+
+_OLD_DUPLICATE_LABELS = {"mc_nick": "🎮 Minecraft", "tg_username": "📱 Telegram"}
+_OLD_STATUS_EMOJI = {'pending': '⏳', 'accepted': '✅', 'rejected': '❌'}
+
+
+def _old_duplicates(form):
+    if not form["duplicates"]:
+        return ""
+    parts = [
+        f"{_OLD_DUPLICATE_LABELS[field]} — " + ", ".join(f"#{form_id}" for form_id in form_ids)
+        for field, form_ids in json.loads(form["duplicates"]).items()
+    ]
+    return "\n\n⚠️ <b>Возможный дубль:</b>\n" + "\n".join(parts)
+
+
+def _old_admin_card(form):
+    edited_mark = " ✏️ <i>(Отредактирована)</i>" if form["is_edited"] else ""
+    return (
+        f"📝 <b>Новая анкета!</b>{edited_mark}\n\n"
+        f"<b>🆔 ID анкеты:</b> {form['id']}\n"
+        f"<b>👤 Имя:</b> {form['name']}\n"
+        f"<b>📱 Telegram:</b> @{form['tg_username']}\n"
+        f"<b>🎮 Minecraft:</b> {form['mc_nick']}\n"
+        f"<b>💬 Обращение:</b> {form['call_as']}\n"
+        f"<b>🎂 Возраст:</b> {form['age']}\n"
+        f"<b>📝 Дополнительно:</b>\n{form['extra']}\n\n"
+        f"<i>🔑 User ID:</i> <code>{form['user_id']}</code>"
+        f"{_old_duplicates(form)}"
+    )
+
+
+def _old_list_item(form):
+    edited_mark = " ✏️" if form["is_edited"] else ""
+    extra = form["extra"] or ""
+    if len(extra) > 300:
+        extra = extra[:300] + "…"
+    return (
+        f"{_OLD_STATUS_EMOJI.get(form['status'], '❓')}{edited_mark} <b>ID анкеты:</b> {form['id']}\n"
+        f"<b>👤 Имя:</b> {form['name']}\n"
+        f"<b>📱 Telegram:</b> @{form['tg_username']}\n"
+        f"<b>🎮 Minecraft:</b> {form['mc_nick']}\n"
+        f"<b>💬 Обращение:</b> {form['call_as']}\n"
+        f"<b>🎂 Возраст:</b> {form['age']}\n"
+        f"<b>📝 Дополнительно:</b> {extra}\n"
+        f"<b>🔑 User ID:</b> <code>{form['user_id']}</code>\n"
+        f"<b>📊 Статус:</b> {form['status']}\n"
+        f"{'-' * 30}\n\n"
+    )
+
+
+# -------------------------------
+
+def _fill(conn, forms, with_html):
+    text = "Люблю <редстоун> & фермы " if with_html else "Люблю редстоун и фермы "
+    with conn:
+        conn.executemany(
+            "INSERT INTO forms (user_id, name, tg_username, mc_nick, call_as, age, extra, status, is_edited, duplicates) "
+            "VALUES (?, ?, ?, ?, ?, 20, ?, 'pending', ?, ?)",
+            (
+                (index, f"Игрок {index}", f"user{index}", f"mc_{index}", "Игрок", text * 20, index % 3 == 0,
+                 json.dumps({"mc_nick": [index - 1]}) if index % 10 == 0 else None)
+                for index in range(forms)
+            )
+        )
+
+
+def _best(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Чтение и рендеринг анкет: до и после models.Form и cards.py")
+    parser.add_argument("--forms", type=int, default=10000, help="сколько анкет рендерить")
+    parser.add_argument("--repeat", type=int, default=5, help="сколько прогонов, берётся лучший")
+    parser.add_argument("--html", action="store_true", help="заполнить поля символами <, > и &")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    workdir = tempfile.mkdtemp(prefix="anketolog-render-")
+    os.chdir(workdir)
+    try:
+        import cards
+        import database
+        from models import FORM_COLUMNS
+
+        database.init_db()
+        conn = database.get_connection()
+        _fill(conn, args.forms, args.html)
+
+        def old_rows():
+            return conn.execute("SELECT * FROM forms").fetchall()
+
+        def new_rows():
+            cur = database._form_cursor()
+            cur.execute(f"SELECT {FORM_COLUMNS} FROM forms")
+            return cur.fetchall()
+
+        rows_before, rows_after = old_rows(), new_rows()
+        results = [
+            ("чтение", _best(old_rows, args.repeat), _best(new_rows, args.repeat)),
+            ("карточка админа",
+             _best(lambda: [_old_admin_card(form) for form in rows_before], args.repeat),
+             _best(lambda: [cards.admin_card(form) for form in rows_after], args.repeat)),
+            ("строка списка",
+             _best(lambda: [_old_list_item(form) for form in rows_before], args.repeat),
+             _best(lambda: [cards.list_item(form) for form in rows_after], args.repeat)),
+        ]
+        database.close_connection()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"Анкет: {args.forms}{', поля с HTML' if args.html else ''}; лучший из {args.repeat} прогонов, мс")
+    for name, before, after in results:
+        print(f"  {name}: до {before:.1f}, после {after:.1f} (×{before / after:.2f})")
+
+
+if __name__ == "__main__":
+    main()
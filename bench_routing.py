@@ -0,0 +1,130 @@
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+# Бенчмарк выбора обработчика: те же кнопки меню и callback_data, что в
+# bot.py, зарегистрированные по-старому — цепочкой фильтров-лямбд — и через
+# routing.TextRouter/CallbackRouter. Обработчики пустые, сеть не нужна,
+# так что меряется только то, что диспетчер тратит на поиск обработчика.
+#
+#   python bench_routing.py --updates 20000
+
+
+async def _noop(event):
+    pass
+
+
+def lambda_dispatcher(texts, callbacks, prefixes):
+    """Как было: по обработчику с фильтром-лямбдой на каждую кнопку"""
+    dp = Dispatcher()
+    for text in texts:
+        dp.message.register(_noop, lambda message, text=text: message.text == text)
+    for data in callbacks:
+        dp.callback_query.register(_noop, lambda callback, data=data: callback.data == data)
+    for prefix in prefixes:
+        dp.callback_query.register(_noop, lambda callback, prefix=prefix: callback.data.startswith(prefix))
+    return dp
+
+
+def lookup_dispatcher(texts, callbacks, prefixes):
+    """Как сейчас: весь набор — один обработчик с поиском по словарю"""
+    from routing import CallbackRouter, TextRouter
+
+    dp = Dispatcher()
+    menu_buttons = TextRouter()
+    menu_buttons(*texts)(_noop)
+    menu_buttons.attach(dp.message)
+
+    router = CallbackRouter()
+    router(*callbacks)(_noop)
+    for prefix in prefixes:
+        router.prefix(prefix)(_noop)
+    router.attach(dp.callback_query)
+    return dp
+
+
+def _updates(bot, texts, prefixes):
+    """Обновления, на которых видна разница: первая и последняя кнопка меню,
+    текст не из меню (ответ на вопрос анкеты) и inline-кнопка по префиксу"""
+    user = {"id": 1, "is_bot": False, "first_name": "bench"}
+    chat = {"id": 1, "type": "private"}
+
+    def message(text):
+        return {"message": {"message_id": 1, "date": 0, "chat": chat, "from": user, "text": text}}
+
+    cases = {
+        "первая кнопка меню": message(texts[0]),
+        "последняя кнопка меню": message(texts[-1]),
+        "текст не из меню": message("Игрок 42"),
+        "inline-кнопка по префиксу": {"callback_query": {
+            "id": "1", "chat_instance": "bench", "from": user, "data": f"{prefixes[-1]}42_7"
+        }},
+    }
+    return {
+        name: Update.model_validate({"update_id": 1, **event}, context={"bot": bot})
+        for name, event in cases.items()
+    }
+
+
+async def _measure(dp, bot, update, count):
+    started = time.perf_counter()
+    for _ in range(count):
+        await dp.feed_update(bot, update)
+    return (time.perf_counter() - started) / count * 1e6
+
+
+async def run(args):
+    import bot as app
+
+    texts = list(app.menu_buttons.exact)
+    callbacks = list(app.callbacks.exact)
+    prefixes = list(app.callbacks.prefixes)
+    print(f"Кнопок меню: {len(texts)}, callback_data: {len(callbacks)}, префиксов: {len(prefixes)}")
+
+    bot = Bot("42:BENCH")
+    dispatchers = {
+        "лямбды": lambda_dispatcher(texts, callbacks, prefixes),
+        "словарь": lookup_dispatcher(texts, callbacks, prefixes),
+    }
+    results = {}
+    for case, update in _updates(bot, texts, prefixes).items():
+        timings = {name: await _measure(dp, bot, update, args.updates) for name, dp in dispatchers.items()}
+        results[case] = timings
+        print(
+            f"{case}: лямбды {timings['лямбды']:.1f} мкс, словарь {timings['словарь']:.1f} мкс "
+            f"(×{timings['лямбды'] / timings['словарь']:.1f})"
+        )
+    await bot.session.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Накладные расходы на выбор обработчика для одного обновления")
+    parser.add_argument("--updates", type=int, default=5000, help="сколько раз прогнать каждое обновление")
+    parser.add_argument("--max-lookup-us", type=float, default=0, help="максимум мкс на обновление через словарь")
+    args = parser.parse_args()
+
+    # bot.py создаёт forms.db в текущем каталоге, поэтому импортируем его из временного
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    workdir = tempfile.mkdtemp(prefix="anketolog-routing-")
+    os.chdir(workdir)
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    worst = max(timings["словарь"] for timings in results.values())
+    if args.max_lookup_us and worst > args.max_lookup_us:
+        print(f"ПРОВАЛ: {worst:.1f} мкс на обновление > {args.max_lookup_us}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
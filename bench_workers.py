@@ -0,0 +1,129 @@
+import argparse
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from functools import partial
+
+# Бенчмарк режима воркеров: одни и те же синтетические обновления
+# (/start, заполнение анкеты, «Моя анкета») раздаются по user_id в 1..N
+# процессов, как в run_receiver, и меряется пропускная способность.
+# Bot API подменён FakeTelegram из loadtest.py, база — временная и общая.
+#
+#   python bench_workers.py --workers 4 --users 2000
+#   python bench_workers.py --workers 4 --min-scaling 2.5   # проверка ускорения на 4 ядрах
+
+
+def _worker(index, queue, results, api_latency):
+    """Процесс-воркер: как bot.run_worker, но с подменённым Bot API"""
+    import sender
+    sender.GLOBAL_RATE = sender.PRIVATE_CHAT_RATE = sender.GROUP_CHAT_RATE = 1e9
+
+    import bot as app
+    from loadtest import FakeTelegram
+    from workers import UserOrderedFeeder
+
+    logging.getLogger().setLevel(logging.WARNING)
+    app.bot.session.make_request = FakeTelegram(app.ADMIN_GROUP_ID, api_latency).make_request
+
+    async def run():
+        await app.start_services(primary=index == 0, metrics_port=0)
+        feeder = UserOrderedFeeder(app.dp, app.bot)
+        results.put(("ready", index))
+        try:
+            await feeder.consume(queue)
+            results.put(("done", index, feeder.processed, time.time()))
+        finally:
+            await app.dp.emit_shutdown(bot=app.bot)
+            await app.stop_services()
+
+    asyncio.run(run())
+
+
+def _updates(users, menu_fill_form, menu_my_form):
+    """Сырые обновления в том виде, в каком их получает приёмник"""
+    update_ids = itertools.count(1)
+    for user_id in range(1_000_000, 1_000_000 + users):
+        answers = (f"Игрок {user_id}", f"user{user_id}", f"mc_{user_id}", "Игрок", "20", "Бенчмарк")
+        for text in ("/start", menu_fill_form, *answers, menu_my_form):
+            update_id = next(update_ids)
+            yield {
+                "update_id": update_id,
+                "message": {
+                    "message_id": update_id, "date": 0, "text": text,
+                    "chat": {"id": user_id, "type": "private"},
+                    "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+                }
+            }
+
+
+def run(workers, users, api_latency):
+    """Обновлений в секунду при workers процессах на свежей базе"""
+    import database
+    from workers import WorkerPool
+
+    # Миграции — до запуска воркеров, как в run_receiver
+    database.init_db()
+    database.close_connection()
+
+    import bot as app
+    updates = list(_updates(users, app.MENU_FILL_FORM, app.MENU_MY_FORM))
+
+    results = multiprocessing.get_context("spawn").Queue()
+    pool = WorkerPool(partial(_worker, results=results, api_latency=api_latency), workers)
+    pool.start()
+    for _ in range(workers):
+        results.get()
+
+    started = time.time()
+    for update in updates:
+        pool.route(update)
+    asyncio.run(pool.stop())
+
+    finished, processed = started, 0
+    while not results.empty():
+        _, _, count, finished_at = results.get()
+        processed += count
+        finished = max(finished, finished_at)
+
+    if processed != len(updates):
+        raise RuntimeError(f"обработано {processed} обновлений из {len(updates)}")
+    return len(updates) / (finished - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Масштабирование режима воркеров от 1 до N процессов")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="до скольких воркеров мерить")
+    parser.add_argument("--users", type=int, default=1000, help="сколько пользователей заполняют анкету")
+    parser.add_argument("--api-latency", type=float, default=0, help="задержка ответа Bot API, мс")
+    parser.add_argument("--min-scaling", type=float, default=0, help="минимальное ускорение при N воркерах, раз")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    root = os.getcwd()
+
+    rates = {}
+    for workers in range(1, args.workers + 1):
+        # Каждый прогон — на своей пустой базе, чтобы прогоны не влияли друг на друга
+        workdir = tempfile.mkdtemp(prefix="anketolog-workers-")
+        os.chdir(workdir)
+        try:
+            rates[workers] = run(workers, args.users, args.api_latency / 1000)
+        finally:
+            os.chdir(root)
+            shutil.rmtree(workdir, ignore_errors=True)
+        print(f"Воркеров: {workers} — {rates[workers]:.0f} обновлений/с, ×{rates[workers] / rates[1]:.2f}")
+
+    scaling = rates[args.workers] / rates[1]
+    if args.min_scaling and scaling < args.min_scaling:
+        print(f"ПРОВАЛ: ускорение при {args.workers} воркерах {scaling:.2f}× < {args.min_scaling}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
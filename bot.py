@@ -1,58 +1,103 @@
 import asyncio
+import html
 import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from functools import partial
 
-from aiogram import Bot, Dispatcher, types, F
+from aiogram import Bot, Dispatcher, types
 from aiogram.filters import Command
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardRemove
-
-from config import ADMIN_IDS, TOKEN, ADMIN_GROUP_ID, INVITE_LINK
-from database import (
-    init_db, save_form, get_all_forms, get_user_form, 
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardRemove, FSInputFile
+
+import cards
+import metrics
+from broadcast import run_broadcast
+from cache import TTLCache
+from config import ADMIN_IDS, TOKEN, ADMIN_GROUP_ID, INVITE_LINK, ADMIN_EDIT_DEBOUNCE, BOT_MODE, BOT_WORKERS
+from config import METRICS_HOST, METRICS_PORT
+from database import get_form_cache_stats, get_ban_cache_stats, make_search_query, SEARCH_MIN_LENGTH
+from export import export_to_csv
+from fsm_storage import SQLiteStorage
+from html_chunks import TELEGRAM_MESSAGE_LIMIT, iter_chunks, message_length, split_html
+from archive import ArchiveJob
+from outbox import OutboxDispatcher
+from routing import TextRouter, CallbackRouter
+from sender import GLOBAL_RATE, SendQueue, Debouncer, PRIORITY_USER, PRIORITY_ADMIN, PRIORITY_BULK
+from webhook import run_webhook
+from workers import WorkerPool, UserOrderedFeeder, RoutingRequestHandler, ignore_stop_signals, poll_updates
+from async_db import (
+    init_db, save_form, get_forms_page, get_user_form, 
     delete_form, delete_user_form, update_form_status,
     ban_user, is_banned, unban_user, update_form_field,
-    get_admin_message_id, update_admin_message_id
+    accept_forms, reject_forms,
+    create_broadcast, get_running_broadcasts, finish_broadcast, touch_user, search_forms,
+    get_stats, get_form_history,
+    shutdown as shutdown_db
 )
 
 logging.basicConfig(level=logging.INFO)
 
 bot = Bot(TOKEN)
-dp = Dispatcher()
+
+# Состояния FSM хранятся в базе, чтобы недописанные анкеты переживали рестарт
+fsm_storage = SQLiteStorage()
+dp = Dispatcher(storage=fsm_storage)
+
+# Кнопки главного меню и inline-кнопки выбираются поиском по словарю,
+# а не перебором фильтров. Меню подключено раньше обработчиков состояний,
+# поэтому кнопка меню срабатывает, даже если пользователь посреди диалога
+menu_buttons = TextRouter()
+menu_buttons.attach(dp.message)
+callbacks = CallbackRouter()
+callbacks.attach(dp.callback_query)
+
+# Все исходящие сообщения идут через очередь с ограничением скорости.
+# Общий лимит Telegram на бота делится между процессами-воркерами
+send_queue = SendQueue(bot, global_rate=GLOBAL_RATE / BOT_WORKERS)
+
+_background_tasks = set()
+
+# Схлопывание правок сообщений с анкетами в админ-группе
+admin_edits = Debouncer(lambda user_id: flush_admin_form_message(user_id), ADMIN_EDIT_DEBOUNCE)
+admin_edit_stats = {"sent": 0, "unchanged": 0}
+_admin_message_texts = TTLCache(maxsize=5000, ttl=24 * 3600)
 
 # -------------------------------
 
-async def update_admin_form_message(user_id):
-    """Обновить сообщение с анкетой в админ-чате"""
-    form = get_user_form(user_id)
-    if not form:
-        return
-    
-    # Проверяем количество полей и распаковываем соответственно
-    if len(form) == 13:  # Новая структура
-        form_id, user_id_db, name, tg_username, mc_nick, call_as, age, extra, status, created_at, edited_at, is_edited, admin_message_id = form
-    else:  # Старая структура
-        logging.warning("Старая структура БД - пересоздайте базу данных!")
-        return
-    
-    if not admin_message_id:
+def get_admin_edit_stats():
+    """Сколько правок админ-сообщений отправлено и сколько сэкономлено"""
+    saved = admin_edits.coalesced + admin_edit_stats["unchanged"]
+    return dict(admin_edit_stats, coalesced=admin_edits.coalesced, saved=saved)
+
+def run_in_background(coro):
+    """Запустить корутину в фоне, сохранив ссылку на задачу"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+async def report_delivery(future, ok_text=None, fail_text=None, reply_to=None):
+    """Дождаться отправки из очереди и сообщить результат в админ-группу"""
+    try:
+        await future
+    except Exception as e:
+        if fail_text:
+            send_queue.send_message(
+                ADMIN_GROUP_ID, f"{fail_text}\n<i>{html.escape(str(e))}</i>", PRIORITY_ADMIN,
+                parse_mode="HTML", reply_to_message_id=reply_to
+            )
         return
-    
-    edited_mark = " ✏️ <i>(Отредактирована)</i>" if is_edited else ""
-    
-    text = (
-        f"📝 <b>Новая анкета!</b>{edited_mark}\n\n"
-        f"<b>🆔 ID анкеты:</b> {form_id}\n"
-        f"<b>👤 Имя:</b> {name}\n"
-        f"<b>📱 Telegram:</b> @{tg_username}\n"
-        f"<b>🎮 Minecraft:</b> {mc_nick}\n"
-        f"<b>💬 Обращение:</b> {call_as}\n"
-        f"<b>🎂 Возраст:</b> {age}\n"
-        f"<b>📝 Дополнительно:</b>\n{extra}\n\n"
-        f"<i>🔑 User ID:</i> <code>{user_id}</code>"
-    )
-    
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+
+    if ok_text:
+        send_queue.send_message(ADMIN_GROUP_ID, ok_text, PRIORITY_ADMIN, parse_mode="HTML", reply_to_message_id=reply_to)
+
+def admin_form_keyboard(user_id, form_id):
+    """Кнопки модерации под карточкой анкеты"""
+    return InlineKeyboardMarkup(inline_keyboard=[
         [
             InlineKeyboardButton(text="✅ Принять", callback_data=f"accept_{user_id}_{form_id}"),
             InlineKeyboardButton(text="❌ Отказать", callback_data=f"reject_{user_id}_{form_id}")
@@ -62,34 +107,115 @@ async def update_admin_form_message(user_id):
             InlineKeyboardButton(text="🗑 Удалить", callback_data=f"delete_{form_id}_{user_id}")
         ]
     ])
+
+def render_admin_notification(form):
+    """Карточка новой анкеты с кнопками — для отправки из outbox"""
+    return cards.admin_card(form), admin_form_keyboard(form.user_id, form.id)
+
+# Карточки новых анкет уходят в админ-группу из таблицы form_outbox
+form_outbox = OutboxDispatcher(send_queue, render_admin_notification, on_delivered=_admin_message_texts.set)
+
+# Перенос старых анкет в архив, сроки хранения, VACUUM и ANALYZE
+archive_job = ArchiveJob()
+
+async def update_admin_form_message(user_id):
+    """Обновить сообщение с анкетой в админ-чате.
+
+    Правки, пришедшие в течение ADMIN_EDIT_DEBOUNCE секунд, схлопываются
+    в одно редактирование с итоговым состоянием анкеты."""
+    admin_edits.schedule(user_id)
+
+async def flush_admin_form_message(user_id):
+    """Отредактировать сообщение с анкетой, если его текст изменился"""
+    form = await get_user_form(user_id)
+    if not form:
+        return
     
-    try:
-        await bot.edit_message_text(
-            text=text,
-            chat_id=ADMIN_GROUP_ID,
-            message_id=admin_message_id,
-            parse_mode="HTML",
-            reply_markup=keyboard
-        )
-    except Exception as e:
-        logging.error(f"Не удалось обновить сообщение в админ-чате: {e}")
+    admin_message_id = form.admin_message_id
+    if not admin_message_id:
+        return
+    
+    text = cards.admin_card(form)
+    keyboard = admin_form_keyboard(user_id, form.id)
+    
+    # Telegram всё равно отклонит правку без изменений, не тратим на неё лимит
+    if _admin_message_texts.get(admin_message_id, None) == text:
+        admin_edit_stats["unchanged"] += 1
+        return
+    admin_edit_stats["sent"] += 1
+
+    # Ошибку, если что, залогирует очередь отправки; текст запоминаем только
+    # после успешной правки, иначе следующая такая же правка была бы пропущена
+    sent = send_queue.edit_message_text(
+        ADMIN_GROUP_ID,
+        admin_message_id,
+        text,
+        parse_mode="HTML",
+        reply_markup=keyboard
+    )
+    sent.add_done_callback(lambda future: _remember_admin_message_text(future, admin_message_id, text))
+
+def _remember_admin_message_text(future, admin_message_id, text):
+    if not future.cancelled() and future.exception() is None:
+        _admin_message_texts.set(admin_message_id, text)
+
+def send_chunked(chat_id, records, header="", reply_markup=None, priority=PRIORITY_ADMIN):
+    """Поставить длинный HTML-текст в очередь несколькими сообщениями по границам записей.
+
+    records может быть генератором: первые части попадают в очередь, пока
+    остальные записи ещё рендерятся. Клавиатура прикрепляется к последнему
+    сообщению, его future и возвращается."""
+    previous = None
+    for chunk in iter_chunks(records, header):
+        if previous is not None:
+            send_queue.send_message(chat_id, previous, priority, parse_mode="HTML")
+        previous = chunk
+
+    if previous is not None:
+        return send_queue.send_message(chat_id, previous, priority, parse_mode="HTML", reply_markup=reply_markup)
+
+# Ответы в чат, откуда пришло сообщение или нажатие кнопки, тоже идут через
+# очередь: лимиты на чат и на бота действуют для всех исходящих сообщений,
+# а ответы и уведомления в один чат уходят по порядку. Future можно не ждать —
+# ошибку залогирует очередь; ждём, только когда нужно само сообщение.
+# callback.answer() сообщений в чат не шлёт и вызывается напрямую
+
+def send_answer(message, text, priority=PRIORITY_USER, **kwargs):
+    """Ответить в чат сообщения message через очередь отправки"""
+    return send_queue.send_message(message.chat.id, text, priority, **kwargs)
+
+def send_reply(message, text, priority=PRIORITY_USER, **kwargs):
+    """Ответить на сообщение message (с цитатой) через очередь отправки"""
+    return send_queue.send_message(
+        message.chat.id, text, priority, reply_to_message_id=message.message_id, **kwargs
+    )
+
+def send_edit(message, text, priority=PRIORITY_USER, **kwargs):
+    """Заменить текст сообщения message через очередь отправки"""
+    return send_queue.edit_message_text(message.chat.id, message.message_id, text, priority, **kwargs)
 
 # -------------------------------
 
-def get_main_menu(user_id):
+MENU_FILL_FORM = "📋 Заполнить анкету"
+MENU_MY_FORM = "📋 Моя анкета"
+MENU_EDIT_FORM = "✏️ Редактировать анкету"
+MENU_DELETE_FORM = "🗑 Удалить анкету"
+MENU_CONTACT_ADMIN = "📨 Связь с админом"
+
+async def get_main_menu(user_id):
     """Получить главное меню с учётом наличия анкеты"""
-    form = get_user_form(user_id)
+    form = await get_user_form(user_id)
     
     if form:
         keyboard = [
-            [KeyboardButton(text="📋 Моя анкета")],
-            [KeyboardButton(text="✏️ Редактировать анкету"), KeyboardButton(text="🗑 Удалить анкету")],
-            [KeyboardButton(text="📨 Связь с админом")]
+            [KeyboardButton(text=MENU_MY_FORM)],
+            [KeyboardButton(text=MENU_EDIT_FORM), KeyboardButton(text=MENU_DELETE_FORM)],
+            [KeyboardButton(text=MENU_CONTACT_ADMIN)]
         ]
     else:
         keyboard = [
-            [KeyboardButton(text="📋 Заполнить анкету")],
-            [KeyboardButton(text="📨 Связь с админом")]
+            [KeyboardButton(text=MENU_FILL_FORM)],
+            [KeyboardButton(text=MENU_CONTACT_ADMIN)]
         ]
     
     return ReplyKeyboardMarkup(resize_keyboard=True, keyboard=keyboard)
@@ -105,12 +231,8 @@ class FormState(StatesGroup):
     extra = State()
 
 class EditFormState(StatesGroup):
-    editing_name = State()
-    editing_tg_username = State()
-    editing_mc_nick = State()
-    editing_call_as = State()
-    editing_age = State()
-    editing_extra = State()
+    # Какое поле редактируется, лежит в данных состояния под ключом "field"
+    editing = State()
 
 class ContactAdmin(StatesGroup):
     waiting_for_message = State()
@@ -118,64 +240,85 @@ class ContactAdmin(StatesGroup):
 class AdminContact(StatesGroup):
     waiting_for_admin_message = State()
 
+# ------------------------------- АКТИВНОСТЬ -------------------------------
+
+# Раз в сколько секунд процесс записывает активность одного пользователя:
+# писать в базу на каждое сообщение незачем
+ACTIVITY_TOUCH_INTERVAL = 600
+_touched_users = TTLCache(maxsize=50000, ttl=ACTIVITY_TOUCH_INTERVAL)
+
+@dp.update.outer_middleware()
+async def track_activity(handler, update, data):
+    """Любое обновление от пользователя значит, что бот у него не заблокирован:
+    до обработчика снимаем пометку о блокировке и возвращаем анкету из архива"""
+    user = data.get("event_from_user")
+    if user and not user.is_bot and _touched_users.get(user.id, None) is None:
+        _touched_users.set(user.id, True)
+        try:
+            await touch_user(user.id)
+        except Exception as e:
+            _touched_users.pop(user.id)
+            logging.error(f"Не удалось отметить активность пользователя {user.id}: {e}")
+    return await handler(update, data)
+
 # -------------------------------
 
 @dp.message(Command("start"))
 async def start(message: types.Message):
     # Проверка на бан
-    if is_banned(message.from_user.id):
-        await message.answer("🚫 Вы заблокированы в этом боте.")
+    if await is_banned(message.from_user.id):
+        send_answer(message, "🚫 Вы заблокированы в этом боте.")
         return
-    
-    menu = get_main_menu(message.from_user.id)
-    await message.answer("👋 Привет! Я анкетолог.\n\nВыберите действие:", reply_markup=menu)
+
+    menu = await get_main_menu(message.from_user.id)
+    send_answer(message, "👋 Привет! Я анкетолог.\n\nВыберите действие:", reply_markup=menu)
 
 # ------------------------------- АНКЕТА -------------------------------
 
-@dp.message(lambda m: m.text == "📋 Заполнить анкету")
+@menu_buttons(MENU_FILL_FORM)
 async def form_start(message: types.Message, state: FSMContext):
     # Проверка на бан
-    if is_banned(message.from_user.id):
-        await message.answer("🚫 Вы заблокированы в этом боте.")
+    if await is_banned(message.from_user.id):
+        send_answer(message, "🚫 Вы заблокированы в этом боте.")
         return
     
     # Проверка, есть ли уже анкета
-    form = get_user_form(message.from_user.id)
+    form = await get_user_form(message.from_user.id)
     if form:
-        await message.answer("❗️ У вас уже есть анкета! Используйте кнопки для редактирования или удаления.")
+        send_answer(message, "❗️ У вас уже есть анкета! Используйте кнопки для редактирования или удаления.")
         return
     
-    await message.answer("📝 Начинаем заполнение анкеты!\n\n❓ <b>Как тебя зовут?</b>", parse_mode="HTML", reply_markup=ReplyKeyboardRemove())
+    send_answer(message, "📝 Начинаем заполнение анкеты!\n\n❓ <b>Как тебя зовут?</b>", parse_mode="HTML", reply_markup=ReplyKeyboardRemove())
     await state.set_state(FormState.name)
 
 @dp.message(FormState.name)
 async def form_name(message: types.Message, state: FSMContext):
     await state.update_data(name=message.text)
-    await message.answer("❓ <b>Твой Telegram username?</b>", parse_mode="HTML")
+    send_answer(message, "❓ <b>Твой Telegram username?</b>", parse_mode="HTML")
     await state.set_state(FormState.tg_username)
 
 @dp.message(FormState.tg_username)
 async def form_tg(message: types.Message, state: FSMContext):
     await state.update_data(tg_username=message.text)
-    await message.answer("❓ <b>Твой ник в Minecraft?</b>", parse_mode="HTML")
+    send_answer(message, "❓ <b>Твой ник в Minecraft?</b>", parse_mode="HTML")
     await state.set_state(FormState.mc_nick)
 
 @dp.message(FormState.mc_nick)
 async def form_mc(message: types.Message, state: FSMContext):
     await state.update_data(mc_nick=message.text)
-    await message.answer("❓ <b>Как к тебе обращаться?</b>", parse_mode="HTML")
+    send_answer(message, "❓ <b>Как к тебе обращаться?</b>", parse_mode="HTML")
     await state.set_state(FormState.call_as)
 
 @dp.message(FormState.call_as)
 async def form_call_as(message: types.Message, state: FSMContext):
     await state.update_data(call_as=message.text)
-    await message.answer("❓ <b>Сколько тебе лет?</b>", parse_mode="HTML")
+    send_answer(message, "❓ <b>Сколько тебе лет?</b>", parse_mode="HTML")
     await state.set_state(FormState.age)
 
 @dp.message(FormState.age)
 async def form_age(message: types.Message, state: FSMContext):
     await state.update_data(age=message.text)
-    await message.answer("❓ <b>Добавь что-то от себя (расскажи о себе):</b>", parse_mode="HTML")
+    send_answer(message, "❓ <b>Добавь что-то от себя (расскажи о себе):</b>", parse_mode="HTML")
     await state.set_state(FormState.extra)
 
 @dp.message(FormState.extra)
@@ -184,206 +327,96 @@ async def form_extra(message: types.Message, state: FSMContext):
     data["extra"] = message.text
     data["user_id"] = message.from_user.id
 
-    # Сначала сохраняем анкету без message_id
-    form_id = save_form(data)
-
-    # Уведомление в админ-группу
-    text = (
-        "📝 <b>Новая анкета!</b>\n\n"
-        f"<b>🆔 ID анкеты:</b> {form_id}\n"
-        f"<b>👤 Имя:</b> {data['name']}\n"
-        f"<b>📱 Telegram:</b> @{data['tg_username']}\n"
-        f"<b>🎮 Minecraft:</b> {data['mc_nick']}\n"
-        f"<b>💬 Обращение:</b> {data['call_as']}\n"
-        f"<b>🎂 Возраст:</b> {data['age']}\n"
-        f"<b>📝 Дополнительно:</b>\n{data['extra']}\n\n"
-        f"<i>🔑 User ID:</i> <code>{data['user_id']}</code>"
-    )
-
-    # Кнопки для админов
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [
-            InlineKeyboardButton(text="✅ Принять", callback_data=f"accept_{data['user_id']}_{form_id}"),
-            InlineKeyboardButton(text="❌ Отказать", callback_data=f"reject_{data['user_id']}_{form_id}")
-        ],
-        [
-            InlineKeyboardButton(text="💬 Связаться", callback_data=f"contact_{data['user_id']}"),
-            InlineKeyboardButton(text="🗑 Удалить", callback_data=f"delete_{form_id}_{data['user_id']}")
-        ]
-    ])
+    # Анкета и уведомление для админ-группы пишутся одной транзакцией,
+    # а отправит уведомление и сохранит ID сообщения form_outbox
+    await save_form(data)
+    form_outbox.wake()
 
-    # Отправляем сообщение в админ-группу
-    admin_msg = await bot.send_message(
-        ADMIN_GROUP_ID,
-        text,
-        parse_mode="HTML",
-        reply_markup=keyboard
-    )
-    
-    # Сохраняем ID сообщения в базу
-    update_admin_message_id(data['user_id'], admin_msg.message_id)
-
-    menu = get_main_menu(message.from_user.id)
-    await message.answer("✅ Анкета сохранена и отправлена на рассмотрение!", reply_markup=menu)
+    menu = await get_main_menu(message.from_user.id)
+    send_answer(message, "✅ Анкета сохранена и отправлена на рассмотрение!", reply_markup=menu)
     await state.clear()
 
 # ------------------------------- ПРОСМОТР АНКЕТЫ -------------------------------
 
-@dp.message(lambda m: m.text == "📋 Моя анкета")
+@menu_buttons(MENU_MY_FORM)
 async def show_my_form(message: types.Message):
-    form = get_user_form(message.from_user.id)
+    form = await get_user_form(message.from_user.id)
     
     if not form:
-        await message.answer("❌ У вас пока нет анкеты.")
+        send_answer(message, "❌ У вас пока нет анкеты.")
         return
     
-    # Проверяем количество полей и распаковываем соответственно
-    if len(form) == 13:  # Новая структура
-        form_id, user_id, name, tg_username, mc_nick, call_as, age, extra, status, created_at, edited_at, is_edited, admin_message_id = form
-    else:  # Старая структура (на случай если БД не пересоздана)
-        form_id, user_id, name, tg_username, mc_nick, call_as, age, extra, status = form[:9]
-        is_edited = 0
-    
-    status_emoji = {
-        'pending': '⏳ На рассмотрении',
-        'accepted': '✅ Одобрена',
-        'rejected': '❌ Отклонена'
-    }
-    
-    edited_mark = " ✏️ <i>(Отредактирована)</i>" if is_edited else ""
-    
-    text = (
-        f"📋 <b>Ваша анкета:</b>{edited_mark}\n\n"
-        f"<b>👤 Имя:</b> {name}\n"
-        f"<b>📱 Telegram:</b> @{tg_username}\n"
-        f"<b>🎮 Minecraft:</b> {mc_nick}\n"
-        f"<b>💬 Обращение:</b> {call_as}\n"
-        f"<b>🎂 Возраст:</b> {age}\n"
-        f"<b>📝 Дополнительно:</b>\n{extra}\n\n"
-        f"<b>📊 Статус:</b> {status_emoji.get(status, status)}"
-    )
-    
-    await message.answer(text, parse_mode="HTML")
+    send_answer(message, cards.user_card(form), parse_mode="HTML")
 
 # ------------------------------- РЕДАКТИРОВАНИЕ АНКЕТЫ -------------------------------
 
-@dp.message(lambda m: m.text == "✏️ Редактировать анкету")
+# Редактируемые поля анкеты: кнопка, вопрос и ответ после сохранения.
+# Клавиатура, выбор поля и сохранение строятся по этой таблице
+EDITABLE_FIELDS = {
+    "name": ("👤 Имя", "Введите новое имя:", "Имя обновлено!"),
+    "tg_username": ("📱 Telegram username", "Введите новый Telegram username:", "Telegram username обновлён!"),
+    "mc_nick": ("🎮 Minecraft ник", "Введите новый Minecraft ник:", "Minecraft ник обновлён!"),
+    "call_as": ("💬 Обращение", "Введите новое обращение:", "Обращение обновлено!"),
+    "age": ("🎂 Возраст", "Введите новый возраст:", "Возраст обновлён!"),
+    "extra": ("📝 Дополнительно", "Введите новую дополнительную информацию:", "Дополнительная информация обновлена!"),
+}
+
+@menu_buttons(MENU_EDIT_FORM)
 async def edit_form_menu(message: types.Message, state: FSMContext):
-    form = get_user_form(message.from_user.id)
+    form = await get_user_form(message.from_user.id)
     
     if not form:
-        await message.answer("❌ У вас пока нет анкеты для редактирования.")
+        send_answer(message, "❌ У вас пока нет анкеты для редактирования.")
         return
     
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="👤 Имя", callback_data="edit_name")],
-        [InlineKeyboardButton(text="📱 Telegram username", callback_data="edit_tg_username")],
-        [InlineKeyboardButton(text="🎮 Minecraft ник", callback_data="edit_mc_nick")],
-        [InlineKeyboardButton(text="💬 Обращение", callback_data="edit_call_as")],
-        [InlineKeyboardButton(text="🎂 Возраст", callback_data="edit_age")],
-        [InlineKeyboardButton(text="📝 Дополнительно", callback_data="edit_extra")],
+        *([InlineKeyboardButton(text=button, callback_data=f"edit_{field}")]
+          for field, (button, _, _) in EDITABLE_FIELDS.items()),
         [InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_edit")]
     ])
     
-    await message.answer("✏️ <b>Выберите, что хотите отредактировать:</b>", parse_mode="HTML", reply_markup=keyboard)
-
-@dp.callback_query(F.data == "edit_name")
-async def edit_name(callback: types.CallbackQuery, state: FSMContext):
-    await callback.message.edit_text("✏️ <b>Введите новое имя:</b>", parse_mode="HTML")
-    await state.set_state(EditFormState.editing_name)
-    await callback.answer()
-
-@dp.message(EditFormState.editing_name)
-async def save_edited_name(message: types.Message, state: FSMContext):
-    update_form_field(message.from_user.id, "name", message.text)
-    await update_admin_form_message(message.from_user.id)
-    menu = get_main_menu(message.from_user.id)
-    await message.answer("✅ <b>Имя обновлено!</b>", parse_mode="HTML", reply_markup=menu)
-    await state.clear()
-
-@dp.callback_query(F.data == "edit_tg_username")
-async def edit_tg(callback: types.CallbackQuery, state: FSMContext):
-    await callback.message.edit_text("✏️ <b>Введите новый Telegram username:</b>", parse_mode="HTML")
-    await state.set_state(EditFormState.editing_tg_username)
-    await callback.answer()
-
-@dp.message(EditFormState.editing_tg_username)
-async def save_edited_tg(message: types.Message, state: FSMContext):
-    update_form_field(message.from_user.id, "tg_username", message.text)
-    await update_admin_form_message(message.from_user.id)
-    menu = get_main_menu(message.from_user.id)
-    await message.answer("✅ <b>Telegram username обновлён!</b>", parse_mode="HTML", reply_markup=menu)
-    await state.clear()
-
-@dp.callback_query(F.data == "edit_mc_nick")
-async def edit_mc(callback: types.CallbackQuery, state: FSMContext):
-    await callback.message.edit_text("✏️ <b>Введите новый Minecraft ник:</b>", parse_mode="HTML")
-    await state.set_state(EditFormState.editing_mc_nick)
-    await callback.answer()
-
-@dp.message(EditFormState.editing_mc_nick)
-async def save_edited_mc(message: types.Message, state: FSMContext):
-    update_form_field(message.from_user.id, "mc_nick", message.text)
-    await update_admin_form_message(message.from_user.id)
-    menu = get_main_menu(message.from_user.id)
-    await message.answer("✅ <b>Minecraft ник обновлён!</b>", parse_mode="HTML", reply_markup=menu)
-    await state.clear()
-
-@dp.callback_query(F.data == "edit_call_as")
-async def edit_call(callback: types.CallbackQuery, state: FSMContext):
-    await callback.message.edit_text("✏️ <b>Введите новое обращение:</b>", parse_mode="HTML")
-    await state.set_state(EditFormState.editing_call_as)
-    await callback.answer()
+    send_answer(message, "✏️ <b>Выберите, что хотите отредактировать:</b>", parse_mode="HTML", reply_markup=keyboard)
 
-@dp.message(EditFormState.editing_call_as)
-async def save_edited_call(message: types.Message, state: FSMContext):
-    update_form_field(message.from_user.id, "call_as", message.text)
-    await update_admin_form_message(message.from_user.id)
-    menu = get_main_menu(message.from_user.id)
-    await message.answer("✅ <b>Обращение обновлено!</b>", parse_mode="HTML", reply_markup=menu)
-    await state.clear()
+@callbacks.prefix("edit_")
+async def edit_field(callback: types.CallbackQuery, state: FSMContext):
+    field = callback.data[len("edit_"):]
+    if field not in EDITABLE_FIELDS:
+        await callback.answer()
+        return
 
-@dp.callback_query(F.data == "edit_age")
-async def edit_age(callback: types.CallbackQuery, state: FSMContext):
-    await callback.message.edit_text("✏️ <b>Введите новый возраст:</b>", parse_mode="HTML")
-    await state.set_state(EditFormState.editing_age)
+    _, prompt, _ = EDITABLE_FIELDS[field]
+    send_edit(callback.message, f"✏️ <b>{prompt}</b>", parse_mode="HTML")
+    await state.set_state(EditFormState.editing)
+    await state.update_data(field=field)
     await callback.answer()
 
-@dp.message(EditFormState.editing_age)
-async def save_edited_age(message: types.Message, state: FSMContext):
-    update_form_field(message.from_user.id, "age", message.text)
-    await update_admin_form_message(message.from_user.id)
-    menu = get_main_menu(message.from_user.id)
-    await message.answer("✅ <b>Возраст обновлён!</b>", parse_mode="HTML", reply_markup=menu)
-    await state.clear()
-
-@dp.callback_query(F.data == "edit_extra")
-async def edit_extra(callback: types.CallbackQuery, state: FSMContext):
-    await callback.message.edit_text("✏️ <b>Введите новую дополнительную информацию:</b>", parse_mode="HTML")
-    await state.set_state(EditFormState.editing_extra)
-    await callback.answer()
+@dp.message(EditFormState.editing)
+async def save_edited_field(message: types.Message, state: FSMContext):
+    field = (await state.get_data()).get("field")
+    if field not in EDITABLE_FIELDS:
+        await state.clear()
+        return
 
-@dp.message(EditFormState.editing_extra)
-async def save_edited_extra(message: types.Message, state: FSMContext):
-    update_form_field(message.from_user.id, "extra", message.text)
+    _, _, done = EDITABLE_FIELDS[field]
+    await update_form_field(message.from_user.id, field, message.text)
     await update_admin_form_message(message.from_user.id)
-    menu = get_main_menu(message.from_user.id)
-    await message.answer("✅ <b>Дополнительная информация обновлена!</b>", parse_mode="HTML", reply_markup=menu)
+    menu = await get_main_menu(message.from_user.id)
+    send_answer(message, f"✅ <b>{done}</b>", parse_mode="HTML", reply_markup=menu)
     await state.clear()
 
-@dp.callback_query(F.data == "cancel_edit")
+@callbacks("cancel_edit")
 async def cancel_edit(callback: types.CallbackQuery):
-    await callback.message.edit_text("❌ Редактирование отменено.")
+    send_edit(callback.message, "❌ Редактирование отменено.")
     await callback.answer()
 
 # ------------------------------- УДАЛЕНИЕ АНКЕТЫ -------------------------------
 
-@dp.message(lambda m: m.text == "🗑 Удалить анкету")
+@menu_buttons(MENU_DELETE_FORM)
 async def delete_my_form(message: types.Message):
-    form = get_user_form(message.from_user.id)
+    form = await get_user_form(message.from_user.id)
     
     if not form:
-        await message.answer("❌ У вас нет анкеты для удаления.")
+        send_answer(message, "❌ У вас нет анкеты для удаления.")
         return
     
     # Создаём кнопки подтверждения
@@ -394,20 +427,20 @@ async def delete_my_form(message: types.Message):
         ]
     ])
     
-    await message.answer("⚠️ Вы уверены, что хотите удалить свою анкету?", reply_markup=keyboard)
+    send_answer(message, "⚠️ Вы уверены, что хотите удалить свою анкету?", reply_markup=keyboard)
 
-@dp.callback_query(F.data == "confirm_delete_my_form")
+@callbacks("confirm_delete_my_form")
 async def confirm_delete_my_form(callback: types.CallbackQuery):
-    delete_user_form(callback.from_user.id)
+    await delete_user_form(callback.from_user.id)
     
-    menu = get_main_menu(callback.from_user.id)
-    await callback.message.edit_text("✅ Ваша анкета удалена.")
-    await callback.message.answer("Вы можете заполнить новую анкету.", reply_markup=menu)
+    menu = await get_main_menu(callback.from_user.id)
+    send_edit(callback.message, "✅ Ваша анкета удалена.")
+    send_answer(callback.message, "Вы можете заполнить новую анкету.", reply_markup=menu)
     await callback.answer()
 
-@dp.callback_query(F.data == "cancel_delete")
+@callbacks("cancel_delete")
 async def cancel_delete(callback: types.CallbackQuery):
-    await callback.message.edit_text("❌ Удаление отменено.")
+    send_edit(callback.message, "❌ Удаление отменено.")
     await callback.answer()
 
 # ------------------------------- РАЗБАН ПОЛЬЗОВАТЕЛЯ -------------------------------
@@ -418,34 +451,52 @@ async def cmd_unban(message: types.Message):
     if message.chat.id != ADMIN_GROUP_ID:
         return
     if message.from_user.id not in ADMIN_IDS:
-        await message.reply("🚫 У вас нет прав на эту команду.")
+        send_reply(message, "🚫 У вас нет прав на эту команду.")
         return
 
     try:
         user_id = int(message.text.split()[1])
     except (IndexError, ValueError):
-        await message.reply("❌ Использование: /unban <user_id>\nПример: /unban 123456789")
+        send_reply(message, "❌ Использование: /unban <user_id>\nПример: /unban 123456789")
         return
 
-    if not is_banned(user_id):
-        await message.reply(f"Пользователь <code>{user_id}</code> не забанен.", parse_mode="HTML")
+    if not await is_banned(user_id):
+        send_reply(message, f"Пользователь <code>{user_id}</code> не забанен.", parse_mode="HTML")
         return
 
-    unban_user(user_id)
+    await unban_user(user_id)
 
-    try:
-        await bot.send_message(
-            user_id,
-            "✅ <b>Вы были разбанены!</b>\n\nТеперь вы снова можете пользоваться ботом.",
-            parse_mode="HTML"
-        )
-        await message.reply(f"✅ Пользователь <code>{user_id}</code> успешно разбанен и уведомлён.", parse_mode="HTML")
-    except:
-        await message.reply(f"✅ Разбанен <code>{user_id}</code>, но не удалось отправить уведомление (возможно, он заблокировал бота).", parse_mode="HTML")
+    sent = send_queue.send_message(
+        user_id,
+        "✅ <b>Вы были разбанены!</b>\n\nТеперь вы снова можете пользоваться ботом.",
+        parse_mode="HTML"
+    )
+    run_in_background(report_delivery(
+        sent,
+        ok_text=f"✅ Пользователь <code>{user_id}</code> успешно разбанен и уведомлён.",
+        fail_text=f"✅ Разбанен <code>{user_id}</code>, но не удалось отправить уведомление (возможно, он заблокировал бота).",
+        reply_to=message.message_id
+    ))
 
 # ------------------------------- ОБРАБОТКА КНОПОК ДЛЯ АДМИНОВ -------------------------------
 
-@dp.callback_query(F.data.startswith("accept_"))
+WELCOME_TEXT = (
+    "🎉 <b>Поздравляем!</b> 🎉\n\n"
+    "Ваша анкета была одобрена! Добро пожаловать в наше сообщество!\n\n"
+    "🎮 Желаем вам приятной игры и отличного общения!\n"
+    "🤝 Если возникнут вопросы - всегда рады помочь!\n\n"
+    f"👉 Присоединяйтесь по ссылке: {INVITE_LINK}"
+)
+
+REJECT_TEXT = (
+    "❌ <b>К сожалению, ваша анкета была отклонена.</b>\n\n"
+    "Доступ к боту ограничен."
+)
+
+ACCEPTED_MARK = "\n\n✅ <b>ПРИНЯТО</b>"
+REJECTED_MARK = "\n\n❌ <b>ОТКЛОНЕНО + БАН</b>"
+
+@callbacks.prefix("accept_")
 async def accept_application(callback: types.CallbackQuery):
     # Проверка, что команда из админ-группы
     if callback.message.chat.id != ADMIN_GROUP_ID:
@@ -457,32 +508,26 @@ async def accept_application(callback: types.CallbackQuery):
     form_id = int(parts[2])
 
     # Обновляем статус анкеты
-    update_form_status(user_id, 'accepted')
+    await update_form_status(user_id, 'accepted')
 
     # Красивое приветственное сообщение пользователю
-    welcome_text = (
-        "🎉 <b>Поздравляем!</b> 🎉\n\n"
-        "Ваша анкета была одобрена! Добро пожаловать в наше сообщество!\n\n"
-        "🎮 Желаем вам приятной игры и отличного общения!\n"
-        "🤝 Если возникнут вопросы - всегда рады помочь!\n\n"
-        f"👉 Присоединяйтесь по ссылке: {INVITE_LINK}"
-    )
+    sent = send_queue.send_message(user_id, WELCOME_TEXT, parse_mode="HTML")
+    run_in_background(report_delivery(
+        sent, fail_text=f"❌ Не удалось отправить приглашение пользователю <code>{user_id}</code>."
+    ))
 
-    try:
-        await bot.send_message(user_id, welcome_text, parse_mode="HTML")
-        
-        # Уведомление админу об успешной отправке
-        await callback.answer("✅ Приглашение отправлено!")
-        
-        # Обновляем сообщение в группе
-        await callback.message.edit_text(
-            callback.message.text + "\n\n✅ <b>ПРИНЯТО</b>",
-            parse_mode="HTML"
-        )
-    except Exception as e:
-        await callback.answer(f"❌ Ошибка: {e}", show_alert=True)
+    # Уведомление админу: приглашение поставлено в очередь
+    await callback.answer("✅ Приглашение отправлено!")
+
+    # Обновляем сообщение в группе
+    send_queue.edit_message_text(
+        ADMIN_GROUP_ID,
+        callback.message.message_id,
+        callback.message.html_text + ACCEPTED_MARK,
+        parse_mode="HTML"
+    )
 
-@dp.callback_query(F.data.startswith("reject_"))
+@callbacks.prefix("reject_")
 async def reject_application(callback: types.CallbackQuery):
     # Проверка, что команда из админ-группы
     if callback.message.chat.id != ADMIN_GROUP_ID:
@@ -494,29 +539,26 @@ async def reject_application(callback: types.CallbackQuery):
     form_id = int(parts[2])
 
     # Удаляем анкету и баним пользователя
-    delete_form(form_id)
-    ban_user(user_id)
+    await delete_form(form_id, rejected=True)
+    await ban_user(user_id)
 
     # Сообщение пользователю
-    reject_text = (
-        "❌ <b>К сожалению, ваша анкета была отклонена.</b>\n\n"
-        "Доступ к боту ограничен."
-    )
+    sent = send_queue.send_message(user_id, REJECT_TEXT, parse_mode="HTML")
+    run_in_background(report_delivery(
+        sent, fail_text=f"❌ Не удалось уведомить пользователя <code>{user_id}</code> об отказе."
+    ))
 
-    try:
-        await bot.send_message(user_id, reject_text, parse_mode="HTML")
-        
-        await callback.answer("❌ Анкета отклонена, пользователь забанен!")
-        
-        # Обновляем сообщение в группе
-        await callback.message.edit_text(
-            callback.message.text + "\n\n❌ <b>ОТКЛОНЕНО + БАН</b>",
-            parse_mode="HTML"
-        )
-    except Exception as e:
-        await callback.answer(f"❌ Ошибка: {e}", show_alert=True)
+    await callback.answer("❌ Анкета отклонена, пользователь забанен!")
+
+    # Обновляем сообщение в группе
+    send_queue.edit_message_text(
+        ADMIN_GROUP_ID,
+        callback.message.message_id,
+        callback.message.html_text + REJECTED_MARK,
+        parse_mode="HTML"
+    )
 
-@dp.callback_query(F.data.startswith("delete_"))
+@callbacks.prefix("delete_")
 async def delete_form_by_admin(callback: types.CallbackQuery):
     # Проверка, что команда из админ-группы
     if callback.message.chat.id != ADMIN_GROUP_ID:
@@ -527,7 +569,7 @@ async def delete_form_by_admin(callback: types.CallbackQuery):
     form_id = int(parts[1])
     user_id = int(parts[2])
     
-    delete_form(form_id)
+    await delete_form(form_id)
     
     # Уведомление пользователю
     delete_text = (
@@ -535,18 +577,18 @@ async def delete_form_by_admin(callback: types.CallbackQuery):
         "Вы можете заполнить новую анкету."
     )
     
-    try:
-        await bot.send_message(user_id, delete_text, parse_mode="HTML", reply_markup=get_main_menu(user_id))
-    except Exception as e:
-        logging.error(f"Не удалось отправить уведомление пользователю {user_id}: {e}")
+    # Ошибку отправки залогирует очередь
+    send_queue.send_message(user_id, delete_text, parse_mode="HTML", reply_markup=await get_main_menu(user_id))
     
     await callback.answer("🗑 Анкета удалена!")
-    await callback.message.edit_text(
-        callback.message.text + "\n\n🗑 <b>УДАЛЕНО АДМИНОМ</b>",
+    send_queue.edit_message_text(
+        ADMIN_GROUP_ID,
+        callback.message.message_id,
+        callback.message.html_text + "\n\n🗑 <b>УДАЛЕНО АДМИНОМ</b>",
         parse_mode="HTML"
     )
 
-@dp.callback_query(F.data.startswith("contact_"))
+@callbacks.prefix("contact_")
 async def contact_user(callback: types.CallbackQuery, state: FSMContext):
     # Проверка, что команда из админ-группы
     if callback.message.chat.id != ADMIN_GROUP_ID:
@@ -559,7 +601,8 @@ async def contact_user(callback: types.CallbackQuery, state: FSMContext):
     await state.update_data(target_user_id=user_id)
     await state.set_state(AdminContact.waiting_for_admin_message)
     
-    await callback.message.reply(
+    send_reply(
+        callback.message,
         f"✍️ Напишите сообщение для пользователя (ID: <code>{user_id}</code>):",
         parse_mode="HTML"
     )
@@ -579,90 +622,576 @@ async def send_admin_message(message: types.Message, state: FSMContext):
         f"{message.text}"
     )
 
-    try:
-        await bot.send_message(user_id, admin_text, parse_mode="HTML")
-        await message.reply("✅ Сообщение доставлено!")
-    except Exception as e:
-        await message.reply(f"❌ Ошибка при отправке: {e}")
+    sent = send_queue.send_message(user_id, admin_text, parse_mode="HTML")
+    run_in_background(report_delivery(
+        sent,
+        ok_text="✅ Сообщение доставлено!",
+        fail_text="❌ Ошибка при отправке:",
+        reply_to=message.message_id
+    ))
     
     await state.clear()
 
+# ------------------------------- МАССОВАЯ МОДЕРАЦИЯ -------------------------------
+
+# Как часто обновлять сообщение с прогрессом (секунды)
+BULK_PROGRESS_INTERVAL = 10
+
+def parse_form_ids(text):
+    """Достать ID анкет из аргументов команды: /accept 1,2,3 или /accept 1 2 3"""
+    args = text.split(maxsplit=1)[1:]
+    if not args:
+        return []
+    return sorted({int(part) for part in args[0].replace(",", " ").split()})
+
+async def run_bulk_notifications(forms, user_text, mark, progress_message_id, title):
+    """Разослать уведомления по итогам массовой модерации и показывать прогресс"""
+    futures = []
+    for form in forms:
+        futures.append(send_queue.send_message(form.user_id, user_text, PRIORITY_BULK, parse_mode="HTML"))
+        if form.admin_message_id:
+            send_queue.edit_message_text(
+                ADMIN_GROUP_ID,
+                form.admin_message_id,
+                cards.admin_card(form) + mark,
+                PRIORITY_BULK,
+                parse_mode="HTML"
+            )
+
+    total = len(futures)
+    delivered = failed = 0
+    last_report = time.monotonic()
+
+    for future in asyncio.as_completed(futures):
+        try:
+            await future
+            delivered += 1
+        except Exception:
+            failed += 1
+
+        if time.monotonic() - last_report >= BULK_PROGRESS_INTERVAL:
+            last_report = time.monotonic()
+            send_queue.edit_message_text(
+                ADMIN_GROUP_ID, progress_message_id,
+                f"⏳ {title}: уведомлено {delivered + failed} из {total}",
+                parse_mode="HTML"
+            )
+
+    send_queue.edit_message_text(
+        ADMIN_GROUP_ID, progress_message_id,
+        f"✅ {title}: {total} анкет.\n"
+        f"📨 Уведомлено: {delivered}, не доставлено: {failed}",
+        parse_mode="HTML"
+    )
+
+async def check_admin_command(message: types.Message):
+    """Команда пришла из админ-группы и от админа"""
+    if message.chat.id != ADMIN_GROUP_ID:
+        return False
+    if message.from_user.id not in ADMIN_IDS:
+        send_reply(message, "🚫 У вас нет прав на эту команду.")
+        return False
+    return True
+
+@dp.message(Command("accept_all_pending"))
+async def cmd_accept_all_pending(message: types.Message):
+    if not await check_admin_command(message):
+        return
+
+    forms = await accept_forms(None)
+    if not forms:
+        send_reply(message, "📭 Ожидающих анкет нет.")
+        return
+
+    progress = await send_reply(message, f"⏳ Принято анкет: {len(forms)}. Рассылаю уведомления...")
+    run_in_background(run_bulk_notifications(forms, WELCOME_TEXT, ACCEPTED_MARK, progress.message_id, "Принятие"))
+
+@dp.message(Command("accept"))
+async def cmd_accept(message: types.Message):
+    if not await check_admin_command(message):
+        return
+
+    try:
+        form_ids = parse_form_ids(message.text)
+    except ValueError:
+        form_ids = []
+    if not form_ids:
+        send_reply(message, "❌ Использование: /accept <id,id,...>\nПример: /accept 12,15,17")
+        return
+
+    forms = await accept_forms(form_ids)
+    if not forms:
+        send_reply(message, "📭 Среди указанных нет ожидающих анкет.")
+        return
+
+    skipped = len(form_ids) - len(forms)
+    progress = await send_reply(
+        message,
+        f"⏳ Принято анкет: {len(forms)} (пропущено: {skipped}). Рассылаю уведомления..."
+    )
+    run_in_background(run_bulk_notifications(forms, WELCOME_TEXT, ACCEPTED_MARK, progress.message_id, "Принятие"))
+
+@dp.message(Command("reject"))
+async def cmd_reject(message: types.Message):
+    if not await check_admin_command(message):
+        return
+
+    try:
+        form_ids = parse_form_ids(message.text)
+    except ValueError:
+        form_ids = []
+    if not form_ids:
+        send_reply(message, "❌ Использование: /reject <id,id,...>\nПример: /reject 12,15,17")
+        return
+
+    forms = await reject_forms(form_ids)
+    if not forms:
+        send_reply(message, "📭 Среди указанных нет ожидающих анкет.")
+        return
+
+    skipped = len(form_ids) - len(forms)
+    progress = await send_reply(
+        message,
+        f"⏳ Отклонено анкет: {len(forms)} (пропущено: {skipped}), авторы забанены. Рассылаю уведомления..."
+    )
+    run_in_background(run_bulk_notifications(forms, REJECT_TEXT, REJECTED_MARK, progress.message_id, "Отклонение"))
+
+# ------------------------------- РАССЫЛКА -------------------------------
+
+@dp.message(Command("broadcast"))
+async def cmd_broadcast(message: types.Message):
+    if not await check_admin_command(message):
+        return
+
+    # Берём HTML-текст, чтобы сохранить форматирование админа
+    parts = message.html_text.split(maxsplit=1)
+    if len(parts) < 2:
+        send_reply(message, "❌ Использование: /broadcast <текст>\nТекст получат все пользователи с принятой анкетой.")
+        return
+
+    progress = await send_reply(message, "📣 Готовлю рассылку...")
+    broadcast_id = await create_broadcast(parts[1], progress.message_id)
+    run_in_background(run_broadcast(broadcast_id, send_queue))
+
+@dp.message(Command("broadcast_cancel"))
+async def cmd_broadcast_cancel(message: types.Message):
+    if not await check_admin_command(message):
+        return
+
+    try:
+        broadcast_id = int(message.text.split()[1])
+    except (IndexError, ValueError):
+        send_reply(message, "❌ Использование: /broadcast_cancel <id рассылки>")
+        return
+
+    if await finish_broadcast(broadcast_id, "cancelled"):
+        send_reply(message, f"⛔️ Рассылка #{broadcast_id} будет остановлена после текущей пачки.")
+    else:
+        send_reply(message, f"Рассылка #{broadcast_id} не найдена или уже завершена.")
+
 # ------------------------------- КОМАНДА ПРОСМОТРА АНКЕТ -------------------------------
 
+FORMS_PAGE_SIZE = 5
+
+FORMS_STATUSES = ("pending", "accepted", "rejected")
+
+async def build_forms_page(status=None, edited_only=False, before_id=None, after_id=None):
+    """Собрать текст и клавиатуру одной страницы /forms"""
+    forms, has_newer, has_older = await get_forms_page(
+        FORMS_PAGE_SIZE, status=status, edited_only=edited_only,
+        before_id=before_id, after_id=after_id
+    )
+
+    if not forms:
+        return None, None
+
+    filters = []
+    if status:
+        filters.append(f"{cards.STATUS_EMOJI[status]} {status}")
+    if edited_only:
+        filters.append("✏️ только отредактированные")
+    filter_text = f" ({', '.join(filters)})" if filters else ""
+
+    response = f"📋 <b>Анкеты{filter_text}:</b>\n\n"
+
+    # Страница должна влезть в одно сообщение: лишние анкеты уйдут на следующую
+    shown = []
+    for form in forms:
+        block = cards.list_item(form)
+        if shown and message_length(response) + message_length(block) > TELEGRAM_MESSAGE_LIMIT:
+            has_older = True
+            break
+        response += block
+        shown.append(form)
+
+    if message_length(response) > TELEGRAM_MESSAGE_LIMIT:
+        response = split_html(response)[0]
+
+    # Фильтры кодируем прямо в callback_data, чтобы листать без состояния
+    suffix = f"{status or 'all'}_{int(edited_only)}"
+    buttons = []
+    if has_newer:
+        buttons.append(InlineKeyboardButton(text="◀️", callback_data=f"forms_newer_{shown[0].id}_{suffix}"))
+    if has_older:
+        buttons.append(InlineKeyboardButton(text="▶️", callback_data=f"forms_older_{shown[-1].id}_{suffix}"))
+
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+    return response, keyboard
+
+
 @dp.message(Command("forms"))
 async def show_all_forms(message: types.Message):
     # Проверка, что команда из админ-группы
     if message.chat.id != ADMIN_GROUP_ID:
         return
 
-    forms = get_all_forms()
+    # /forms [pending|accepted|rejected] [edited]
+    args = message.text.split()[1:]
+    status = next((arg for arg in args if arg in FORMS_STATUSES), None)
+    edited_only = "edited" in args
 
-    if not forms:
-        await message.reply("📭 Анкет пока нет.")
+    response, keyboard = await build_forms_page(status, edited_only)
+
+    if not response:
+        send_reply(message, "📭 Анкет пока нет.")
         return
 
-    response = "📋 <b>Все полученные анкеты:</b>\n\n"
-    
-    status_emoji = {
-        'pending': '⏳',
-        'accepted': '✅',
-        'rejected': '❌'
-    }
-    
+    send_reply(message, response, parse_mode="HTML", reply_markup=keyboard)
+
+@callbacks.prefix("forms_")
+async def forms_page(callback: types.CallbackQuery):
+    # Проверка, что команда из админ-группы
+    if callback.message.chat.id != ADMIN_GROUP_ID:
+        await callback.answer("Эта команда доступна только в админ-группе!")
+        return
+
+    _, direction, cursor, status, edited = callback.data.split("_")
+    cursor = int(cursor)
+    status = None if status == "all" else status
+    edited_only = edited == "1"
+
+    if direction == "older":
+        response, keyboard = await build_forms_page(status, edited_only, before_id=cursor)
+    else:
+        response, keyboard = await build_forms_page(status, edited_only, after_id=cursor)
+
+    if not response:
+        await callback.answer("📭 Больше анкет нет.")
+        return
+
+    send_edit(callback.message, response, parse_mode="HTML", reply_markup=keyboard)
+    await callback.answer()
+
+# ------------------------------- ПОИСК АНКЕТ -------------------------------
+
+SEARCH_HEADER = "🔎 Поиск: "
+
+
+def fit_search_page(header, forms):
+    """Карточки анкет с начала forms, которые помещаются в одно сообщение
+    после header (хотя бы одна)"""
+    length = message_length(header)
+    blocks = []
     for form in forms:
-        # Проверяем количество полей и распаковываем соответственно
-        if len(form) == 13:  # Новая структура
-            form_id, user_id, name, tg_username, mc_nick, call_as, age, extra, status, created_at, edited_at, is_edited, admin_message_id = form
-        else:  # Старая структура
-            form_id, user_id, name, tg_username, mc_nick, call_as, age, extra, status = form[:9]
-            is_edited = 0
-        
-        edited_mark = " ✏️" if is_edited else ""
-        
-        response += (
-            f"{status_emoji.get(status, '❓')}{edited_mark} <b>ID анкеты:</b> {form_id}\n"
-            f"<b>👤 Имя:</b> {name}\n"
-            f"<b>📱 Telegram:</b> @{tg_username}\n"
-            f"<b>🎮 Minecraft:</b> {mc_nick}\n"
-            f"<b>💬 Обращение:</b> {call_as}\n"
-            f"<b>🎂 Возраст:</b> {age}\n"
-            f"<b>📝 Дополнительно:</b> {extra}\n"
-            f"<b>🔑 User ID:</b> <code>{user_id}</code>\n"
-            f"<b>📊 Статус:</b> {status}\n"
-            f"{'-' * 30}\n\n"
+        block = cards.list_item(form)
+        length += message_length(block)
+        if blocks and length > TELEGRAM_MESSAGE_LIMIT:
+            break
+        blocks.append(block)
+    return blocks
+
+
+async def previous_search_offset(query, header, offset):
+    """Начало страницы, которая была перед страницей с offset.
+
+    Страницы нарезаются от первого результата, и длинные анкеты делают
+    их короче FORMS_PAGE_SIZE, поэтому границы восстанавливаются тем же
+    проходом, а не вычитанием размера страницы"""
+    forms, _ = await search_forms(query, offset, 0)
+    start = previous = 0
+    while start < min(offset, len(forms)):
+        previous = start
+        start += len(fit_search_page(header, forms[start:start + FORMS_PAGE_SIZE]))
+    return previous
+
+
+async def build_search_page(text, offset=0):
+    """Собрать текст и клавиатуру страницы результатов /search"""
+    query = make_search_query(text)
+    forms, has_more = await search_forms(query, FORMS_PAGE_SIZE, offset)
+    if not forms:
+        return None, None
+
+    header = f"<b>{SEARCH_HEADER}</b>{html.escape(text)}\n\n"
+    blocks = fit_search_page(header, forms)
+    if len(blocks) < len(forms):
+        has_more = True
+
+    response = header + "".join(blocks)
+    if message_length(response) > TELEGRAM_MESSAGE_LIMIT:
+        response = split_html(response)[0]
+
+    # Сам запрос в callback_data может не влезть (64 байта), поэтому при
+    # листании он берётся из первой строки сообщения, а в кнопке только смещение
+    buttons = []
+    if offset:
+        previous = await previous_search_offset(query, header, offset)
+        buttons.append(InlineKeyboardButton(text="◀️", callback_data=f"search_{previous}"))
+    if has_more:
+        buttons.append(InlineKeyboardButton(text="▶️", callback_data=f"search_{offset + len(blocks)}"))
+
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+    return response, keyboard
+
+
+@dp.message(Command("search"))
+async def cmd_search(message: types.Message):
+    if message.chat.id != ADMIN_GROUP_ID:
+        return
+
+    text = message.text.partition(" ")[2].strip()
+    if not make_search_query(text):
+        send_reply(
+            message,
+            f"❌ Использование: /search <запрос>\n"
+            f"Ищется по имени, username, нику, обращению и тексту «о себе». "
+            f"Каждое слово — от {SEARCH_MIN_LENGTH} символов."
         )
+        return
+
+    response, keyboard = await build_search_page(text)
+    if not response:
+        send_reply(message, "📭 Ничего не найдено.")
+        return
+
+    send_reply(message, response, parse_mode="HTML", reply_markup=keyboard)
+
+@callbacks.prefix("search_")
+async def search_page(callback: types.CallbackQuery):
+    if callback.message.chat.id != ADMIN_GROUP_ID:
+        await callback.answer("Эта команда доступна только в админ-группе!")
+        return
+
+    offset = int(callback.data.split("_")[1])
+    text = (callback.message.text or "").split("\n", 1)[0].removeprefix(SEARCH_HEADER)
+
+    response, keyboard = None, None
+    if make_search_query(text):
+        response, keyboard = await build_search_page(text, offset)
+    if not response:
+        await callback.answer("📭 Больше ничего не найдено.")
+        return
+
+    send_edit(callback.message, response, parse_mode="HTML", reply_markup=keyboard)
+    await callback.answer()
 
-    # Telegram имеет лимит на длину сообщения (4096 символов)
-    if len(response) > 4000:
-        # Разбиваем на несколько сообщений
-        parts = [response[i:i+4000] for i in range(0, len(response), 4000)]
-        for part in parts:
-            await message.reply(part, parse_mode="HTML")
+# ------------------------------- ИСТОРИЯ АНКЕТ -------------------------------
+
+@dp.message(Command("history"))
+async def cmd_history(message: types.Message):
+    if not await check_admin_command(message):
+        return
+
+    query = message.text.partition(" ")[2].strip()
+    if not query:
+        send_reply(message, "❌ Использование: /history <user_id | ник | @username>")
+        return
+
+    if query.isdigit():
+        forms = await get_form_history(user_id=int(query))
     else:
-        await message.reply(response, parse_mode="HTML")
+        forms = await get_form_history(handle=query)
+    if not forms:
+        send_reply(message, "📭 В архиве ничего не найдено.")
+        return
+
+    records = (cards.archive_item(form) for form in forms)
+    send_chunked(message.chat.id, records, header=f"🗄 <b>Архив анкет: {len(forms)}</b>\n\n")
+
+# ------------------------------- ВЫГРУЗКА АНКЕТ -------------------------------
+
+@dp.message(Command("export"))
+async def cmd_export(message: types.Message):
+    # Проверяем, что команда из админ-группы И от админа
+    if message.chat.id != ADMIN_GROUP_ID:
+        return
+    if message.from_user.id not in ADMIN_IDS:
+        send_reply(message, "🚫 У вас нет прав на эту команду.")
+        return
+
+    # /export gz — выгрузка в сжатом виде
+    compress = "gz" in message.text.split()[1:]
+    filename = "forms_export.csv.gz" if compress else "forms_export.csv"
+
+    status_msg = await send_reply(message, "⏳ Готовлю выгрузку...")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, filename)
+
+        # Файл пишется в отдельном потоке и своим соединением с базой
+        count = await asyncio.to_thread(export_to_csv, path, compress)
+
+        if not count:
+            send_edit(status_msg, "📭 Анкет пока нет.")
+            return
+
+        # Ждём отправки: после выхода из with файла уже не будет
+        await send_queue.submit(
+            "send_document",
+            ADMIN_GROUP_ID,
+            PRIORITY_ADMIN,
+            document=FSInputFile(path, filename=filename),
+            caption=f"📦 Выгрузка анкет: {count} шт."
+        )
+
+    send_queue.submit("delete_message", status_msg.chat.id, message_id=status_msg.message_id)
+
+# ------------------------------- СТАТИСТИКА -------------------------------
+
+# Сколько последних дней показывать в /stats и ширина столбика гистограммы
+STATS_DAYS = 14
+STATS_BAR_WIDTH = 12
+
+
+def format_duration(seconds):
+    """Длительность по-человечески: «2 ч 15 мин», «3 д 4 ч»"""
+    minutes = int(seconds // 60)
+    if minutes < 60:
+        return f"{minutes} мин"
+    hours, minutes = divmod(minutes, 60)
+    if hours < 24:
+        return f"{hours} ч {minutes} мин"
+    days, hours = divmod(hours, 24)
+    return f"{days} д {hours} ч"
+
+
+def average_turnaround(rows):
+    moderated = sum(row["moderated"] for row in rows)
+    if not moderated:
+        return "—"
+    return format_duration(sum(row["moderation_seconds"] for row in rows) / moderated)
+
+
+@dp.message(Command("stats"))
+async def cmd_stats(message: types.Message):
+    if not await check_admin_command(message):
+        return
+
+    totals, banned, daily = await get_stats(STATS_DAYS)
+    # Дни без анкет и решений в таблице отсутствуют, поэтому неделю отсекаем по дате
+    week_ago = (datetime.now(timezone.utc) - timedelta(days=7)).strftime("%Y-%m-%d")
+    week = [row for row in daily if row["day"] > week_ago]
+
+    text = (
+        "📊 <b>Статистика анкет</b>\n\n"
+        f"⏳ На рассмотрении: {totals.get('pending', 0)}\n"
+        f"✅ Одобрено: {totals.get('accepted', 0)} "
+        f"(и ещё {totals.get('archived_idle', 0)} в архиве — давно не заходили)\n"
+        f"❌ Отклонено за всё время: {totals.get('rejected_total', 0)}\n"
+        f"✏️ Отредактировано: {totals.get('edited', 0)}\n"
+        f"🚫 Забанено: {banned}\n\n"
+        f"⏱ Среднее время рассмотрения: за 7 дней — {average_turnaround(week)}, "
+        f"за {STATS_DAYS} дней — {average_turnaround(daily)}\n"
+    )
+
+    if daily:
+        peak = max(row["submitted"] for row in daily) or 1
+        lines = []
+        for row in daily:
+            bar = "█" * round(row["submitted"] / peak * STATS_BAR_WIDTH)
+            day = f"{row['day'][8:10]}.{row['day'][5:7]}"
+            lines.append(
+                f"{day} {bar:<{STATS_BAR_WIDTH}} {row['submitted']:>4}  ✅{row['accepted']} ❌{row['rejected']}"
+            )
+        text += "\n📅 <b>Анкеты по дням (UTC)</b>\n<pre>" + "\n".join(lines) + "</pre>"
+
+    send_reply(message, text, parse_mode="HTML")
+
+# ------------------------------- МЕТРИКИ -------------------------------
+
+metrics.setup(dp, bot)
+metrics.registry.collect("bot_send_queue_total", lambda: send_queue.stats, kind="counter")
+metrics.registry.collect("bot_send_queue_size", send_queue.qsize)
+metrics.registry.collect("bot_outbox_total", lambda: form_outbox.stats, kind="counter")
+metrics.registry.collect("bot_archive_total", lambda: archive_job.stats, kind="counter")
+metrics.registry.collect("bot_fsm_storage_total", lambda: fsm_storage.stats, kind="counter")
+metrics.registry.collect("bot_admin_edits_total", get_admin_edit_stats, kind="counter")
+metrics.registry.collect("bot_form_cache", get_form_cache_stats)
+metrics.registry.collect("bot_ban_cache", get_ban_cache_stats)
+
+_metrics_runner = None
+
+METRICS_TOP = 10
+
+
+def render_latency_rows(name, label, top=METRICS_TOP):
+    """Строки «имя: вызовы, среднее, p95» для самых затратных серий гистограммы"""
+    series = metrics.registry.histograms(name)
+    rows = sorted(series.items(), key=lambda item: item[1][1], reverse=True)[:top]
+    lines = []
+    for labels, (count, total, p95) in rows:
+        title = html.escape(str(dict(labels).get(label, "?")))
+        lines.append(f"<code>{title}</code>: {count} шт, ср. {total / count * 1000:.1f} мс, p95 ≤ {p95 * 1000:g} мс\n")
+    return lines
+
+
+@dp.message(Command("metrics"))
+async def cmd_metrics(message: types.Message):
+    if not await check_admin_command(message):
+        return
+
+    handler_errors = metrics.registry.counters("bot_handler_errors_total")
+    api_errors = metrics.registry.counters("bot_telegram_errors_total")
+
+    records = ["\n<b>⚙️ Обработчики</b>\n", *render_latency_rows("bot_handler_seconds", "handler")]
+    if handler_errors:
+        records.append("Ошибки: " + ", ".join(
+            f"{html.escape(dict(labels)['handler'])} — {count}" for labels, count in handler_errors.items()
+        ) + "\n")
+    records += ["\n<b>🗄 База данных</b>\n", *render_latency_rows("bot_db_seconds", "function")]
+    records += ["\n<b>📡 Bot API</b>\n", *render_latency_rows("bot_telegram_request_seconds", "method")]
+    if api_errors:
+        records.append("Ошибки: " + ", ".join(
+            f"{html.escape(dict(labels)['method'])} — {count}" for labels, count in api_errors.items()
+        ) + "\n")
+
+    stats = send_queue.stats
+    records.append(
+        f"\n<b>📨 Очередь отправки</b>\n"
+        f"Отправлено: {stats['sent']}, повторов: {stats['retries']}, "
+        f"ошибок: {stats['failed']}, в очереди: {send_queue.qsize()}\n"
+    )
+
+    send_chunked(message.chat.id, records, header="📊 <b>Метрики процесса</b>\n")
 
 # ------------------------------- СВЯЗЬ С АДМИНОМ -------------------------------
 
-@dp.message(lambda m: m.text == "📨 Связь с админом")
+@menu_buttons(MENU_CONTACT_ADMIN)
 async def contact_admin(message: types.Message, state: FSMContext):
     # Проверка на бан
-    if is_banned(message.from_user.id):
-        await message.answer("🚫 Вы заблокированы в этом боте.")
+    if await is_banned(message.from_user.id):
+        send_answer(message, "🚫 Вы заблокированы в этом боте.")
         return
     
-    await message.answer("✍️ <b>Напишите сообщение для администраторов:</b>", parse_mode="HTML", reply_markup=ReplyKeyboardRemove())
+    send_answer(message, "✍️ <b>Напишите сообщение для администраторов:</b>", parse_mode="HTML", reply_markup=ReplyKeyboardRemove())
     await state.set_state(ContactAdmin.waiting_for_message)
 
 @dp.message(ContactAdmin.waiting_for_message)
 async def contact_admin_send(message: types.Message, state: FSMContext):
+    if not message.text:
+        # Стикеры, фото и голосовые в админ-группу не пересылаем — остаёмся в ожидании текста
+        send_answer(message, "❌ Отправьте, пожалуйста, сообщение текстом.")
+        return
+
     user = message.from_user
+    username = f"@{html.escape(user.username)}" if user.username else "—"
 
-    text = (
+    header = (
         "📨 <b>Сообщение от пользователя</b>\n\n"
-        f"<b>От:</b> {user.full_name}\n"
-        f"<b>Username:</b> @{user.username}\n"
+        f"<b>От:</b> {html.escape(user.full_name)}\n"
+        f"<b>Username:</b> {username}\n"
         f"<b>ID:</b> <code>{user.id}</code>\n\n"
-        f"<b>Текст:</b>\n{message.text}"
+        f"<b>Текст:</b>\n"
     )
 
     # Добавляем кнопку "Ответить"
@@ -670,17 +1199,101 @@ async def contact_admin_send(message: types.Message, state: FSMContext):
         [InlineKeyboardButton(text="💬 Ответить", callback_data=f"contact_{user.id}")]
     ])
 
-    await bot.send_message(ADMIN_GROUP_ID, text, parse_mode="HTML", reply_markup=keyboard)
+    send_chunked(ADMIN_GROUP_ID, [html.escape(message.text)], header=header, reply_markup=keyboard)
 
-    menu = get_main_menu(message.from_user.id)
-    await message.answer("✅ <b>Сообщение отправлено администраторам!</b>", parse_mode="HTML", reply_markup=menu)
+    menu = await get_main_menu(message.from_user.id)
+    send_answer(message, "✅ <b>Сообщение отправлено администраторам!</b>", parse_mode="HTML", reply_markup=menu)
     await state.clear()
 
 # -------------------------------
 
+async def start_services(primary=True, metrics_port=METRICS_PORT):
+    global _metrics_runner
+    await init_db()
+    fsm_storage.start()
+    send_queue.start()
+
+    if metrics_port:
+        try:
+            _metrics_runner = await metrics.start_server(METRICS_HOST, metrics_port)
+        except OSError as e:
+            logging.error(f"Не удалось открыть порт метрик {metrics_port}: {e}")
+
+    # Фоновые рассылки, outbox и обслуживание базы работают только в одном процессе
+    if primary:
+        await form_outbox.start()
+        archive_job.start()
+
+        # Продолжаем рассылки, прерванные рестартом
+        for broadcast in await get_running_broadcasts():
+            logging.info(f"Продолжаю рассылку #{broadcast['id']}")
+            run_in_background(run_broadcast(broadcast["id"], send_queue))
+
+
+async def stop_services():
+    await form_outbox.stop()
+    await archive_job.stop()
+    await admin_edits.flush()
+    await send_queue.stop()
+    if _metrics_runner:
+        await _metrics_runner.cleanup()
+    await bot.session.close()
+    shutdown_db()
+
+
+def worker_main(index, queue):
+    """Точка входа процесса-воркера в режиме BOT_WORKERS > 1"""
+    ignore_stop_signals()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_worker(index, queue))
+
+
+async def run_worker(index, queue):
+    await start_services(primary=index == 0, metrics_port=METRICS_PORT and METRICS_PORT + 1 + index)
+    await dp.emit_startup(bot=bot, **dp.workflow_data)
+    feeder = UserOrderedFeeder(dp, bot)
+    try:
+        await feeder.consume(queue)
+    finally:
+        logging.info(f"Воркер {index} обработал обновлений: {feeder.processed}")
+        await dp.emit_shutdown(bot=bot, **dp.workflow_data)
+        await stop_services()
+
+
+async def run_receiver():
+    """Принимать обновления и раздавать их воркерам, не обрабатывая самим"""
+    # Миграции применяем до запуска воркеров, чтобы они не делали это наперегонки
+    await init_db()
+    pool = WorkerPool(worker_main, BOT_WORKERS)
+    pool.start()
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(dp, bot, partial(RoutingRequestHandler, route=pool.route))
+        else:
+            await bot.delete_webhook()
+            await poll_updates(dp, bot, pool.route)
+    finally:
+        await pool.stop()
+        logging.info(f"Обновлений роздано по воркерам: {pool.routed}")
+        await bot.session.close()
+        shutdown_db()
+
+
 async def main():
-    init_db()
-    await dp.start_polling(bot)
+    if BOT_WORKERS > 1:
+        await run_receiver()
+        return
+
+    await start_services()
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            # Если раньше бот работал через вебхук, getUpdates без этого не заработает
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
+    finally:
+        await stop_services()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
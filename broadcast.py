@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import time
+
+from aiogram.exceptions import TelegramForbiddenError
+
+from async_db import get_broadcast, get_broadcast_recipients, save_broadcast_checkpoint, finish_broadcast
+from config import ADMIN_GROUP_ID
+from sender import PRIORITY_BULK, PRIORITY_ADMIN
+
+# Размер пачки между контрольными точками: после рестарта
+# повторно может уйти не больше одной пачки
+BROADCAST_BATCH_SIZE = 30
+
+# Как часто обновлять сообщение с прогрессом (секунды)
+BROADCAST_PROGRESS_INTERVAL = 10
+
+
+def _format_eta(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours} ч {minutes} мин"
+    if minutes:
+        return f"{minutes} мин {seconds} с"
+    return f"{seconds} с"
+
+
+def _progress_text(broadcast, done, rate):
+    total = broadcast["total"]
+    text = f"📣 <b>Рассылка #{broadcast['id']}</b>: {done} из {total}"
+    if rate > 0 and done < total:
+        text += f"\n⏱ Осталось примерно {_format_eta((total - done) / rate)}"
+    return text
+
+
+async def run_broadcast(broadcast_id, send_queue):
+    """Разослать рассылку, сохраняя прогресс после каждой пачки.
+
+    Если процесс перезапустится, повторный вызов продолжит с последней
+    контрольной точки, а не с начала."""
+    broadcast = await get_broadcast(broadcast_id)
+    if not broadcast or broadcast["status"] != "running":
+        return
+
+    last_user_id = broadcast["last_user_id"]
+    done = broadcast["sent"] + broadcast["failed"]
+    started_at = time.monotonic()
+    done_at_start = done
+    last_report = 0.0
+
+    while True:
+        # Отмена через /broadcast_cancel проверяется между пачками
+        broadcast = await get_broadcast(broadcast_id)
+        if broadcast["status"] != "running":
+            break
+
+        recipients = await get_broadcast_recipients(last_user_id, BROADCAST_BATCH_SIZE)
+        if not recipients:
+            await finish_broadcast(broadcast_id)
+            break
+
+        futures = [
+            send_queue.send_message(user_id, broadcast["text"], PRIORITY_BULK, parse_mode="HTML")
+            for user_id in recipients
+        ]
+        results = await asyncio.gather(*futures, return_exceptions=True)
+
+        sent = failed = 0
+        blocked = []
+        for user_id, result in zip(recipients, results):
+            if isinstance(result, Exception):
+                failed += 1
+                if isinstance(result, TelegramForbiddenError):
+                    blocked.append(user_id)
+            else:
+                sent += 1
+
+        last_user_id = recipients[-1]
+        await save_broadcast_checkpoint(broadcast_id, last_user_id, sent, failed, blocked)
+        done += sent + failed
+
+        if broadcast["progress_message_id"] and time.monotonic() - last_report >= BROADCAST_PROGRESS_INTERVAL:
+            last_report = time.monotonic()
+            rate = (done - done_at_start) / max(last_report - started_at, 1e-6)
+            send_queue.edit_message_text(
+                ADMIN_GROUP_ID, broadcast["progress_message_id"],
+                _progress_text(broadcast, done, rate), PRIORITY_ADMIN,
+                parse_mode="HTML"
+            )
+
+    broadcast = await get_broadcast(broadcast_id)
+    logging.info(f"Рассылка #{broadcast_id} завершена со статусом {broadcast['status']}")
+
+    if broadcast["progress_message_id"]:
+        status = "✅ завершена" if broadcast["status"] == "done" else "⛔️ отменена"
+        send_queue.edit_message_text(
+            ADMIN_GROUP_ID, broadcast["progress_message_id"],
+            f"📣 <b>Рассылка #{broadcast_id}</b> {status}\n"
+            f"📨 Доставлено: {broadcast['sent']}, не доставлено: {broadcast['failed']}",
+            PRIORITY_ADMIN,
+            parse_mode="HTML"
+        )
\ No newline at end of file
@@ -0,0 +1,120 @@
+import html
+import json
+
+# Тексты анкет для админ-группы и пользователя — единственное место, где они
+# собираются. Шаблоны — f-строки, которые Python компилирует один раз вместе
+# с модулем; пользовательские поля экранируются в _escaped, так что
+# ни одна карточка не уйдёт с неэкранированным вводом.
+
+STATUS_EMOJI = {
+    'pending': '⏳',
+    'accepted': '✅',
+    'rejected': '❌'
+}
+
+STATUS_TEXT = {
+    'pending': '⏳ На рассмотрении',
+    'accepted': '✅ Одобрена',
+    'rejected': '❌ Отклонена'
+}
+
+# Почему анкета оказалась в архиве
+ARCHIVE_REASONS = {
+    "deleted": "🗑 Удалена",
+    "rejected": "❌ Отклонена",
+    "inactive": "💤 Пользователь заблокировал бота",
+    "idle": "💤 Пользователь давно не заходил",
+}
+
+# Подписи полей в предупреждении о дублях на карточке
+DUPLICATE_LABELS = {"mc_nick": "🎮 Minecraft", "tg_username": "📱 Telegram"}
+
+# Сколько символов «о себе» показывать в списках и чем разделять анкеты
+LIST_EXTRA_LIMIT = 300
+LIST_SEPARATOR = "-" * 30 + "\n\n"
+
+EDITED_MARK = " ✏️ <i>(Отредактирована)</i>"
+
+
+def _escaped(form, extra_limit=None):
+    """Пользовательские поля анкеты, экранированные для HTML:
+    (name, tg_username, mc_nick, call_as, age, extra)"""
+    extra = form.extra or ""
+    if extra_limit and len(extra) > extra_limit:
+        # Обрезаем до экранирования, чтобы не разрезать &amp; и т.п.
+        extra = extra[:extra_limit] + "…"
+    return (
+        html.escape(form.name or "", quote=False),
+        html.escape(form.tg_username or "", quote=False),
+        html.escape(form.mc_nick or "", quote=False),
+        html.escape(form.call_as or "", quote=False),
+        "" if form.age is None else html.escape(str(form.age), quote=False),
+        html.escape(extra, quote=False),
+    )
+
+
+def duplicates(form):
+    """Предупреждение о том, что ник или username уже есть в других анкетах"""
+    if not form.duplicates:
+        return ""
+    parts = [
+        f"{DUPLICATE_LABELS[field]} — " + ", ".join(f"#{form_id}" for form_id in form_ids)
+        for field, form_ids in json.loads(form.duplicates).items()
+    ]
+    return "\n\n⚠️ <b>Возможный дубль:</b>\n" + "\n".join(parts)
+
+
+def admin_card(form):
+    """Карточка анкеты для админ-группы"""
+    name, tg_username, mc_nick, call_as, age, extra = _escaped(form)
+    return (
+        f"📝 <b>Новая анкета!</b>{EDITED_MARK if form.is_edited else ''}\n\n"
+        f"<b>🆔 ID анкеты:</b> {form.id}\n"
+        f"<b>👤 Имя:</b> {name}\n"
+        f"<b>📱 Telegram:</b> @{tg_username}\n"
+        f"<b>🎮 Minecraft:</b> {mc_nick}\n"
+        f"<b>💬 Обращение:</b> {call_as}\n"
+        f"<b>🎂 Возраст:</b> {age}\n"
+        f"<b>📝 Дополнительно:</b>\n{extra}\n\n"
+        f"<i>🔑 User ID:</i> <code>{form.user_id}</code>"
+        f"{duplicates(form)}"
+    )
+
+
+def user_card(form):
+    """Анкета глазами её автора"""
+    name, tg_username, mc_nick, call_as, age, extra = _escaped(form)
+    status = STATUS_TEXT.get(form.status) or html.escape(str(form.status), quote=False)
+    return (
+        f"📋 <b>Ваша анкета:</b>{EDITED_MARK if form.is_edited else ''}\n\n"
+        f"<b>👤 Имя:</b> {name}\n"
+        f"<b>📱 Telegram:</b> @{tg_username}\n"
+        f"<b>🎮 Minecraft:</b> {mc_nick}\n"
+        f"<b>💬 Обращение:</b> {call_as}\n"
+        f"<b>🎂 Возраст:</b> {age}\n"
+        f"<b>📝 Дополнительно:</b>\n{extra}\n\n"
+        f"<b>📊 Статус:</b> {status}"
+    )
+
+
+def list_item(form):
+    """Краткая карточка анкеты для списков в админ-группе"""
+    name, tg_username, mc_nick, call_as, age, extra = _escaped(form, LIST_EXTRA_LIMIT)
+    return (
+        f"{STATUS_EMOJI.get(form.status, '❓')}{' ✏️' if form.is_edited else ''} <b>ID анкеты:</b> {form.id}\n"
+        f"<b>👤 Имя:</b> {name}\n"
+        f"<b>📱 Telegram:</b> @{tg_username}\n"
+        f"<b>🎮 Minecraft:</b> {mc_nick}\n"
+        f"<b>💬 Обращение:</b> {call_as}\n"
+        f"<b>🎂 Возраст:</b> {age}\n"
+        f"<b>📝 Дополнительно:</b> {extra}\n"
+        f"<b>🔑 User ID:</b> <code>{form.user_id}</code>\n"
+        f"<b>📊 Статус:</b> {html.escape(str(form.status), quote=False)}\n"
+        f"{LIST_SEPARATOR}"
+    )
+
+
+def archive_item(form):
+    """Архивная анкета (models.ArchivedForm): причина, дата и краткая карточка"""
+    reason = ARCHIVE_REASONS.get(form.reason) or html.escape(str(form.reason), quote=False)
+    return f"<b>{reason}</b> · {form.archived_at} UTC\n" + list_item(form)
@@ -0,0 +1,54 @@
+import os
+import re
+import sys
+
+# Проверка нарезки длинных HTML-сообщений (html_chunks.split_html): каждая
+# часть укладывается в лимит и не пустая, а весь текст и все сущности
+# доходят до пользователя — без тегов части складываются в исходный текст.
+#
+#   python check_html_chunks.py
+
+# (что проверяем, текст, лимит)
+CASES = [
+    ("простой текст", "a" * 120, 50),
+    ("перевод строки как место разреза", ("строка\n" * 30), 50),
+    ("тег через границу части", "<b>" + "x" * 60 + "</b>", 20),
+    ("вложенные теги", "<b><i>" + "слово " * 40 + "</i></b>", 60),
+    ("сущности не разрезаются", "&amp;" * 40, 30),
+    # Часть из одних сущностей раньше выбрасывалась как пустая
+    ("часть из одних сущностей", "a" * 45 + "&lt;" * 30 + "b" * 10, 50),
+    ("экранированный ввод", "&lt;" * 100 + " &amp; " + "&gt;" * 100, 64),
+    ("символы вне BMP", "😀" * 80, 50),
+]
+
+_TAGS_RE = re.compile(r"<[^>]+>")
+
+
+def _problems(text, limit, parts):
+    from html_chunks import message_length
+
+    problems = []
+    if any(message_length(part) > limit for part in parts):
+        problems.append("часть длиннее лимита")
+    if any(not _TAGS_RE.sub("", part).strip() for part in parts):
+        problems.append("пустая часть")
+    if "".join(_TAGS_RE.sub("", part) for part in parts) != _TAGS_RE.sub("", text):
+        problems.append("текст потерян или искажён")
+    return problems
+
+
+def main():
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from html_chunks import split_html
+
+    failed = 0
+    for title, text, limit in CASES:
+        problems = _problems(text, limit, split_html(text, limit))
+        print(f"{'ПРОВАЛ' if problems else 'OK':6} {title}" + (f": {', '.join(problems)}" if problems else ""))
+        failed += bool(problems)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import argparse
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+
+# Проверка планов запросов: частые запросы к forms должны идти по индексам
+# из migrations.py, а не полным проходом по таблице и не через временную
+# сортировку. База временная, наполнена похоже на рабочую; планы проверяются
+# до ANALYZE и после него, как базу оставляет обслуживание в archive.py.
+#
+#   python check_query_plans.py
+#   python check_query_plans.py --forms 100000 --verbose
+
+# (что проверяем, запрос, параметры, индекс, который должен быть в плане)
+CHECKS = [
+    (
+        "последняя анкета пользователя (get_user_form, update_form_field)",
+        "SELECT * FROM forms WHERE user_id = ? ORDER BY id DESC LIMIT 1",
+        (42,), "idx_forms_user_id",
+    ),
+    (
+        "ID сообщения в админ-группе (get_admin_message_id)",
+        "SELECT admin_message_id FROM forms WHERE user_id = ? ORDER BY id DESC LIMIT 1",
+        (42,), "idx_forms_user_id",
+    ),
+    (
+        "правка ID сообщения (update_admin_message_id)",
+        "UPDATE forms SET admin_message_id = ? WHERE user_id = ? "
+        "AND id = (SELECT id FROM forms WHERE user_id = ? ORDER BY id DESC LIMIT 1)",
+        (1, 42, 42), "idx_forms_user_id",
+    ),
+    (
+        "удаление анкет пользователя (delete_user_form)",
+        "DELETE FROM forms WHERE user_id = ?",
+        (42,), "idx_forms_user_id",
+    ),
+    (
+        "смена статуса анкет пользователя (update_form_status)",
+        "UPDATE forms SET status = ? WHERE user_id = ?",
+        ("accepted", 42), "idx_forms_user_id",
+    ),
+    (
+        "все ожидающие анкеты (accept_forms без списка)",
+        "SELECT * FROM forms WHERE status = 'pending' ORDER BY id",
+        (), "idx_forms_status",
+    ),
+    (
+        "страница /forms с фильтром по статусу (get_forms_page)",
+        "SELECT * FROM forms WHERE status = ? AND id < ? ORDER BY id DESC LIMIT ?",
+        ("pending", 10 ** 9, 11), "idx_forms_status",
+    ),
+    # Обслуживание идёт от небольшого набора ушедших пользователей,
+    # а не от всех одобренных анкет
+    (
+        "анкеты заблокировавших бота (archive_inactive_forms)",
+        "SELECT f.id, f.user_id FROM blocked_users b "
+        "CROSS JOIN forms f ON f.user_id = b.user_id "
+        "WHERE b.blocked_at < datetime('now', ?) AND f.status = 'accepted' LIMIT ?",
+        ("-30 days", 500), "idx_blocked_users_blocked_at",
+    ),
+    (
+        "анкеты давно не заходивших (archive_idle_forms)",
+        "SELECT f.id, f.user_id FROM user_activity a "
+        "CROSS JOIN forms f ON f.user_id = a.user_id "
+        "WHERE a.seen_at < datetime('now', ?) AND f.status = 'accepted' LIMIT ?",
+        ("-90 days", 500), "idx_user_activity_seen_at",
+    ),
+]
+
+
+def _fill(conn, forms, users):
+    """Наполнить forms: у части пользователей по нескольку анкет,
+    большинство одобрено, ожидающих и отклонённых мало. Заодно
+    активность пользователей и тех, кто заблокировал бота"""
+    statuses = ["accepted"] * 90 + ["pending"] * 7 + ["rejected"] * 3
+    rows = (
+        (random.randrange(users), f"Игрок {index}", f"user{index}", f"mc_{index}", "Игрок",
+         random.choice(statuses), f"2024-01-01 00:00:{index % 60:02d}")
+        for index in range(forms)
+    )
+    with conn:
+        conn.executemany(
+            "INSERT INTO forms (user_id, name, tg_username, mc_nick, call_as, age, extra, status, created_at) "
+            "VALUES (?, ?, ?, ?, ?, 20, 'План запросов', ?, ?)",
+            rows
+        )
+        # Заходят почти все, бота заблокировали немногие
+        conn.executemany(
+            "INSERT INTO user_activity (user_id, seen_at) VALUES (?, datetime('now', ?))",
+            ((user_id, f"-{random.randrange(120)} days") for user_id in range(users))
+        )
+        conn.executemany(
+            "INSERT INTO blocked_users (user_id, blocked_at) VALUES (?, datetime('now', ?))",
+            ((user_id, f"-{random.randrange(60)} days") for user_id in random.sample(range(users), users // 50))
+        )
+
+
+def _plan(conn, sql, params):
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def _problems(plan, index):
+    problems = []
+    if not any(index in step for step in plan):
+        problems.append(f"не используется {index}")
+    for step in plan:
+        if re.match(r"SCAN (forms|f)\b", step) and "INDEX" not in step:
+            problems.append("полный проход по forms")
+        if "TEMP B-TREE" in step:
+            problems.append("временная сортировка")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка планов частых запросов к forms")
+    parser.add_argument("--forms", type=int, default=20000, help="сколько анкет в тестовой базе")
+    parser.add_argument("--users", type=int, default=15000, help="сколько разных пользователей")
+    parser.add_argument("--verbose", action="store_true", help="печатать планы целиком")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    workdir = tempfile.mkdtemp(prefix="anketolog-plans-")
+    os.chdir(workdir)
+    failed = 0
+    try:
+        import database
+
+        database.init_db()
+        conn = database.get_connection()
+        _fill(conn, args.forms, args.users)
+
+        # Планы должны быть верными и на свежей базе, где ANALYZE ещё
+        # не запускался, и после обслуживания со статистикой
+        for stage in ("без статистики", "после ANALYZE"):
+            if stage == "после ANALYZE":
+                conn.execute("ANALYZE")
+            print(f"-- {stage}")
+            for title, sql, params, index in CHECKS:
+                plan = _plan(conn, sql, params)
+                problems = _problems(plan, index)
+                print(f"{'ПРОВАЛ' if problems else 'OK':6} {title}" + (f": {', '.join(problems)}" if problems else ""))
+                if problems or args.verbose:
+                    for step in plan:
+                        print(f"         {step}")
+                failed += bool(problems)
+        database.close_connection()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
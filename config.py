@@ -4,4 +4,31 @@ ADMIN_GROUP_ID = -4995334292
 
 INVITE_LINK = "https://t.me/+your_invite_link_here"
 
-ADMIN_IDS = [5286025409, 1460861716, 6602555814]
\ No newline at end of file
+ADMIN_IDS = [5286025409, 1460861716, 6602555814]
+
+# Сколько секунд копить правки анкеты перед обновлением сообщения в админ-группе
+ADMIN_EDIT_DEBOUNCE = 3
+
+# Режим получения обновлений: "polling" или "webhook"
+BOT_MODE = "polling"
+
+# Публичный адрес, на который Telegram шлёт обновления (без пути).
+# Пустой — вебхук у Telegram не регистрируется, сервер просто слушает порт
+# (удобно для локальной проверки POST-запросами)
+WEBHOOK_URL = ""
+WEBHOOK_PATH = "/webhook"
+WEBHOOK_HOST = "0.0.0.0"
+WEBHOOK_PORT = 8080
+
+# Секрет из заголовка X-Telegram-Bot-Api-Secret-Token.
+# Если пустой, а WEBHOOK_URL задан, при каждом запуске генерируется случайный
+WEBHOOK_SECRET = ""
+
+# Сколько процессов обрабатывают обновления. При значении больше 1 главный
+# процесс только принимает обновления и раздаёт их воркерам по user_id
+BOT_WORKERS = 1
+
+# Адрес HTTP-эндпоинта /metrics в формате Prometheus; порт 0 — не поднимать.
+# В режиме воркеров воркер N слушает METRICS_PORT + 1 + N
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9090
\ No newline at end of file
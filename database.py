@@ -1,46 +1,233 @@
+import json
+import logging
 import sqlite3
 from datetime import datetime
 
+from cache import TTLCache
+from migrations import migrate, normalize_handle, ARCHIVE_COLUMNS
+from models import Form, ArchivedForm, FORM_COLUMNS, ARCHIVED_FORM_COLUMNS
+
+DB_PATH = "forms.db"
+
+# Кэш последней анкеты пользователя: get_main_menu и обработчики
+# читают одну и ту же строку по нескольку раз за апдейт
+FORM_CACHE_SIZE = 10000
+FORM_CACHE_TTL = 300
+
+_conn = None
+
+# Кэш бан-листа: множество user_id и версия, с которой он загружен
+_banned_ids = None
+_banned_version = None
+_data_version = None
+ban_cache_stats = {"hits": 0, "reloads": 0}
+
+_form_cache = TTLCache(FORM_CACHE_SIZE, FORM_CACHE_TTL)
+_MISSING = object()
+
+# С какой версии базы и с какого номера в журнале form_changes
+# кэш анкет считается актуальным (нужно, когда процессов несколько)
+_form_data_version = None
+_form_change_id = None
+
+# Поля, дубли которых ищем при сохранении анкеты (по колонкам <поле>_key),
+# и сколько совпавших анкет запоминать на поле
+HANDLE_FIELDS = ("mc_nick", "tg_username")
+DUPLICATES_LIMIT = 5
+
+# Архивные анкеты участников, которые давно не заходили ('idle') или
+# заблокировали бота ('inactive'): пока пользователь не вернётся и анкета
+# не вернётся в forms (touch_user), она считается действующей
+_MEMBER_ARCHIVE = "reason IN ('inactive', 'idle')"
+
+# Колонки анкеты в запросах с JOIN, где forms — под псевдонимом f
+_JOINED_FORM_COLUMNS = ", ".join(f"f.{column}" for column in FORM_COLUMNS.split(", "))
+
+# Колонки анкеты из forms f, а если её там нет — из архива участников a
+_FORM_OR_MEMBER_ARCHIVE = ", ".join(
+    f"CASE WHEN f.id IS NULL THEN a.{column} ELSE f.{column} END AS {column}"
+    for column in FORM_COLUMNS.split(", ")
+)
+
+
+def open_connection(check_same_thread=True):
+    """Открыть новое настроенное соединение с базой"""
+    conn = sqlite3.connect(DB_PATH, check_same_thread=check_same_thread, cached_statements=256)
+    conn.row_factory = sqlite3.Row
+    # Для новой базы действует сразу, для существующей — после VACUUM
+    # (см. enable_incremental_vacuum); должно идти до включения WAL
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA busy_timeout = 5000")
+    conn.execute("PRAGMA cache_size = -16000")
+    conn.execute("PRAGMA mmap_size = 268435456")
+    return conn
+
+
+def get_connection():
+    """Получить постоянное соединение с базой (создаётся один раз)"""
+    global _conn
+    if _conn is None:
+        # Соединение используется потоком БД из async_db, поэтому
+        # проверку потока отключаем; запросы туда приходят по очереди
+        _conn = open_connection(check_same_thread=False)
+    return _conn
+
+
+def _form_cursor(conn=None, factory=Form.from_row):
+    """Курсор, строки которого — анкеты (Form), а не sqlite3.Row"""
+    cur = (conn or get_connection()).cursor()
+    cur.row_factory = factory
+    return cur
+
+
+def close_connection():
+    """Закрыть постоянное соединение с базой"""
+    global _conn
+    if _conn is not None:
+        _conn.close()
+        _conn = None
+
+
 def init_db():
-    conn = sqlite3.connect("forms.db")
-    cur = conn.cursor()
-
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS forms (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            name TEXT,
-            tg_username TEXT,
-            mc_nick TEXT,
-            call_as TEXT,
-            age INTEGER,
-            extra TEXT,
-            status TEXT DEFAULT 'pending',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            edited_at TIMESTAMP,
-            is_edited INTEGER DEFAULT 0,
-            admin_message_id INTEGER
-        )
-    """)
+    """Создать или обновить схему базы до актуальной версии"""
+    conn = get_connection()
+    migrate(conn)
+    _load_banned()
 
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS banned_users (
-            user_id INTEGER PRIMARY KEY,
-            banned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
 
-    conn.commit()
-    conn.close()
+# ------------------------------- КЭШ БАН-ЛИСТА -------------------------------
+
+def _load_banned():
+    """Загрузить бан-лист из базы в память"""
+    global _banned_ids, _banned_version, _data_version
+    conn = get_connection()
+
+    _data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+    _banned_version = conn.execute("SELECT version FROM ban_list_version WHERE id = 1").fetchone()[0]
+    _banned_ids = {row[0] for row in conn.execute("SELECT user_id FROM banned_users")}
+    ban_cache_stats["reloads"] += 1
+
+
+def _check_banned_cache():
+    """Перезагрузить кэш, если бан-лист изменил другой процесс"""
+    global _data_version
+    conn = get_connection()
+
+    # data_version меняется только после коммитов других соединений,
+    # поэтому в обычном случае хватает одной дешёвой прагмы
+    data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+    if data_version == _data_version:
+        return
+    _data_version = data_version
+
+    version = conn.execute("SELECT version FROM ban_list_version WHERE id = 1").fetchone()[0]
+    if version != _banned_version:
+        _load_banned()
+
+
+def _own_ban_write(cur):
+    """Вызывается внутри транзакции записи в banned_users, до commit.
+    Возвращает True, если кэш можно поправить точечно, и False,
+    если бан-лист успел поменять другой процесс и кэш надо перечитать"""
+    global _banned_version
+    cur.execute("PRAGMA data_version")
+    if cur.fetchone()[0] != _data_version:
+        return False
+
+    cur.execute("SELECT version FROM ban_list_version WHERE id = 1")
+    _banned_version = cur.fetchone()[0]
+    return True
+
+
+def _check_form_cache():
+    """Сбросить из кэша анкеты, которые изменил другой процесс"""
+    global _form_data_version, _form_change_id
+    conn = get_connection()
+
+    data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+    if data_version == _form_data_version:
+        return
+    _form_data_version = data_version
+
+    # Триггеры пишут в журнал каждую вставку, правку и удаление анкеты
+    # вместе с user_id: сбрасываем из кэша только затронутых пользователей
+    changes = []
+    if _form_change_id is not None:
+        changes = conn.execute(
+            "SELECT id, user_id FROM form_changes WHERE id > ? ORDER BY id LIMIT ?",
+            (_form_change_id, FORM_CACHE_SIZE)
+        ).fetchall()
+        if not changes:
+            return
+
+    # Номера в журнале идут подряд. Пропуск значит, что непрочитанное уже
+    # удалила очистка журнала после выгрузки, — тогда, как и при первой
+    # проверке или слишком большом числе изменений, сбрасываем кэш целиком
+    if (
+        not changes
+        or changes[0][0] != _form_change_id + 1
+        or len(changes) == FORM_CACHE_SIZE
+        or any(user_id is None for _, user_id in changes)
+    ):
+        _form_change_id = conn.execute("SELECT MAX(id) FROM form_changes").fetchone()[0] or 0
+        _form_cache.clear()
+        return
+
+    _form_change_id = changes[-1][0]
+    for _, user_id in changes:
+        _form_cache.pop(user_id)
+
+
+def get_form_cache_stats():
+    """Статистика кэша анкет"""
+    return _form_cache.stats()
+
+
+def get_ban_cache_stats():
+    """Статистика кэша бан-листа"""
+    return dict(ban_cache_stats, size=len(_banned_ids or ()))
+
+
+def _find_duplicates(cur, user_id, keys):
+    """Анкеты других пользователей с тем же ником или username.
+
+    keys — {поле: нормализованное значение}. Каждое поле — проход по
+    индексу <поле>_key в forms и в архиве участников. Возвращает JSON
+    для колонки duplicates или None"""
+    duplicates = {}
+    for field, key in keys.items():
+        if key is None:
+            continue
+        cur.execute(f"""
+            SELECT id FROM forms
+            WHERE {field}_key = ? AND user_id != ?
+            UNION ALL
+            SELECT id FROM forms_archive
+            WHERE {field}_key = ? AND user_id != ? AND {_MEMBER_ARCHIVE}
+            ORDER BY id DESC
+            LIMIT ?
+        """, (key, user_id, key, user_id, DUPLICATES_LIMIT))
+        form_ids = [row[0] for row in cur.fetchall()]
+        if form_ids:
+            duplicates[field] = form_ids
+    return json.dumps(duplicates) if duplicates else None
 
 
 def save_form(data, admin_message_id=None):
-    conn = sqlite3.connect("forms.db")
+    conn = get_connection()
     cur = conn.cursor()
 
+    keys = {field: normalize_handle(data[field]) for field in HANDLE_FIELDS}
+    duplicates = _find_duplicates(cur, data["user_id"], keys)
+
     cur.execute("""
-        INSERT INTO forms (user_id, name, tg_username, mc_nick, call_as, age, extra, status, admin_message_id)
-        VALUES (?, ?, ?, ?, ?, ?, ?, 'pending', ?)
+        INSERT INTO forms (
+            user_id, name, tg_username, mc_nick, call_as, age, extra, status, admin_message_id,
+            mc_nick_key, tg_username_key, duplicates
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, 'pending', ?, ?, ?, ?)
     """, (
         data["user_id"],
         data["name"],
@@ -49,51 +236,225 @@ def save_form(data, admin_message_id=None):
         data["call_as"],
         data["age"],
         data["extra"],
-        admin_message_id
+        admin_message_id,
+        keys["mc_nick"],
+        keys["tg_username"],
+        duplicates
     ))
 
     form_id = cur.lastrowid
+
+    # Уведомление админам — в той же транзакции: анкета без него не останется
+    if admin_message_id is None:
+        cur.execute("INSERT INTO form_outbox (form_id) VALUES (?)", (form_id,))
+
     conn.commit()
-    conn.close()
+    _form_cache.pop(data["user_id"])
     return form_id
 
 
 def get_all_forms():
-    conn = sqlite3.connect("forms.db")
-    cur = conn.cursor()
+    cur = _form_cursor()
 
-    cur.execute("SELECT * FROM forms ORDER BY id DESC")
+    cur.execute(f"SELECT {FORM_COLUMNS} FROM forms ORDER BY id DESC")
     rows = cur.fetchall()
 
-    conn.close()
     return rows
 
 
-def get_user_form(user_id):
-    """Получить последнюю анкету пользователя"""
-    conn = sqlite3.connect("forms.db")
+def iter_forms(conn=None, batch_size=500):
+    """Перебрать все анкеты по id, читая курсор пачками через fetchmany.
+
+    Анкеты участников, перенесённые в архив за неактивность, тоже входят:
+    для выгрузки это действующие анкеты (см. _MEMBER_ARCHIVE).
+    Для долгих выгрузок лучше передать отдельное соединение
+    (open_connection), чтобы не занимать поток БД бота."""
+    cur = (conn or get_connection()).cursor()
+    cur.execute(f"""
+        SELECT {FORM_COLUMNS} FROM forms
+        UNION ALL
+        SELECT {FORM_COLUMNS} FROM forms_archive WHERE {_MEMBER_ARCHIVE}
+        ORDER BY id
+    """)
+
+    while True:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            break
+        yield from rows
+
+
+def get_export_watermark(name, conn=None):
+    """Номер последнего выгруженного изменения для выгрузки name"""
+    cur = (conn or get_connection()).cursor()
+    cur.execute("SELECT last_change_id FROM export_watermarks WHERE name = ?", (name,))
+    result = cur.fetchone()
+    return result[0] if result else 0
+
+
+def get_last_change_id(conn=None):
+    """Номер последнего изменения анкет"""
+    cur = (conn or get_connection()).cursor()
+    cur.execute("SELECT MAX(id) FROM form_changes")
+    return cur.fetchone()[0] or 0
+
+
+def iter_form_changes(since, until, conn=None, batch_size=500):
+    """Перебрать анкеты, изменённые в промежутке (since, until].
+
+    Для каждой анкеты отдаётся только её итоговое состояние:
+    (change_id, form_id, строка анкеты или None, если анкета удалена).
+    Перенос в архив участников и возвращение оттуда (op 'archive' и
+    'restore') данных анкеты не меняют и в выгрузку не попадают; анкета,
+    изменённая и затем перенесённая, берётся из архива."""
+    cur = (conn or get_connection()).cursor()
+    cur.execute(f"""
+        SELECT ch.change_id, ch.form_id, {_FORM_OR_MEMBER_ARCHIVE}
+        FROM (
+            SELECT form_id, MAX(id) AS change_id
+            FROM form_changes
+            WHERE id > ? AND id <= ? AND op IN ('upsert', 'delete')
+            GROUP BY form_id
+        ) AS ch
+        LEFT JOIN forms f ON f.id = ch.form_id
+        LEFT JOIN forms_archive a ON a.id = ch.form_id AND f.id IS NULL AND a.{_MEMBER_ARCHIVE}
+        ORDER BY ch.change_id
+    """, (since, until))
+
+    while True:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            break
+        for row in rows:
+            form = row if row["id"] is not None else None
+            yield row["change_id"], row["form_id"], form
+
+
+def set_export_watermark(name, change_id, conn=None):
+    """Запомнить выгруженное изменение и подчистить журнал, уже выгруженный всеми"""
+    conn = conn or get_connection()
     cur = conn.cursor()
 
     cur.execute("""
-        SELECT * FROM forms 
+        INSERT INTO export_watermarks (name, last_change_id, exported_at)
+        VALUES (?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT (name) DO UPDATE SET
+            last_change_id = excluded.last_change_id,
+            exported_at = excluded.exported_at
+    """, (name, change_id))
+    cur.execute("""
+        DELETE FROM form_changes
+        WHERE id <= (SELECT MIN(last_change_id) FROM export_watermarks)
+    """)
+
+    conn.commit()
+
+
+def prune_form_changes(keep, limit):
+    """Удалить пачку старых записей журнала form_changes. Остаются последние
+    keep записей и всё, что ещё не выгрузили выгрузки с отметками.
+    Возвращает число удалённых записей"""
+    conn = get_connection()
+    cur = conn.cursor()
+
+    cur.execute("""
+        DELETE FROM form_changes WHERE id IN (
+            SELECT id FROM form_changes
+            WHERE id <= (SELECT MAX(id) FROM form_changes) - ?
+              AND id <= COALESCE((SELECT MIN(last_change_id) FROM export_watermarks), id)
+            ORDER BY id
+            LIMIT ?
+        )
+    """, (keep, limit))
+
+    conn.commit()
+    return cur.rowcount
+
+
+def get_forms_page(limit, status=None, edited_only=False, before_id=None, after_id=None):
+    """Получить страницу анкет (keyset-пагинация по id, новые сверху).
+
+    before_id — листаем к более старым анкетам, after_id — к более новым.
+    Возвращает (анкеты, есть_новее, есть_старше)"""
+    cur = _form_cursor()
+
+    conditions = []
+    params = []
+    if status:
+        conditions.append("status = ?")
+        params.append(status)
+    if edited_only:
+        conditions.append("is_edited = 1")
+
+    if after_id is not None:
+        conditions.append("id > ?")
+        params.append(after_id)
+        order = "ASC"
+    else:
+        if before_id is not None:
+            conditions.append("id < ?")
+            params.append(before_id)
+        order = "DESC"
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    # Берём на одну строку больше, чтобы узнать, есть ли следующая страница
+    cur.execute(f"""
+        SELECT {FORM_COLUMNS} FROM forms
+        {where}
+        ORDER BY id {order}
+        LIMIT ?
+    """, (*params, limit + 1))
+    rows = cur.fetchall()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    if after_id is not None:
+        rows.reverse()
+        return rows, has_more, True
+    return rows, before_id is not None, has_more
+
+
+def get_user_form(user_id):
+    """Получить последнюю анкету пользователя (из архива, если её туда
+    перенесли за неактивность)"""
+    _check_form_cache()
+    row = _form_cache.get(user_id, _MISSING)
+    if row is not _MISSING:
+        return row
+
+    cur = _form_cursor()
+
+    cur.execute(f"""
+        SELECT {FORM_COLUMNS} FROM forms 
         WHERE user_id = ? 
         ORDER BY id DESC 
         LIMIT 1
     """, (user_id,))
     
     row = cur.fetchone()
-    conn.close()
+    if row is None:
+        cur.execute(f"""
+            SELECT {FORM_COLUMNS} FROM forms_archive
+            WHERE user_id = ? AND {_MEMBER_ARCHIVE}
+            ORDER BY id DESC
+            LIMIT 1
+        """, (user_id,))
+        row = cur.fetchone()
+
+    _form_cache.set(user_id, row)
     return row
 
 
 def update_form_field(user_id, field_name, value):
     """Обновить конкретное поле анкеты"""
-    conn = sqlite3.connect("forms.db")
+    conn = get_connection()
     cur = conn.cursor()
 
     # Сначала получаем ID последней анкеты пользователя
     cur.execute("""
-        SELECT id FROM forms 
+        SELECT id, mc_nick_key, tg_username_key FROM forms 
         WHERE user_id = ? 
         ORDER BY id DESC 
         LIMIT 1
@@ -101,46 +462,64 @@ def update_form_field(user_id, field_name, value):
     
     result = cur.fetchone()
     if result:
-        form_id = result[0]
+        form_id = result["id"]
+        assignments = f"{field_name} = ?"
+        params = [value]
+
+        # Сменился ник или username — вместе с полем обновляем ключ и дубли
+        if field_name in HANDLE_FIELDS:
+            keys = {field: result[f"{field}_key"] for field in HANDLE_FIELDS}
+            keys[field_name] = normalize_handle(value)
+            assignments += f", {field_name}_key = ?, duplicates = ?"
+            params += [keys[field_name], _find_duplicates(cur, user_id, keys)]
         
         # Теперь обновляем конкретное поле
         query = f"""
             UPDATE forms 
-            SET {field_name} = ?, edited_at = ?, is_edited = 1
+            SET {assignments}, edited_at = ?, is_edited = 1
             WHERE id = ?
         """
         
-        cur.execute(query, (value, datetime.now(), form_id))
+        cur.execute(query, (*params, datetime.now(), form_id))
     
     conn.commit()
-    conn.close()
+    _form_cache.pop(user_id)
+
 
+def delete_form(form_id, rejected=False):
+    """Удалить анкету по ID.
 
-def delete_form(form_id):
-    """Удалить анкету по ID"""
-    conn = sqlite3.connect("forms.db")
+    rejected=True — анкету удаляют, потому что её отклонили: перед удалением
+    ставим статус 'rejected', чтобы триггеры учли отказ в статистике."""
+    conn = get_connection()
     cur = conn.cursor()
 
+    cur.execute("SELECT user_id FROM forms WHERE id = ?", (form_id,))
+    result = cur.fetchone()
+
+    if rejected:
+        cur.execute("UPDATE forms SET status = 'rejected' WHERE id = ?", (form_id,))
     cur.execute("DELETE FROM forms WHERE id = ?", (form_id,))
     
     conn.commit()
-    conn.close()
+    if result:
+        _form_cache.pop(result[0])
 
 
 def delete_user_form(user_id):
     """Удалить анкету пользователя"""
-    conn = sqlite3.connect("forms.db")
+    conn = get_connection()
     cur = conn.cursor()
 
     cur.execute("DELETE FROM forms WHERE user_id = ?", (user_id,))
     
     conn.commit()
-    conn.close()
+    _form_cache.pop(user_id)
 
 
 def update_form_status(user_id, status):
     """Обновить статус анкеты"""
-    conn = sqlite3.connect("forms.db")
+    conn = get_connection()
     cur = conn.cursor()
 
     cur.execute("""
@@ -150,12 +529,12 @@ def update_form_status(user_id, status):
     """, (status, user_id))
     
     conn.commit()
-    conn.close()
+    _form_cache.pop(user_id)
 
 
 def ban_user(user_id):
     """Забанить пользователя"""
-    conn = sqlite3.connect("forms.db")
+    conn = get_connection()
     cur = conn.cursor()
 
     cur.execute("""
@@ -163,36 +542,41 @@ def ban_user(user_id):
         VALUES (?)
     """, (user_id,))
     
+    in_sync = _own_ban_write(cur)
     conn.commit()
-    conn.close()
+
+    if in_sync:
+        _banned_ids.add(user_id)
+    else:
+        _load_banned()
 
 
 def is_banned(user_id):
     """Проверить, забанен ли пользователь"""
-    conn = sqlite3.connect("forms.db")
-    cur = conn.cursor()
-
-    cur.execute("SELECT 1 FROM banned_users WHERE user_id = ?", (user_id,))
-    result = cur.fetchone()
-    
-    conn.close()
-    return result is not None
+    _check_banned_cache()
+    ban_cache_stats["hits"] += 1
+    return user_id in _banned_ids
 
 
 def unban_user(user_id):
     """Разбанить пользователя"""
-    conn = sqlite3.connect("forms.db")
+    conn = get_connection()
     cur = conn.cursor()
 
     cur.execute("DELETE FROM banned_users WHERE user_id = ?", (user_id,))
     
+    in_sync = _own_ban_write(cur)
     conn.commit()
-    conn.close()
+
+    if in_sync:
+        _banned_ids.discard(user_id)
+    else:
+        _load_banned()
 
 
 def get_admin_message_id(user_id):
     """Получить ID сообщения в админ-чате для анкеты пользователя"""
-    conn = sqlite3.connect("forms.db")
+    conn = get_connection()
     cur = conn.cursor()
 
     cur.execute("""
@@ -203,13 +587,12 @@ def get_admin_message_id(user_id):
     """, (user_id,))
     
     result = cur.fetchone()
-    conn.close()
     return result[0] if result and result[0] else None
 
 
 def update_admin_message_id(user_id, message_id):
     """Обновить ID сообщения в админ-чате"""
-    conn = sqlite3.connect("forms.db")
+    conn = get_connection()
     cur = conn.cursor()
 
     cur.execute("""
@@ -220,6 +603,551 @@ def update_admin_message_id(user_id, message_id):
     """, (message_id, user_id, user_id))
     
     conn.commit()
-    conn.close()
+    _form_cache.pop(user_id)
+
+
+# ------------------------------- МАССОВАЯ МОДЕРАЦИЯ -------------------------------
+
+def _select_pending_forms(conn, form_ids):
+    """Выбрать ожидающие анкеты по списку ID (пачками, чтобы не упереться в лимит параметров)"""
+    cur = _form_cursor(conn)
+    forms = []
+    for i in range(0, len(form_ids), 500):
+        chunk = form_ids[i:i + 500]
+        placeholders = ", ".join("?" * len(chunk))
+        cur.execute(f"""
+            SELECT {FORM_COLUMNS} FROM forms
+            WHERE id IN ({placeholders}) AND status = 'pending'
+            ORDER BY id
+        """, chunk)
+        forms.extend(cur.fetchall())
+    return forms
+
+
+def accept_forms(form_ids=None):
+    """Принять ожидающие анкеты одной транзакцией.
+
+    form_ids=None — принять все ожидающие. Возвращает принятые анкеты."""
+    conn = get_connection()
+    cur = conn.cursor()
+
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        if form_ids is None:
+            forms = _form_cursor(conn).execute(
+                f"SELECT {FORM_COLUMNS} FROM forms WHERE status = 'pending' ORDER BY id"
+            ).fetchall()
+        else:
+            forms = _select_pending_forms(conn, form_ids)
+
+        cur.executemany(
+            "UPDATE forms SET status = 'accepted' WHERE id = ?",
+            [(form.id,) for form in forms]
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    for form in forms:
+        _form_cache.pop(form.user_id)
+    return forms
+
+
+def reject_forms(form_ids):
+    """Отклонить ожидающие анкеты одной транзакцией: удалить их и забанить авторов.
+
+    Возвращает отклонённые анкеты (в состоянии до удаления)."""
+    conn = get_connection()
+    cur = conn.cursor()
+
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        forms = _select_pending_forms(conn, form_ids)
+        user_ids = {form.user_id for form in forms}
+
+        form_ids = [(form.id,) for form in forms]
+        # Статус перед удалением — чтобы триггеры статистики учли отказ
+        cur.executemany("UPDATE forms SET status = 'rejected' WHERE id = ?", form_ids)
+        cur.executemany("DELETE FROM forms WHERE id = ?", form_ids)
+        cur.executemany(
+            "INSERT OR REPLACE INTO banned_users (user_id) VALUES (?)",
+            [(user_id,) for user_id in user_ids]
+        )
+        in_sync = _own_ban_write(cur)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    if in_sync:
+        _banned_ids.update(user_ids)
+    else:
+        _load_banned()
+    for user_id in user_ids:
+        _form_cache.pop(user_id)
+    return forms
+
+
+# ------------------------------- РАССЫЛКИ -------------------------------
+
+# Принятые пользователи: с анкетой в forms или в архиве за неактивность
+# (туда попадают только одобренные). Каждая часть идёт по своему индексу
+# в порядке user_id, поэтому LIMIT ставится в каждую часть отдельно
+_ACCEPTED_USERS = """
+    SELECT user_id FROM (
+        SELECT DISTINCT user_id FROM forms
+        WHERE status = 'accepted' AND user_id > :after
+        AND user_id NOT IN (SELECT user_id FROM blocked_users)
+        ORDER BY user_id LIMIT :limit
+    )
+    UNION
+    SELECT user_id FROM (
+        SELECT user_id FROM forms_archive
+        WHERE reason = 'idle' AND user_id > :after
+        AND user_id NOT IN (SELECT user_id FROM blocked_users)
+        ORDER BY user_id LIMIT :limit
+    )
+"""
+
+
+def create_broadcast(text, progress_message_id=None):
+    """Создать рассылку всем принятым пользователям, вернуть её ID"""
+    conn = get_connection()
+    cur = conn.cursor()
+
+    cur.execute(f"SELECT COUNT(*) FROM ({_ACCEPTED_USERS})", {"after": 0, "limit": -1})
+    total = cur.fetchone()[0]
+
+    cur.execute("""
+        INSERT INTO broadcasts (text, total, progress_message_id)
+        VALUES (?, ?, ?)
+    """, (text, total, progress_message_id))
+
+    broadcast_id = cur.lastrowid
+    conn.commit()
+    return broadcast_id
+
+
+def get_broadcast(broadcast_id):
+    """Получить рассылку по ID"""
+    conn = get_connection()
+    cur = conn.cursor()
+
+    cur.execute("SELECT * FROM broadcasts WHERE id = ?", (broadcast_id,))
+    return cur.fetchone()
+
+
+def get_running_broadcasts():
+    """Незавершённые рассылки (для продолжения после рестарта)"""
+    conn = get_connection()
+    cur = conn.cursor()
+
+    cur.execute("SELECT * FROM broadcasts WHERE status = 'running' ORDER BY id")
+    return cur.fetchall()
+
+
+def get_broadcast_recipients(after_user_id, limit):
+    """Следующая пачка получателей рассылки после after_user_id"""
+    conn = get_connection()
+    cur = conn.cursor()
+
+    cur.execute(
+        f"SELECT user_id FROM ({_ACCEPTED_USERS}) ORDER BY user_id LIMIT :limit",
+        {"after": after_user_id, "limit": limit}
+    )
+    return [row[0] for row in cur.fetchall()]
+
+
+def save_broadcast_checkpoint(broadcast_id, last_user_id, sent, failed, blocked_user_ids=()):
+    """Сохранить прогресс рассылки и заблокировавших бота одной транзакцией"""
+    conn = get_connection()
+    cur = conn.cursor()
+
+    cur.execute("""
+        UPDATE broadcasts
+        SET last_user_id = ?, sent = sent + ?, failed = failed + ?
+        WHERE id = ?
+    """, (last_user_id, sent, failed, broadcast_id))
+    cur.executemany(
+        "INSERT OR IGNORE INTO blocked_users (user_id) VALUES (?)",
+        [(user_id,) for user_id in blocked_user_ids]
+    )
+
+    conn.commit()
+
+
+def finish_broadcast(broadcast_id, status="done"):
+    """Отметить рассылку завершённой или отменённой"""
+    conn = get_connection()
+    cur = conn.cursor()
+
+    cur.execute("""
+        UPDATE broadcasts
+        SET status = ?, finished_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND status = 'running'
+    """, (status, broadcast_id))
+
+    conn.commit()
+    return cur.rowcount > 0
+
+
+def touch_user(user_id):
+    """Пользователь пишет боту: запомнить время активности, снять пометку
+    «заблокировал бота» и вернуть из архива анкеты, перенесённые туда
+    за неактивность"""
+    conn = get_connection()
+    cur = conn.cursor()
+
+    cur.execute("""
+        INSERT INTO user_activity (user_id, seen_at) VALUES (?, CURRENT_TIMESTAMP)
+        ON CONFLICT (user_id) DO UPDATE SET seen_at = excluded.seen_at
+    """, (user_id,))
+    cur.execute("DELETE FROM blocked_users WHERE user_id = ?", (user_id,))
+    restored = _restore_member_forms(cur, user_id)
+
+    conn.commit()
+    if restored:
+        _form_cache.pop(user_id)
+
+
+# ------------------------------- СОСТОЯНИЯ FSM -------------------------------
+
+def load_fsm_session(key):
+    """Получить (state, data, updated_at) сессии FSM или None"""
+    conn = get_connection()
+    cur = conn.cursor()
+
+    cur.execute("SELECT state, data, updated_at FROM fsm_sessions WHERE key = ?", (key,))
+    row = cur.fetchone()
+    if not row:
+        return None
+    return row["state"], json.loads(row["data"]) if row["data"] else {}, row["updated_at"]
+
+
+def save_fsm_sessions(sessions):
+    """Записать пачку сессий FSM одной транзакцией.
+
+    sessions — список (key, state, data, updated_at); пустые сессии удаляются."""
+    conn = get_connection()
+    cur = conn.cursor()
+
+    upserts = []
+    deletes = []
+    for key, state, data, updated_at in sessions:
+        if state is None and not data:
+            deletes.append((key,))
+        else:
+            upserts.append((key, state, json.dumps(data, ensure_ascii=False), updated_at))
+
+    cur.executemany("""
+        INSERT INTO fsm_sessions (key, state, data, updated_at)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (key) DO UPDATE SET
+            state = excluded.state,
+            data = excluded.data,
+            updated_at = excluded.updated_at
+    """, upserts)
+    cur.executemany("DELETE FROM fsm_sessions WHERE key = ?", deletes)
+
+    conn.commit()
+
+
+def delete_expired_fsm_sessions(before):
+    """Удалить сессии FSM, не менявшиеся с момента before (unix time)"""
+    conn = get_connection()
+    cur = conn.cursor()
+
+    cur.execute("DELETE FROM fsm_sessions WHERE updated_at < ?", (before,))
+
+    conn.commit()
+    return cur.rowcount
+
+
+# ----------------------- УВЕДОМЛЕНИЯ ОБ АНКЕТАХ (OUTBOX) -----------------------
+
+def get_outbox_batch(now, limit):
+    """Уведомления, которые пора отправить, вместе с анкетами:
+    список (outbox_id, form_id, attempts, Form). Если анкету успели
+    удалить, вместо Form будет None."""
+    cur = _form_cursor(factory=_outbox_row)
+
+    cur.execute(f"""
+        SELECT o.id, o.form_id, o.attempts, {_JOINED_FORM_COLUMNS}
+        FROM form_outbox o
+        LEFT JOIN forms f ON f.id = o.form_id
+        WHERE o.next_attempt_at <= ?
+        ORDER BY o.next_attempt_at, o.id
+        LIMIT ?
+    """, (now, limit))
+    return cur.fetchall()
+
+
+def _outbox_row(cursor, row):
+    return (*row[:3], Form(*row[3:]) if row[3] is not None else None)
+
+
+def complete_outbox(delivered):
+    """Записать доставленные уведомления одной транзакцией.
+
+    delivered — список (outbox_id, form_id, user_id, admin_message_id);
+    admin_message_id None — уведомление снято без отправки."""
+    conn = get_connection()
+    cur = conn.cursor()
+
+    cur.executemany(
+        "UPDATE forms SET admin_message_id = ? WHERE id = ?",
+        [(message_id, form_id) for _, form_id, _, message_id in delivered if message_id is not None]
+    )
+    cur.executemany("DELETE FROM form_outbox WHERE id = ?", [(outbox_id,) for outbox_id, *_ in delivered])
+
+    conn.commit()
+    for _, _, user_id, _ in delivered:
+        _form_cache.pop(user_id)
+
+
+def retry_outbox(failed):
+    """Отложить неотправленные уведомления.
+
+    failed — список (outbox_id, next_attempt_at, error)"""
+    conn = get_connection()
+    cur = conn.cursor()
+
+    cur.executemany("""
+        UPDATE form_outbox
+        SET attempts = attempts + 1, next_attempt_at = ?, last_error = ?
+        WHERE id = ?
+    """, [(next_attempt_at, error, outbox_id) for outbox_id, next_attempt_at, error in failed])
+
+    conn.commit()
+
+
+def reconcile_outbox():
+    """Поставить в очередь уведомления для анкет на рассмотрении,
+    у которых нет ни сообщения в админ-группе, ни записи в outbox.
+    Возвращает количество добавленных уведомлений"""
+    conn = get_connection()
+    cur = conn.cursor()
+
+    cur.execute("""
+        INSERT INTO form_outbox (form_id)
+        SELECT f.id FROM forms f
+        WHERE f.status = 'pending'
+          AND f.admin_message_id IS NULL
+          AND NOT EXISTS (SELECT 1 FROM form_outbox o WHERE o.form_id = f.id)
+        ORDER BY f.id
+    """)
+
+    conn.commit()
+    return cur.rowcount
+
+
+# ------------------------------- ПОИСК -------------------------------
+
+# Токенизатор trigram не находит фрагменты короче трёх символов
+SEARCH_MIN_LENGTH = 3
+
+# Веса колонок для bm25: совпадение в нике и username важнее, чем в «о себе»
+_SEARCH_WEIGHTS = "2.0, 3.0, 3.0, 1.0, 0.5"
+
+
+def make_search_query(text):
+    """Превратить ввод админа в запрос FTS5: каждое слово ищется как подстрока,
+    все слова должны найтись. None, если искать нечего"""
+    words = [word for word in text.split() if len(word) >= SEARCH_MIN_LENGTH]
+    if not words:
+        return None
+    # В кавычках спецсимволы FTS5 (*, -, : и т.п.) теряют смысл
+    return " ".join('"' + word.replace('"', '""') + '"' for word in words)
+
+
+def search_forms(query, limit, offset=0):
+    """Найти анкеты по запросу из make_search_query, лучшие совпадения первыми.
+    Возвращает (анкеты, есть_ещё)"""
+    cur = _form_cursor()
+
+    cur.execute(f"""
+        SELECT {_JOINED_FORM_COLUMNS} FROM forms_fts
+        JOIN forms f ON f.id = forms_fts.rowid
+        WHERE forms_fts MATCH ?
+        ORDER BY bm25(forms_fts, {_SEARCH_WEIGHTS}), f.id DESC
+        LIMIT ? OFFSET ?
+    """, (query, limit + 1, offset))
+    rows = cur.fetchall()
+
+    return rows[:limit], len(rows) > limit
+
+# ------------------------------- СТАТИСТИКА -------------------------------
+
+def get_stats(days):
+    """Сводка для /stats из счётчиков, которые ведут триггеры (миграция 11).
+
+    Возвращает (счётчики, забанено, дни): счётчики — {имя: значение},
+    дни — строки form_stats_daily за последние days дней, новые первыми"""
+    conn = get_connection()
+    cur = conn.cursor()
+
+    # Одобренные анкеты, перенесённые в архив за неактивность, триггеры
+    # вычитают из accepted и считают отдельно, в archived_idle (миграция 17)
+    cur.execute("SELECT name, value FROM form_stats")
+    totals = dict(cur.fetchall())
+
+    cur.execute("""
+        SELECT * FROM form_stats_daily
+        WHERE day > date('now', ?)
+        ORDER BY day DESC
+    """, (f"-{days} days",))
+    daily = cur.fetchall()
+
+    # Бан-лист и так целиком в памяти
+    _check_banned_cache()
+    return totals, len(_banned_ids), daily
+
+
+# ------------------------------- АРХИВ -------------------------------
+
+def _archive_forms(select_sql, params, reason):
+    """Перенести в архив с причиной reason анкеты, которые выбирает
+    select_sql (колонки id и user_id), одной транзакцией. Возвращает их число"""
+    conn = get_connection()
+    cur = conn.cursor()
+
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute(select_sql, params)
+        rows = cur.fetchall()
+        if rows:
+            placeholders = ", ".join("?" * len(rows))
+            form_ids = [row["id"] for row in rows]
+            # Сначала копия со своей причиной, затем удаление:
+            # триггер forms_archive_delete эту строку уже не перезапишет
+            cur.execute(f"""
+                INSERT INTO forms_archive ({ARCHIVE_COLUMNS}, reason)
+                SELECT {ARCHIVE_COLUMNS}, ? FROM forms WHERE id IN ({placeholders})
+            """, [reason, *form_ids])
+            cur.execute(f"DELETE FROM forms WHERE id IN ({placeholders})", form_ids)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    for row in rows:
+        _form_cache.pop(row["user_id"])
+    return len(rows)
+
+
+def archive_inactive_forms(blocked_days, limit):
+    """Перенести в архив пачку одобренных анкет пользователей, которые
+    заблокировали бота больше blocked_days дней назад. Возвращает их число.
+    CROSS JOIN закрепляет порядок: сначала заблокировавшие по индексу
+    blocked_at, а не проход по всем одобренным анкетам"""
+    return _archive_forms("""
+        SELECT f.id, f.user_id FROM blocked_users b
+        CROSS JOIN forms f ON f.user_id = b.user_id
+        WHERE b.blocked_at < datetime('now', ?) AND f.status = 'accepted'
+        LIMIT ?
+    """, (f"-{blocked_days} days", limit), "inactive")
+
+
+def archive_idle_forms(idle_days, limit):
+    """Перенести в архив пачку одобренных анкет пользователей, которые
+    не писали боту больше idle_days дней. Возвращает их число.
+    CROSS JOIN закрепляет порядок: сначала давно не заходившие по индексу
+    seen_at, а не проход по всем одобренным анкетам"""
+    return _archive_forms("""
+        SELECT f.id, f.user_id FROM user_activity a
+        CROSS JOIN forms f ON f.user_id = a.user_id
+        WHERE a.seen_at < datetime('now', ?) AND f.status = 'accepted'
+        LIMIT ?
+    """, (f"-{idle_days} days", limit), "idle")
+
+
+def _restore_member_forms(cur, user_id):
+    """Вернуть из архива анкеты, перенесённые туда за неактивность"""
+    cur.execute(f"""
+        INSERT INTO forms ({ARCHIVE_COLUMNS})
+        SELECT {ARCHIVE_COLUMNS} FROM forms_archive
+        WHERE user_id = ? AND {_MEMBER_ARCHIVE}
+    """, (user_id,))
+    restored = cur.rowcount
+    if restored:
+        cur.execute(f"DELETE FROM forms_archive WHERE user_id = ? AND {_MEMBER_ARCHIVE}", (user_id,))
+    return restored
+
+
+def purge_archive(reason, keep_days, limit):
+    """Удалить пачку архивных анкет с причиной reason старше keep_days дней"""
+    conn = get_connection()
+    cur = conn.cursor()
+
+    cur.execute("""
+        DELETE FROM forms_archive WHERE id IN (
+            SELECT id FROM forms_archive
+            WHERE reason = ? AND archived_at < datetime('now', ?)
+            LIMIT ?
+        )
+    """, (reason, f"-{keep_days} days", limit))
+
+    conn.commit()
+    return cur.rowcount
+
+
+def enable_incremental_vacuum():
+    """Включить auto_vacuum = INCREMENTAL: место от удалённых строк тогда
+    возвращается по частям (см. run_maintenance), а не только полным VACUUM.
+
+    Новая база создаётся сразу в этом режиме (open_connection), а существующую
+    переводит только один полный VACUUM, который держит базу всё время
+    перестройки. Поэтому его запускает обслуживание (archive.py), а не
+    init_db при каждом старте. Возвращает True, если база перестроена"""
+    conn = get_connection()
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return False
+    logging.warning("Перестраиваю базу для инкрементального VACUUM, это может занять время")
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    return True
+
+
+def run_maintenance(vacuum_pages, analysis_limit):
+    """Вернуть системе до vacuum_pages свободных страниц и обновить
+    статистику планировщика. Возвращает число освобождённых страниц"""
+    conn = get_connection()
+
+    free_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    # incremental_vacuum освобождает по странице за шаг, а execute делает
+    # только один шаг; executescript выполняет прагму до конца
+    conn.executescript(f"PRAGMA incremental_vacuum({int(vacuum_pages)})")
+    free_after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+    # analysis_limit ограничивает ANALYZE выборкой строк с каждого индекса
+    conn.execute(f"PRAGMA analysis_limit = {int(analysis_limit)}")
+    conn.execute("ANALYZE")
+    conn.commit()
+    return free_before - free_after
+
+
+def get_form_history(user_id=None, handle=None, limit=20):
+    """Архивные анкеты пользователя (по user_id) или по нику/username, новые первыми"""
+    cur = _form_cursor(factory=ArchivedForm.from_row)
+
+    if user_id is not None:
+        cur.execute(f"""
+            SELECT {ARCHIVED_FORM_COLUMNS} FROM forms_archive
+            WHERE user_id = ?
+            ORDER BY id DESC
+            LIMIT ?
+        """, (user_id, limit))
+    else:
+        key = normalize_handle(handle)
+        cur.execute(f"""
+            SELECT {ARCHIVED_FORM_COLUMNS} FROM forms_archive WHERE mc_nick_key = ?
+            UNION
+            SELECT {ARCHIVED_FORM_COLUMNS} FROM forms_archive WHERE tg_username_key = ?
+            ORDER BY id DESC
+            LIMIT ?
+        """, (key, key, limit))
+    return cur.fetchall()
+
 
 init_db()
\ No newline at end of file
@@ -1,27 +1,164 @@
-
+import argparse
 import csv
-from database import get_all_forms
+import gzip
+import itertools
+import json
+
+from database import (
+    iter_forms, open_connection, get_export_watermark,
+    get_last_change_id, iter_form_changes, set_export_watermark
+)
+
+# Выгружаемые колонки анкеты, по порядку CSV_HEADER. Служебных колонок
+# forms (ключи для поиска дублей, найденные дубли) в выгрузке нет
+EXPORT_COLUMNS = [
+    "id", "user_id", "name", "tg_username", "mc_nick", "call_as", "age", "extra",
+    "status", "created_at", "edited_at", "is_edited", "admin_message_id"
+]
+
+CSV_HEADER = [
+    "ID", "User ID", "Имя", "TG Username", "MC Ник",
+    "Как обращаться", "Возраст", "Дополнительно",
+    "Статус", "Создана", "Изменена", "Отредактирована", "ID сообщения"
+]
+
+FORMATS = ("csv", "jsonl", "columns")
+
+
+def _open_output(filename, compress, encoding="utf-8"):
+    opener = gzip.open if compress else open
+    return opener(filename, "wt", newline="", encoding=encoding)
+
 
-def export_to_csv(filename="forms_export.csv"):
-    rows = get_all_forms()
+def export_to_csv(filename="forms_export.csv", compress=None):
+    """Выгрузить анкеты в CSV потоково: в памяти держится только одна пачка строк.
+    Анкеты участников, перенесённые в архив за неактивность, тоже выгружаются.
 
-    if not rows:
-        print("Нет данных для экспорта.")
-        return
+    Если compress не указан, gzip включается по расширению .gz.
+    Возвращает количество выгруженных анкет."""
+    if compress is None:
+        compress = filename.endswith(".gz")
 
-    # UTF-8 with BOM для правильного отображения в Excel
-    with open(filename, "w", newline="", encoding="utf-8-sig") as file:
-        writer = csv.writer(file, delimiter=";")  # Excel лучше понимает точку с запятой
-        writer.writerow([
-            "ID", "User ID", "Имя", "TG Username", "MC Ник",
-            "Как обращаться", "Возраст", "Дополнительно"
-        ])
+    # Отдельное соединение, чтобы долгая выгрузка не занимала поток БД бота
+    conn = open_connection()
+    try:
+        rows = iter_forms(conn)
+        first = next(rows, None)
 
-        for row in rows:
-            writer.writerow(row)
+        if first is None:
+            print("Нет данных для экспорта.")
+            return 0
+
+        count = 0
+
+        # UTF-8 with BOM для правильного отображения в Excel
+        with _open_output(filename, compress, encoding="utf-8-sig") as file:
+            writer = csv.writer(file, delimiter=";")  # Excel лучше понимает точку с запятой
+            writer.writerow(CSV_HEADER)
+
+            # Колонки берутся по имени: в forms есть и служебные
+            # (ключи для поиска дублей), которых нет в CSV_HEADER
+            for row in itertools.chain([first], rows):
+                writer.writerow([row[column] for column in EXPORT_COLUMNS])
+                count += 1
+    finally:
+        conn.close()
 
     print(f"Экспорт завершён. Файл: {filename}")
+    return count
+
+
+# ------------------------------- ИНКРЕМЕНТАЛЬНАЯ ВЫГРУЗКА -------------------------------
+
+def _write_csv(filename, compress, changes):
+    count = 0
+    with _open_output(filename, compress, encoding="utf-8-sig") as file:
+        writer = csv.writer(file, delimiter=";")
+        writer.writerow(["Операция"] + CSV_HEADER)
+        for _, form_id, form in changes:
+            if form is None:
+                writer.writerow(["delete", form_id] + [""] * (len(EXPORT_COLUMNS) - 1))
+            else:
+                writer.writerow(["upsert"] + [form[column] for column in EXPORT_COLUMNS])
+            count += 1
+    return count
+
+
+def _write_jsonl(filename, compress, changes):
+    count = 0
+    with _open_output(filename, compress) as file:
+        for _, form_id, form in changes:
+            if form is None:
+                record = {"op": "delete", "id": form_id}
+            else:
+                record = {"op": "upsert", **{column: form[column] for column in EXPORT_COLUMNS}}
+            file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def _write_columns(filename, compress, changes):
+    # Колоночный формат: один JSON-объект, где каждая колонка — отдельный массив.
+    # Всегда сжимается gzip: одинаковые значения в колонке сжимаются очень хорошо
+    columns = {"op": [], **{column: [] for column in EXPORT_COLUMNS}}
+    for _, form_id, form in changes:
+        columns["op"].append("delete" if form is None else "upsert")
+        for column in EXPORT_COLUMNS:
+            if form is None:
+                columns[column].append(form_id if column == "id" else None)
+            else:
+                columns[column].append(form[column])
+
+    with _open_output(filename, True) as file:
+        json.dump({"columns": list(columns), "data": columns}, file, ensure_ascii=False)
+    return len(columns["op"])
+
+
+_WRITERS = {
+    "csv": _write_csv,
+    "jsonl": _write_jsonl,
+    "columns": _write_columns,
+}
+
+
+def export_incremental(filename, fmt="jsonl", name="default", compress=None):
+    """Выгрузить только анкеты, изменённые с прошлой выгрузки name.
+
+    Удалённые анкеты попадают в файл как записи op=delete.
+    Отметка сдвигается только после того, как файл успешно записан.
+    Возвращает количество записей в файле."""
+    if fmt not in _WRITERS:
+        raise ValueError(f"Неизвестный формат выгрузки: {fmt}")
+    if compress is None:
+        compress = filename.endswith(".gz")
+
+    conn = open_connection()
+    try:
+        since = get_export_watermark(name, conn)
+        until = get_last_change_id(conn)
+
+        if until <= since:
+            print("Новых изменений нет.")
+            return 0
+
+        count = _WRITERS[fmt](filename, compress, iter_form_changes(since, until, conn))
+        set_export_watermark(name, until, conn)
+    finally:
+        conn.close()
+
+    print(f"Инкрементальный экспорт завершён ({count} записей). Файл: {filename}")
+    return count
 
 
 if __name__ == "__main__":
-    export_to_csv()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Выгрузка анкет")
+    parser.add_argument("filename", nargs="?", default=None)
+    parser.add_argument("--incremental", action="store_true", help="только изменения с прошлой выгрузки")
+    parser.add_argument("--format", choices=FORMATS, default="jsonl", help="формат инкрементальной выгрузки")
+    parser.add_argument("--name", default="default", help="имя отметки инкрементальной выгрузки")
+    args = parser.parse_args()
+
+    if args.incremental:
+        export_incremental(args.filename or f"forms_changes.{args.format}.gz", args.format, args.name)
+    else:
+        export_to_csv(args.filename or "forms_export.csv")
\ No newline at end of file
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import time
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage
+
+from async_db import load_fsm_session, save_fsm_sessions, delete_expired_fsm_sessions
+from cache import TTLCache
+
+# Изменения копятся в памяти и пишутся в базу одной транзакцией раз в интервал
+FSM_FLUSH_INTERVAL = 1
+
+# Сессии, не менявшиеся сутки, считаем брошенными и удаляем
+FSM_SESSION_TTL = 24 * 3600
+FSM_SWEEP_INTERVAL = 3600
+
+# Горячие сессии читаются из памяти, а не с диска
+FSM_CACHE_SIZE = 10000
+FSM_CACHE_TTL = 600
+
+
+def _state_name(state):
+    return state.state if isinstance(state, State) else state
+
+
+class SQLiteStorage(BaseStorage):
+    """Хранилище FSM в той же базе SQLite, что и анкеты.
+
+    Чтения идут через кэш в памяти, записи копятся и сбрасываются пачкой
+    раз в FSM_FLUSH_INTERVAL секунд, поэтому при падении процесса можно
+    потерять не больше последней секунды изменений. При штатной остановке
+    close() дописывает всё накопленное."""
+
+    def __init__(self):
+        self._cache = TTLCache(maxsize=FSM_CACHE_SIZE, ttl=FSM_CACHE_TTL)
+        self._dirty = {}
+        self._tasks = []
+        self.stats = {"flushes": 0, "written": 0, "swept": 0}
+
+    def start(self):
+        self._tasks.append(asyncio.create_task(self._flush_loop()))
+        self._tasks.append(asyncio.create_task(self._sweep_loop()))
+
+    @staticmethod
+    def _key(key):
+        return ":".join(str(part) for part in (
+            key.bot_id, key.chat_id, key.user_id,
+            key.thread_id or "", key.business_connection_id or "", key.destiny
+        ))
+
+    async def _load(self, key):
+        """Вернуть (state, data) сессии: из несброшенных изменений, кэша или базы"""
+        if key in self._dirty:
+            state, data, _ = self._dirty[key]
+            return state, data
+
+        session = self._cache.get(key, None)
+        if session is None:
+            row = await load_fsm_session(key)
+            session = (row[0], row[1]) if row else (None, {})
+            # Пока ждали базу, сессию могли изменить — свежие данные важнее
+            if key in self._dirty:
+                state, data, _ = self._dirty[key]
+                return state, data
+            self._cache.set(key, session)
+        return session
+
+    def _store(self, key, state, data):
+        self._cache.set(key, (state, data))
+        self._dirty[key] = (state, data, time.time())
+
+    async def set_state(self, key, state=None):
+        key = self._key(key)
+        _, data = await self._load(key)
+        self._store(key, _state_name(state), data)
+
+    async def get_state(self, key):
+        state, _ = await self._load(self._key(key))
+        return state
+
+    async def set_data(self, key, data):
+        key = self._key(key)
+        state, _ = await self._load(key)
+        self._store(key, state, dict(data))
+
+    async def get_data(self, key):
+        _, data = await self._load(self._key(key))
+        return dict(data)
+
+    async def flush(self):
+        """Записать накопленные изменения в базу"""
+        if not self._dirty:
+            return
+
+        dirty, self._dirty = self._dirty, {}
+        try:
+            await save_fsm_sessions([(key, *session) for key, session in dirty.items()])
+        except Exception:
+            # Вернём изменения назад, не затирая более свежие
+            for key, session in dirty.items():
+                self._dirty.setdefault(key, session)
+            raise
+
+        self.stats["flushes"] += 1
+        self.stats["written"] += len(dirty)
+
+    async def sweep(self):
+        """Удалить брошенные сессии из базы и просроченные записи из кэша"""
+        await self.flush()
+        removed = await delete_expired_fsm_sessions(time.time() - FSM_SESSION_TTL)
+        self._cache.expire()
+        self.stats["swept"] += removed
+        if removed:
+            logging.info(f"Удалено брошенных сессий FSM: {removed}")
+        return removed
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(FSM_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Не удалось сохранить состояния FSM: {e}")
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(FSM_SWEEP_INTERVAL)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logging.error(f"Не удалось очистить сессии FSM: {e}")
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        await self.flush()
\ No newline at end of file
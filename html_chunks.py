@@ -0,0 +1,136 @@
+import re
+
+# Лимит Telegram на длину сообщения. Считаем с разметкой и в UTF-16,
+# как считает Telegram, так что реальный текст всегда получается короче
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+_TOKEN_RE = re.compile(r"(<[^>]+>|&#?\w+;)")
+_TAG_RE = re.compile(r"<(/?)([a-zA-Z-]+)[^>]*>")
+
+
+def message_length(text):
+    """Длина текста в единицах UTF-16"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def split_html(text, limit=TELEGRAM_MESSAGE_LIMIT):
+    """Разбить HTML-текст на части не длиннее limit.
+
+    Теги и HTML-сущности не разрезаются. Открытые теги закрываются в конце
+    части и заново открываются в начале следующей, чтобы каждая часть
+    оставалась валидной для parse_mode="HTML"."""
+    if message_length(text) <= limit:
+        return [text]
+
+    parts = []
+    open_tags = []  # (имя, открывающий тег)
+    current = ""
+    current_len = 0
+
+    def closing():
+        return "".join(f"</{name}>" for name, _ in reversed(open_tags))
+
+    def flush():
+        nonlocal current, current_len
+        # Часть из одних тегов Telegram не примет как пустое сообщение.
+        # Сущности — это текст: часть из одних &lt; выбрасывать нельзя
+        if _TAG_RE.sub("", current).strip():
+            parts.append(current + closing())
+        current = "".join(tag for _, tag in open_tags)
+        current_len = message_length(current)
+
+    for token in _TOKEN_RE.split(text):
+        if not token:
+            continue
+
+        tag = _TAG_RE.fullmatch(token)
+        if tag or token.startswith("&"):
+            # Тег или сущность целиком, с запасом на закрывающие теги
+            reserve = message_length(closing())
+            if tag and not tag.group(1):
+                reserve += len(tag.group(2)) + 3
+            if current_len + message_length(token) + reserve > limit:
+                flush()
+            current += token
+            current_len += message_length(token)
+
+            if tag and tag.group(1):
+                if open_tags and open_tags[-1][0] == tag.group(2):
+                    open_tags.pop()
+            elif tag:
+                open_tags.append((tag.group(2), token))
+            continue
+
+        # Обычный текст режем посимвольно, стараясь попасть на перевод строки
+        while token:
+            room = limit - current_len - message_length(closing())
+            if message_length(token) <= room:
+                current += token
+                current_len += message_length(token)
+                break
+
+            cut = 0
+            size = 0
+            for index, char in enumerate(token):
+                size += 2 if ord(char) > 0xFFFF else 1
+                if size > room:
+                    break
+                cut = index + 1
+
+            newline = token.rfind("\n", 0, cut)
+            if newline > 0:
+                cut = newline + 1
+
+            if cut == 0:
+                # Места нет даже на один символ: начинаем новую часть
+                if current_len > message_length("".join(tag for _, tag in open_tags)):
+                    flush()
+                    continue
+                cut = 1
+
+            current += token[:cut]
+            token = token[cut:]
+            if token:
+                flush()
+
+    flush()
+    return parts
+
+
+def iter_chunks(records, header="", limit=TELEGRAM_MESSAGE_LIMIT):
+    """Склеить отрендеренные записи в сообщения не длиннее limit.
+
+    records может быть генератором: первое сообщение отдаётся, как только
+    набралось, пока остальные записи ещё не отрендерены. Записи не
+    разрываются между сообщениями, если только одна запись сама по себе
+    не превышает лимит — тогда она режется через split_html."""
+    current = ""
+    current_len = 0
+    pending_header = header
+
+    for record in records:
+        if pending_header:
+            # Заголовок приклеиваем к первой записи, чтобы не слать его отдельно
+            record = pending_header + record
+            pending_header = ""
+        record_len = message_length(record)
+
+        if current_len + record_len <= limit:
+            current += record
+            current_len += record_len
+            continue
+
+        if current:
+            yield current
+
+        if record_len <= limit:
+            current = record
+            current_len = record_len
+            continue
+
+        *full, current = split_html(record, limit)
+        yield from full
+        current_len = message_length(current)
+
+    if current:
+        yield current
\ No newline at end of file
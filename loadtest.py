@@ -0,0 +1,292 @@
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+from aiogram.methods import EditMessageText, SendMessage
+from aiogram.types import Chat, Message, Update
+
+# Нагрузочный прогон бота без Telegram: синтетические обновления идут прямо
+# в dp.feed_update, а запросы к Bot API отвечает FakeTelegram. База — временная.
+#
+#   python loadtest.py --users 2000 --concurrency 200
+#   python loadtest.py --users 500 --min-rate 300 --max-p95 50   # как проверка в CI
+#   python loadtest.py --slow-write 200 --max-loop-lag 20  # чужая долгая запись в базу
+
+
+class FakeTelegram:
+    """Подменяет сетевой запрос сессии бота: отвечает сразу (или через latency)
+    и запоминает карточки анкет, пришедшие в админ-группу, чтобы «админ»
+    мог нажать на них «Принять»"""
+
+    def __init__(self, admin_group_id, latency=0.0):
+        self.admin_group_id = admin_group_id
+        self.latency = latency
+        self.requests = 0
+        self._cards = {}
+        self._message_ids = itertools.count(1)
+
+    def card(self, user_id):
+        """Future с (callback_data, message_id, text) карточки анкеты пользователя"""
+        if user_id not in self._cards:
+            self._cards[user_id] = asyncio.get_running_loop().create_future()
+        return self._cards[user_id]
+
+    async def make_request(self, bot, method, timeout=None):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if not isinstance(method, (SendMessage, EditMessageText)):
+            return True
+
+        message_id = getattr(method, "message_id", None) or next(self._message_ids)
+        chat_type = "private" if method.chat_id > 0 else "group"
+
+        if method.chat_id == self.admin_group_id and method.reply_markup:
+            for row in method.reply_markup.inline_keyboard:
+                for button in row:
+                    if button.callback_data and button.callback_data.startswith("accept_"):
+                        card = self.card(int(button.callback_data.split("_")[1]))
+                        if not card.done():
+                            card.set_result((button.callback_data, message_id, method.text))
+
+        return Message(
+            message_id=message_id, date=0,
+            chat=Chat(id=method.chat_id, type=chat_type, title="admins" if chat_type == "group" else None),
+            text=method.text
+        )
+
+
+class SlowWriter:
+    """Долгая запись из другого соединения, как у соседнего процесса: раз в
+    period секунд берёт блокировку записи forms.db и держит её hold секунд"""
+
+    def __init__(self, path, hold, period=1.0):
+        self.path = path
+        self.hold = hold
+        self.period = period
+        self.writes = 0
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="slow-writer", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self._thread.join()
+
+    def _run(self):
+        conn = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+        try:
+            while not self._stopping.wait(max(0.0, self.period - self.hold)):
+                conn.execute("BEGIN IMMEDIATE")
+                time.sleep(self.hold)
+                conn.execute("COMMIT")
+                self.writes += 1
+        finally:
+            conn.close()
+
+
+async def _measure_loop_lag(lags, interval=0.001):
+    """Насколько позже положенного просыпается event loop: если его
+    блокирует синхронный вызов, это сразу видно здесь"""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+class LoadTest:
+    def __init__(self, app, fake, admin_id):
+        self.app = app
+        self.fake = fake
+        self.admin_id = admin_id
+        self.latencies = []
+        self._update_ids = itertools.count(1)
+
+    async def feed(self, event_type, event):
+        update = Update.model_validate(
+            {"update_id": next(self._update_ids), event_type: event},
+            context={"bot": self.app.bot}
+        )
+        started = time.perf_counter()
+        await self.app.dp.feed_update(self.app.bot, update)
+        self.latencies.append(time.perf_counter() - started)
+
+    def _user(self, user_id):
+        return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+    async def message(self, user_id, text):
+        await self.feed("message", {
+            "message_id": next(self._update_ids), "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._user(user_id), "text": text
+        })
+
+    async def callback(self, user_id, data, chat_id=None, message_id=1, text="..."):
+        chat_id = chat_id or user_id
+        await self.feed("callback_query", {
+            "id": str(next(self._update_ids)), "chat_instance": "loadtest", "data": data,
+            "from": self._user(user_id),
+            "message": {
+                "message_id": message_id, "date": 0, "text": text,
+                "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group", "title": "admins"}
+            }
+        })
+
+    async def user_session(self, user_id):
+        """Анкета от /start до одобрения: заполнение, правка ника, «Принять» админом"""
+        app = self.app
+        await self.message(user_id, "/start")
+        await self.message(user_id, app.MENU_FILL_FORM)
+        for answer in (f"Игрок {user_id}", f"user{user_id}", f"mc_{user_id}", "Игрок", "20", "Нагрузочный тест"):
+            await self.message(user_id, answer)
+
+        await self.message(user_id, app.MENU_EDIT_FORM)
+        await self.callback(user_id, "edit_mc_nick")
+        await self.message(user_id, f"mc_{user_id}_new")
+
+        callback_data, message_id, text = await self.fake.card(user_id)
+        await self.callback(self.admin_id, callback_data, app.ADMIN_GROUP_ID, message_id, text)
+
+
+def _percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def _db_calls(metrics):
+    return sum(count for count, _, _ in metrics.registry.histograms("bot_db_seconds").values())
+
+
+async def run(args):
+    import sender
+    # Лимиты Telegram ограничили бы прогон скоростью ведра токенов, а не бота
+    sender.GLOBAL_RATE = sender.PRIVATE_CHAT_RATE = sender.GROUP_CHAT_RATE = 1e9
+
+    import bot as app
+    import metrics
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    fake = FakeTelegram(app.ADMIN_GROUP_ID, args.api_latency / 1000)
+    app.bot.session.make_request = fake.make_request
+
+    await app.start_services(metrics_port=0)
+    test = LoadTest(app, fake, app.ADMIN_IDS[0])
+    db_calls_before = _db_calls(metrics)
+
+    slow_writer = None
+    if args.slow_write:
+        slow_writer = SlowWriter(os.path.abspath("forms.db"), args.slow_write / 1000)
+        slow_writer.start()
+    loop_lags = []
+    lag_probe = asyncio.create_task(_measure_loop_lag(loop_lags))
+
+    limit = asyncio.Semaphore(args.concurrency)
+
+    async def limited(user_id):
+        async with limit:
+            await test.user_session(user_id)
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(limited(1_000_000 + index) for index in range(args.users)))
+        elapsed = time.perf_counter() - started
+    finally:
+        lag_probe.cancel()
+        if slow_writer:
+            slow_writer.stop()
+        # Дописываем отложенное (FSM, правки карточек), чтобы учесть и эти запросы к БД
+        await app.dp.emit_shutdown(bot=app.bot)
+        await app.stop_services()
+
+    latencies = sorted(test.latencies)
+    updates = len(latencies)
+    rate = updates / elapsed
+    p95 = _percentile(latencies, 0.95) * 1000
+    p99 = _percentile(latencies, 0.99) * 1000
+    loop_lags.sort()
+    loop_lag = loop_lags[-1] * 1000 if loop_lags else 0.0
+    db_per_update = (_db_calls(metrics) - db_calls_before) / updates
+
+    print(f"Пользователей: {args.users}, одновременно: {args.concurrency}")
+    print(f"Обновлений: {updates} за {elapsed:.2f} с — {rate:.0f} обновлений/с")
+    print(
+        f"Задержка, мс: p50 {_percentile(latencies, 0.5) * 1000:.2f}, p95 {p95:.2f}, "
+        f"p99 {p99:.2f}, max {latencies[-1] * 1000:.2f}"
+    )
+    if loop_lags:
+        print(f"Запаздывание event loop, мс: p99 {_percentile(loop_lags, 0.99) * 1000:.2f}, max {loop_lag:.2f}")
+    if slow_writer:
+        print(f"Долгих записей по {args.slow_write:g} мс: {slow_writer.writes}")
+    print(f"Запросов к БД на обновление: {db_per_update:.2f}")
+    print(f"Запросов к Bot API: {fake.requests}")
+
+    handlers = metrics.registry.histograms("bot_handler_seconds")
+    print("Самые медленные обработчики (p95, мс):")
+    for labels, (count, _, handler_p95) in sorted(handlers.items(), key=lambda item: item[1][2], reverse=True)[:5]:
+        print(f"  {dict(labels)['handler']}: {handler_p95 * 1000:g} ({count} вызовов)")
+
+    failures = []
+    if args.min_rate and rate < args.min_rate:
+        failures.append(f"пропускная способность {rate:.0f} < {args.min_rate}")
+    if args.max_p95 and p95 > args.max_p95:
+        failures.append(f"p95 {p95:.2f} мс > {args.max_p95}")
+    if args.max_p99 and p99 > args.max_p99:
+        failures.append(f"p99 {p99:.2f} мс > {args.max_p99}")
+    if args.max_loop_lag and loop_lag > args.max_loop_lag:
+        failures.append(f"запаздывание event loop {loop_lag:.2f} мс > {args.max_loop_lag}")
+    if args.max_db_ops and db_per_update > args.max_db_ops:
+        failures.append(f"запросов к БД на обновление {db_per_update:.2f} > {args.max_db_ops}")
+
+    for failure in failures:
+        print(f"ПРОВАЛ: {failure}")
+    return not failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон бота на синтетических обновлениях")
+    parser.add_argument("--users", type=int, default=1000, help="сколько пользователей пройдут анкету")
+    parser.add_argument("--concurrency", type=int, default=100, help="сколько пользователей одновременно")
+    parser.add_argument("--api-latency", type=float, default=0, help="задержка ответа Bot API, мс")
+    parser.add_argument("--min-rate", type=float, default=0, help="минимум обновлений в секунду")
+    parser.add_argument("--max-p95", type=float, default=0, help="максимум p95 задержки, мс")
+    parser.add_argument("--max-p99", type=float, default=0, help="максимум p99 задержки, мс")
+    parser.add_argument("--max-loop-lag", type=float, default=0, help="максимум запаздывания event loop, мс")
+    parser.add_argument(
+        "--slow-write", type=float, default=0,
+        help="раз в секунду держать блокировку записи базы столько мс из другого соединения"
+    )
+    parser.add_argument("--max-db-ops", type=float, default=0, help="максимум запросов к БД на обновление")
+    parser.add_argument("--keep-db", action="store_true", help="не удалять временную базу")
+    parser.add_argument("--verbose", action="store_true", help="не глушить логи бота")
+    args = parser.parse_args()
+
+    # database создаёт forms.db в текущем каталоге при импорте,
+    # поэтому переходим во временный каталог до импорта бота
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    workdir = tempfile.mkdtemp(prefix="anketolog-loadtest-")
+    os.chdir(workdir)
+    try:
+        ok = asyncio.run(run(args))
+    finally:
+        if args.keep_db:
+            print(f"База прогона: {os.path.join(workdir, 'forms.db')}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
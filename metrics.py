@@ -0,0 +1,230 @@
+import bisect
+import logging
+import threading
+import time
+
+from aiohttp import web
+
+# Границы корзин гистограмм задержек (секунды)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Оценка квантиля по корзинам (верхняя граница корзины)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    """Счётчики и гистограммы задержек в памяти процесса.
+
+    Пишут в них и event loop, и поток БД, поэтому всё под одним замком.
+    render() отдаёт текстовый формат Prometheus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}  # имя -> {метки: Histogram}
+        self._counters = {}  # имя -> {метки: число}
+        self._collectors = []  # (имя, тип, метка, функция)
+        self._help = {}
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def observe(self, name, seconds, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def collect(self, name, func, kind="gauge", label="kind"):
+        """Снимать значение func() в момент выдачи метрик.
+
+        func возвращает число или словарь {значение метки label: число} —
+        так без изменений подключаются уже существующие словари stats"""
+        self._collectors.append((name, kind, label, func))
+
+    def histograms(self, name):
+        """Копия серий гистограммы: {метки: (count, sum, p95)}"""
+        with self._lock:
+            return {
+                labels: (histogram.count, histogram.sum, histogram.quantile(0.95))
+                for labels, histogram in self._histograms.get(name, {}).items()
+            }
+
+    def counters(self, name):
+        with self._lock:
+            return dict(self._counters.get(name, {}))
+
+    def render(self):
+        lines = []
+
+        def header(name, kind):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for name, series in sorted(self._histograms.items()):
+                header(name, "histogram")
+                for labels, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(LATENCY_BUCKETS, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+
+            for name, series in sorted(self._counters.items()):
+                header(name, "counter")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for name, kind, label, func in self._collectors:
+            try:
+                values = func()
+            except Exception as e:
+                logging.error(f"Не удалось снять метрику {name}: {e}")
+                continue
+            header(name, kind)
+            if isinstance(values, dict):
+                for key, value in values.items():
+                    lines.append(f"{name}{_format_labels(((label, key),))} {value}")
+            else:
+                lines.append(f"{name} {values}")
+
+        return "\n".join(lines) + "\n"
+
+
+registry = Metrics()
+
+registry.describe("bot_update_seconds", "Время обработки обновления по типу")
+registry.describe("bot_update_errors_total", "Обновления, обработка которых упала, по типу")
+registry.describe("bot_handler_seconds", "Время работы обработчика")
+registry.describe("bot_handler_errors_total", "Исключения в обработчиках")
+registry.describe("bot_db_seconds", "Время выполнения функций database.py в потоке БД")
+registry.describe("bot_db_errors_total", "Исключения в функциях database.py")
+registry.describe("bot_telegram_request_seconds", "Время запроса к Bot API по методу")
+registry.describe("bot_telegram_requests_total", "Запросы к Bot API по методу")
+registry.describe("bot_telegram_errors_total", "Ошибки запросов к Bot API по методу")
+
+
+def timed_call(func, *args, **kwargs):
+    """Вызвать функцию БД, записав время и ошибки"""
+    started = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    except Exception:
+        registry.inc("bot_db_errors_total", function=func.__name__)
+        raise
+    finally:
+        registry.observe("bot_db_seconds", time.perf_counter() - started, function=func.__name__)
+
+
+def _handler_name(data):
+    # У обработчиков из routing.LookupRouter настоящая функция лежит в route_handler
+    handler = data.get("route_handler") or data.get("handler")
+    callback = getattr(handler, "callback", None)
+    return getattr(callback, "__name__", "unknown")
+
+
+async def update_middleware(handler, update, data):
+    """Внешний middleware диспетчера: время и ошибки по типу обновления"""
+    started = time.perf_counter()
+    try:
+        return await handler(update, data)
+    except Exception:
+        registry.inc("bot_update_errors_total", type=update.event_type)
+        raise
+    finally:
+        registry.observe("bot_update_seconds", time.perf_counter() - started, type=update.event_type)
+
+
+async def handler_middleware(handler, event, data):
+    """Внутренний middleware: вызывается, когда обработчик уже выбран"""
+    name = _handler_name(data)
+    started = time.perf_counter()
+    try:
+        return await handler(event, data)
+    except Exception:
+        registry.inc("bot_handler_errors_total", handler=name)
+        raise
+    finally:
+        registry.observe("bot_handler_seconds", time.perf_counter() - started, handler=name)
+
+
+async def request_middleware(make_request, bot, method):
+    """Middleware сессии бота: каждый запрос к Bot API"""
+    name = type(method).__name__
+    registry.inc("bot_telegram_requests_total", method=name)
+    started = time.perf_counter()
+    try:
+        return await make_request(bot, method)
+    except Exception:
+        registry.inc("bot_telegram_errors_total", method=name)
+        raise
+    finally:
+        registry.observe("bot_telegram_request_seconds", time.perf_counter() - started, method=name)
+
+
+def setup(dp, bot):
+    """Подключить middleware к диспетчеру и сессии бота"""
+    dp.update.outer_middleware(update_middleware)
+    for name, observer in dp.observers.items():
+        if name not in ("update", "error"):
+            observer.middleware(handler_middleware)
+    bot.session.middleware(request_middleware)
+
+
+async def start_server(host, port):
+    """HTTP-сервер с GET /metrics в формате Prometheus"""
+    async def handle(request):
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
\ No newline at end of file
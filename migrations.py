@@ -0,0 +1,565 @@
+import logging
+
+# Версия схемы хранится в PRAGMA user_version.
+# Миграция N переводит базу из версии N-1 в версию N.
+# Уже выпущенные миграции не меняем — только добавляем новые в конец списка.
+
+
+# Нужна и миграции, и database.py при каждой записи ника
+def normalize_handle(value):
+    """Ключ для поиска дублей ника и username: без пробелов по краям
+    и «@» в начале, без учёта регистра. None, если сравнивать нечего"""
+    if value is None:
+        return None
+    return value.strip().lstrip("@").casefold() or None
+
+
+FORMS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        name TEXT,
+        tg_username TEXT,
+        mc_nick TEXT,
+        call_as TEXT,
+        age INTEGER,
+        extra TEXT,
+        status TEXT DEFAULT 'pending',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        edited_at TIMESTAMP,
+        is_edited INTEGER DEFAULT 0,
+        admin_message_id INTEGER
+    )
+"""
+
+
+def _create_base_tables(cur):
+    cur.execute(FORMS_TABLE_SQL.format(table="forms"))
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS banned_users (
+            user_id INTEGER PRIMARY KEY,
+            banned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def _upgrade_old_forms(cur):
+    # Старые базы создавались без created_at и полей редактирования.
+    # ALTER TABLE не умеет добавлять колонку с DEFAULT CURRENT_TIMESTAMP,
+    # поэтому такую таблицу пересобираем целиком
+    cur.execute("PRAGMA table_info(forms)")
+    columns = [row[1] for row in cur.fetchall()]
+    if "admin_message_id" in columns and "created_at" in columns:
+        return
+
+    cur.execute(FORMS_TABLE_SQL.format(table="forms_new"))
+    common = ", ".join(columns)
+    cur.execute(f"INSERT INTO forms_new ({common}) SELECT {common} FROM forms")
+    cur.execute("DROP TABLE forms")
+    cur.execute("ALTER TABLE forms_new RENAME TO forms")
+
+
+def _add_forms_indexes(cur):
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_forms_user_id ON forms (user_id, id DESC)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_forms_status ON forms (status)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_forms_created_at ON forms (created_at)")
+
+
+def _add_ban_list_version(cur):
+    # Счётчик изменений бан-листа: по нему другие процессы бота
+    # понимают, что их кэш забаненных устарел
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS ban_list_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    """)
+    cur.execute("INSERT OR IGNORE INTO ban_list_version (id, version) VALUES (1, 0)")
+
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS banned_users_{event.lower()}_version
+            AFTER {event} ON banned_users
+            BEGIN
+                UPDATE ban_list_version SET version = version + 1 WHERE id = 1;
+            END
+        """)
+
+
+def _add_edited_forms_index(cur):
+    # Частичный индекс для фильтра «только отредактированные» в /forms
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_forms_edited ON forms (id) WHERE is_edited = 1")
+
+
+def _add_form_changes_log(cur):
+    # Журнал изменений анкет для инкрементальной выгрузки: каждая вставка,
+    # правка и удаление получают возрастающий номер изменения
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS form_changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            form_id INTEGER NOT NULL,
+            op TEXT NOT NULL
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_form_changes_form_id ON form_changes (form_id)")
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS export_watermarks (
+            name TEXT PRIMARY KEY,
+            last_change_id INTEGER NOT NULL,
+            exported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS forms_insert_change AFTER INSERT ON forms
+        BEGIN
+            INSERT INTO form_changes (form_id, op) VALUES (NEW.id, 'upsert');
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS forms_update_change AFTER UPDATE ON forms
+        BEGIN
+            INSERT INTO form_changes (form_id, op) VALUES (NEW.id, 'upsert');
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS forms_delete_change AFTER DELETE ON forms
+        BEGIN
+            INSERT INTO form_changes (form_id, op) VALUES (OLD.id, 'delete');
+        END
+    """)
+
+    # Уже существующие анкеты попадут в первую инкрементальную выгрузку
+    cur.execute("INSERT INTO form_changes (form_id, op) SELECT id, 'upsert' FROM forms ORDER BY id")
+
+
+def _add_broadcasts(cur):
+    # Рассылки с контрольной точкой: после рестарта продолжаем с last_user_id
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT NOT NULL,
+            status TEXT DEFAULT 'running',
+            total INTEGER DEFAULT 0,
+            sent INTEGER DEFAULT 0,
+            failed INTEGER DEFAULT 0,
+            last_user_id INTEGER DEFAULT 0,
+            progress_message_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    """)
+
+    # Пользователи, заблокировавшие бота: следующие рассылки их пропускают
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS blocked_users (
+            user_id INTEGER PRIMARY KEY,
+            blocked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Получатели выбираются по статусу и перебираются по user_id
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_forms_status_user_id ON forms (status, user_id)")
+
+
+def _add_fsm_sessions(cur):
+    # Состояния FSM (незаконченные анкеты и т.п.) переживают рестарт бота
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS fsm_sessions (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT,
+            updated_at REAL NOT NULL
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_fsm_sessions_updated_at ON fsm_sessions (updated_at)")
+
+
+def _add_form_outbox(cur):
+    # Уведомления об анкетах для админ-группы: строка пишется в одной
+    # транзакции с анкетой и удаляется, когда сообщение доставлено
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS form_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            form_id INTEGER NOT NULL UNIQUE,
+            attempts INTEGER DEFAULT 0,
+            next_attempt_at REAL DEFAULT 0,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_form_outbox_next_attempt ON form_outbox (next_attempt_at)")
+
+
+def _add_forms_search(cur):
+    # Полнотекстовый поиск по анкетам. Токенизатор trigram ищет любые
+    # подстроки от трёх символов — кусок ника находится так же, как целое слово.
+    # Таблица хранит только индекс, сами тексты берутся из forms
+    cur.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS forms_fts USING fts5(
+            name, tg_username, mc_nick, call_as, extra,
+            content='forms', content_rowid='id', tokenize='trigram'
+        )
+    """)
+
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS forms_fts_insert AFTER INSERT ON forms
+        BEGIN
+            INSERT INTO forms_fts (rowid, name, tg_username, mc_nick, call_as, extra)
+            VALUES (NEW.id, NEW.name, NEW.tg_username, NEW.mc_nick, NEW.call_as, NEW.extra);
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS forms_fts_delete AFTER DELETE ON forms
+        BEGIN
+            INSERT INTO forms_fts (forms_fts, rowid, name, tg_username, mc_nick, call_as, extra)
+            VALUES ('delete', OLD.id, OLD.name, OLD.tg_username, OLD.mc_nick, OLD.call_as, OLD.extra);
+        END
+    """)
+    # Смена статуса или admin_message_id индекс не трогает
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS forms_fts_update
+        AFTER UPDATE OF name, tg_username, mc_nick, call_as, extra ON forms
+        BEGIN
+            INSERT INTO forms_fts (forms_fts, rowid, name, tg_username, mc_nick, call_as, extra)
+            VALUES ('delete', OLD.id, OLD.name, OLD.tg_username, OLD.mc_nick, OLD.call_as, OLD.extra);
+            INSERT INTO forms_fts (rowid, name, tg_username, mc_nick, call_as, extra)
+            VALUES (NEW.id, NEW.name, NEW.tg_username, NEW.mc_nick, NEW.call_as, NEW.extra);
+        END
+    """)
+
+    cur.execute("INSERT INTO forms_fts (forms_fts) VALUES ('rebuild')")
+
+
+def _add_form_stats(cur):
+    # Счётчики для /stats ведут триггеры: ответ — чтение пары строк,
+    # а не COUNT(*) по всей таблице анкет
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS form_stats (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    # Гистограмма по дням: поданные анкеты (по created_at) и решения
+    # админов (по дню решения) с суммарным временем рассмотрения
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS form_stats_daily (
+            day TEXT PRIMARY KEY,
+            submitted INTEGER NOT NULL DEFAULT 0,
+            accepted INTEGER NOT NULL DEFAULT 0,
+            rejected INTEGER NOT NULL DEFAULT 0,
+            moderated INTEGER NOT NULL DEFAULT 0,
+            moderation_seconds INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+    # Текущее число анкет по статусам и отредактированных
+    cur.execute("""
+        INSERT OR REPLACE INTO form_stats (name, value)
+        SELECT status, COUNT(*) FROM forms GROUP BY status
+    """)
+    cur.execute("""
+        INSERT OR REPLACE INTO form_stats (name, value)
+        SELECT 'edited', COUNT(*) FROM forms WHERE is_edited = 1
+    """)
+    # Отклонённые анкеты удаляются, поэтому число отказов копится
+    # отдельно и начинается с нуля; одобрения — с уже одобренных
+    cur.execute("""
+        INSERT OR REPLACE INTO form_stats (name, value)
+        SELECT 'accepted_total', COUNT(*) FROM forms WHERE status = 'accepted'
+    """)
+    cur.execute("INSERT OR IGNORE INTO form_stats (name, value) VALUES ('rejected_total', 0)")
+    cur.execute("""
+        INSERT OR REPLACE INTO form_stats_daily (day, submitted)
+        SELECT date(created_at), COUNT(*) FROM forms GROUP BY date(created_at)
+    """)
+
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS form_stats_insert AFTER INSERT ON forms
+        BEGIN
+            INSERT INTO form_stats (name, value) VALUES (NEW.status, 1)
+            ON CONFLICT (name) DO UPDATE SET value = value + 1;
+            UPDATE form_stats SET value = value + 1 WHERE name = 'edited' AND NEW.is_edited = 1;
+            INSERT INTO form_stats_daily (day, submitted) VALUES (date(NEW.created_at), 1)
+            ON CONFLICT (day) DO UPDATE SET submitted = submitted + 1;
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS form_stats_delete AFTER DELETE ON forms
+        BEGIN
+            UPDATE form_stats SET value = value - 1 WHERE name = OLD.status;
+            UPDATE form_stats SET value = value - 1 WHERE name = 'edited' AND OLD.is_edited = 1;
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS form_stats_edited
+        AFTER UPDATE OF is_edited ON forms WHEN OLD.is_edited IS NOT NEW.is_edited
+        BEGIN
+            UPDATE form_stats SET value = value + (CASE WHEN NEW.is_edited = 1 THEN 1 ELSE -1 END)
+            WHERE name = 'edited';
+        END
+    """)
+    # Решение админа — смена статуса. Время рассмотрения считаем
+    # только для решений по ожидающей анкете: от подачи до решения
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS form_stats_status
+        AFTER UPDATE OF status ON forms WHEN OLD.status IS NOT NEW.status
+        BEGIN
+            UPDATE form_stats SET value = value - 1 WHERE name = OLD.status;
+            INSERT INTO form_stats (name, value) VALUES (NEW.status, 1)
+            ON CONFLICT (name) DO UPDATE SET value = value + 1;
+            UPDATE form_stats SET value = value + 1 WHERE name = NEW.status || '_total';
+
+            INSERT INTO form_stats_daily (day, accepted, rejected, moderated, moderation_seconds)
+            SELECT
+                date('now'),
+                NEW.status = 'accepted',
+                NEW.status = 'rejected',
+                OLD.status = 'pending',
+                CASE WHEN OLD.status = 'pending'
+                     THEN CAST((julianday('now') - julianday(OLD.created_at)) * 86400 AS INTEGER)
+                     ELSE 0 END
+            WHERE true
+            ON CONFLICT (day) DO UPDATE SET
+                accepted = accepted + excluded.accepted,
+                rejected = rejected + excluded.rejected,
+                moderated = moderated + excluded.moderated,
+                moderation_seconds = moderation_seconds + excluded.moderation_seconds;
+        END
+    """)
+
+
+def _add_handle_keys(cur):
+    # Нормализованные ник и username для поиска дублей по индексу.
+    # Считаются в Python (casefold понимает не только латиницу)
+    cur.execute("ALTER TABLE forms ADD COLUMN mc_nick_key TEXT")
+    cur.execute("ALTER TABLE forms ADD COLUMN tg_username_key TEXT")
+    # Найденные при сохранении дубли: JSON {"mc_nick": [id, ...], ...}
+    cur.execute("ALTER TABLE forms ADD COLUMN duplicates TEXT")
+
+    # Заполнение ключей не меняет выгружаемых данных, поэтому
+    # на время заполнения не пишем его в журнал form_changes
+    cur.execute("DROP TRIGGER IF EXISTS forms_update_change")
+    cur.execute("SELECT id, mc_nick, tg_username FROM forms")
+    cur.executemany(
+        "UPDATE forms SET mc_nick_key = ?, tg_username_key = ? WHERE id = ?",
+        [(normalize_handle(mc_nick), normalize_handle(tg_username), form_id)
+         for form_id, mc_nick, tg_username in cur.fetchall()]
+    )
+    cur.execute("""
+        CREATE TRIGGER forms_update_change AFTER UPDATE ON forms
+        BEGIN
+            INSERT INTO form_changes (form_id, op) VALUES (NEW.id, 'upsert');
+        END
+    """)
+
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_forms_mc_nick_key ON forms (mc_nick_key)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_forms_tg_username_key ON forms (tg_username_key)")
+
+
+# Колонки анкеты, которые переносятся в архив и обратно. Новая колонка
+# в forms должна появиться и здесь, и (миграцией) в forms_archive
+ARCHIVE_COLUMNS = (
+    "id, user_id, name, tg_username, mc_nick, call_as, age, extra, status, "
+    "created_at, edited_at, is_edited, admin_message_id, mc_nick_key, tg_username_key, duplicates"
+)
+
+
+def _add_forms_archive(cur):
+    # Архив анкет, ушедших из рабочей таблицы: удалённых, отклонённых
+    # и одобренных анкет пользователей, давно заблокировавших бота.
+    # reason — почему анкета в архиве, по нему же действует срок хранения
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS forms_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            name TEXT,
+            tg_username TEXT,
+            mc_nick TEXT,
+            call_as TEXT,
+            age INTEGER,
+            extra TEXT,
+            status TEXT,
+            created_at TIMESTAMP,
+            edited_at TIMESTAMP,
+            is_edited INTEGER DEFAULT 0,
+            admin_message_id INTEGER,
+            mc_nick_key TEXT,
+            tg_username_key TEXT,
+            duplicates TEXT,
+            reason TEXT NOT NULL,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_forms_archive_user_id ON forms_archive (user_id, id DESC)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_forms_archive_mc_nick_key ON forms_archive (mc_nick_key)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_forms_archive_tg_username_key ON forms_archive (tg_username_key)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_forms_archive_reason ON forms_archive (reason, archived_at)")
+
+    # Любое удаление из forms оставляет копию в архиве. Перенос неактивных
+    # вставляет строку сам, до удаления, — тогда OR IGNORE её не трогает
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS forms_archive_delete AFTER DELETE ON forms
+        BEGIN
+            INSERT OR IGNORE INTO forms_archive ({ARCHIVE_COLUMNS}, reason)
+            SELECT {", ".join("OLD." + column.strip() for column in ARCHIVE_COLUMNS.split(","))},
+                   CASE OLD.status WHEN 'rejected' THEN 'rejected' ELSE 'deleted' END;
+        END
+    """)
+
+    # Возвращённая из архива анкета — не новая: в гистограмму подач её не пишем
+    cur.execute("DROP TRIGGER IF EXISTS form_stats_insert")
+    cur.execute("""
+        CREATE TRIGGER form_stats_insert AFTER INSERT ON forms
+        BEGIN
+            INSERT INTO form_stats (name, value) VALUES (NEW.status, 1)
+            ON CONFLICT (name) DO UPDATE SET value = value + 1;
+            UPDATE form_stats SET value = value + 1 WHERE name = 'edited' AND NEW.is_edited = 1;
+            INSERT INTO form_stats_daily (day, submitted)
+            SELECT date(NEW.created_at), 1
+            WHERE NOT EXISTS (SELECT 1 FROM forms_archive WHERE id = NEW.id)
+            ON CONFLICT (day) DO UPDATE SET submitted = submitted + 1;
+        END
+    """)
+
+    # Для переноса неактивных: кто и когда заблокировал бота
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_blocked_users_blocked_at ON blocked_users (blocked_at)")
+
+
+def _add_form_changes_user_id(cur):
+    # Чья анкета изменилась: по журналу другие процессы сбрасывают из кэша
+    # анкет только этих пользователей, а не весь кэш. Старым записям
+    # user_id не нужен — их уже прочитали все процессы
+    cur.execute("ALTER TABLE form_changes ADD COLUMN user_id INTEGER")
+
+    for trigger, event, row, op in (
+        ("forms_insert_change", "INSERT", "NEW", "upsert"),
+        ("forms_update_change", "UPDATE", "NEW", "upsert"),
+        ("forms_delete_change", "DELETE", "OLD", "delete"),
+    ):
+        cur.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        cur.execute(f"""
+            CREATE TRIGGER {trigger} AFTER {event} ON forms
+            BEGIN
+                INSERT INTO form_changes (form_id, user_id, op) VALUES ({row}.id, {row}.user_id, '{op}');
+            END
+        """)
+
+
+def _add_user_activity(cur):
+    # Когда пользователь последний раз писал боту. Одобренные анкеты тех,
+    # кто давно не заходил, уходят в архив (reason = 'idle')
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS user_activity (
+            user_id INTEGER PRIMARY KEY,
+            seen_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_user_activity_seen_at ON user_activity (seen_at)")
+
+    # До этой миграции активность не записывалась: берём последнее, что
+    # известно, — подачу или правку анкеты
+    cur.execute("""
+        INSERT OR IGNORE INTO user_activity (user_id, seen_at)
+        SELECT user_id, MAX(COALESCE(edited_at, created_at)) FROM forms
+        WHERE user_id IS NOT NULL
+        GROUP BY user_id
+    """)
+
+    # Участники с анкетой в архиве по-прежнему получают рассылки
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_forms_archive_reason_user_id ON forms_archive (reason, user_id)")
+
+
+def _log_member_archive_moves(cur):
+    # Перенос анкеты участника в архив за неактивность и возвращение оттуда
+    # (touch_user) — не удаление и не новая анкета: журнал пишет их как
+    # 'archive' и 'restore'. Выгрузки их пропускают, а кэш анкет других
+    # процессов по ним сбрасывается так же, как по любому изменению.
+    # Перенос кладёт строку в архив до удаления из forms, а возвращение
+    # удаляет её после вставки — по ней триггеры и отличают перенос
+    member_archived = "EXISTS (SELECT 1 FROM forms_archive WHERE id = {row}.id AND reason IN ('inactive', 'idle'))"
+
+    for trigger, event, row, op, member_op in (
+        ("forms_insert_change", "INSERT", "NEW", "upsert", "restore"),
+        ("forms_delete_change", "DELETE", "OLD", "delete", "archive"),
+    ):
+        cur.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        cur.execute(f"""
+            CREATE TRIGGER {trigger} AFTER {event} ON forms
+            BEGIN
+                INSERT INTO form_changes (form_id, user_id, op)
+                VALUES ({row}.id, {row}.user_id,
+                        CASE WHEN {member_archived.format(row=row)} THEN '{member_op}' ELSE '{op}' END);
+            END
+        """)
+
+
+def _add_archived_idle_stat(cur):
+    # Для /stats: сколько одобренных анкет лежит в архиве за неактивность.
+    # Триггеры forms_archive ведут счётчик, как form_stats_* для forms
+    cur.execute("""
+        INSERT OR REPLACE INTO form_stats (name, value)
+        SELECT 'archived_idle', COUNT(*) FROM forms_archive WHERE reason = 'idle'
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS form_stats_archive_insert
+        AFTER INSERT ON forms_archive WHEN NEW.reason = 'idle'
+        BEGIN
+            UPDATE form_stats SET value = value + 1 WHERE name = 'archived_idle';
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS form_stats_archive_delete
+        AFTER DELETE ON forms_archive WHEN OLD.reason = 'idle'
+        BEGIN
+            UPDATE form_stats SET value = value - 1 WHERE name = 'archived_idle';
+        END
+    """)
+
+
+MIGRATIONS = [
+    _create_base_tables,
+    _upgrade_old_forms,
+    _add_forms_indexes,
+    _add_ban_list_version,
+    _add_edited_forms_index,
+    _add_form_changes_log,
+    _add_broadcasts,
+    _add_fsm_sessions,
+    _add_form_outbox,
+    _add_forms_search,
+    _add_form_stats,
+    _add_handle_keys,
+    _add_forms_archive,
+    _add_form_changes_user_id,
+    _add_user_activity,
+    _log_member_archive_moves,
+    _add_archived_idle_stat,
+]
+
+
+def get_version(conn):
+    """Текущая версия схемы базы"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Применить все недостающие миграции, каждую в своей транзакции"""
+    version = get_version(conn)
+
+    for number in range(version + 1, len(MIGRATIONS) + 1):
+        migration = MIGRATIONS[number - 1]
+        cur = conn.cursor()
+        try:
+            cur.execute("BEGIN")
+            migration(cur)
+            cur.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logging.info(f"Применена миграция {number}: {migration.__name__}")
+
+    return get_version(conn)
\ No newline at end of file
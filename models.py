@@ -0,0 +1,43 @@
+from dataclasses import dataclass, fields
+
+
+@dataclass(slots=True)
+class Form:
+    """Анкета — строка таблицы forms.
+
+    Порядок полей совпадает с FORM_COLUMNS: курсор с row_factory=Form.from_row
+    собирает анкету из кортежа по позициям, без словаря имён колонок"""
+
+    id: int
+    user_id: int
+    name: str
+    tg_username: str
+    mc_nick: str
+    call_as: str
+    age: int
+    extra: str
+    status: str
+    created_at: str
+    edited_at: str
+    is_edited: int
+    admin_message_id: int
+    mc_nick_key: str
+    tg_username_key: str
+    duplicates: str
+
+    @classmethod
+    def from_row(cls, cursor, row):
+        return cls(*row)
+
+
+@dataclass(slots=True)
+class ArchivedForm(Form):
+    """Анкета из forms_archive: почему и когда её туда перенесли"""
+
+    reason: str
+    archived_at: str
+
+
+# Колонки для SELECT, из которого собирается Form
+FORM_COLUMNS = ", ".join(field.name for field in fields(Form))
+ARCHIVED_FORM_COLUMNS = ", ".join(field.name for field in fields(ArchivedForm))
\ No newline at end of file
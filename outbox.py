@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import time
+
+from async_db import get_outbox_batch, complete_outbox, retry_outbox, reconcile_outbox
+from config import ADMIN_GROUP_ID
+from sender import PRIORITY_ADMIN
+
+# Сколько уведомлений отправлять за один проход
+OUTBOX_BATCH_SIZE = 20
+
+# Как часто проверять outbox, если никто не разбудил (секунды)
+OUTBOX_POLL_INTERVAL = 5
+
+# Повторы после ошибки: 10 с, 20 с, 40 с... но не реже раза в 10 минут
+OUTBOX_RETRY_BASE = 10
+OUTBOX_RETRY_MAX = 600
+
+
+class OutboxDispatcher:
+    """Доставляет уведомления об анкетах из таблицы form_outbox в админ-группу.
+
+    Уведомление пишется в базу в одной транзакции с анкетой, поэтому
+    ни ошибка отправки, ни падение процесса не оставят анкету без карточки
+    у админов. Запись удаляется только после того, как сообщение ушло
+    и его ID сохранён в анкете. Если процесс упадёт между отправкой и
+    записью, после рестарта карточка уйдёт ещё раз — лучше дубль, чем потеря.
+
+    render(form) получает models.Form и возвращает (text, reply_markup)
+    карточки, on_delivered (необязательный) вызывается с (message_id, text)
+    после отправки."""
+
+    def __init__(self, send_queue, render, on_delivered=None):
+        self.send_queue = send_queue
+        self.render = render
+        self.on_delivered = on_delivered
+        self.stats = {"delivered": 0, "retries": 0, "dropped": 0}
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = None
+
+    async def start(self):
+        added = await reconcile_outbox()
+        if added:
+            logging.warning(f"Анкет без карточки в админ-группе: {added}, отправляю заново")
+        self._task = asyncio.create_task(self._run())
+
+    def wake(self):
+        """Проверить outbox сейчас, не дожидаясь OUTBOX_POLL_INTERVAL"""
+        self._wakeup.set()
+
+    async def stop(self, timeout=10):
+        """Дождаться текущей пачки и остановиться"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Отправка уведомлений об анкетах не завершилась за {timeout} с")
+        self._task = None
+
+    async def _run(self):
+        while not self._stopping:
+            # Сбрасываем до чтения: wake() во время отправки не потеряется
+            self._wakeup.clear()
+            try:
+                batch = await get_outbox_batch(time.time(), OUTBOX_BATCH_SIZE)
+                if batch:
+                    await self._deliver(batch)
+            except Exception as e:
+                logging.error(f"Ошибка отправки уведомлений об анкетах: {e}")
+                batch = None
+
+            # Полная пачка — скорее всего, есть ещё: идём сразу за следующей
+            if batch and len(batch) == OUTBOX_BATCH_SIZE:
+                continue
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), OUTBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _deliver(self, batch):
+        delivered = []
+        sending = []
+        for outbox_id, form_id, attempts, form in batch:
+            if form is None:
+                # Анкету удалили раньше, чем уведомление ушло
+                delivered.append((outbox_id, form_id, None, None))
+                self.stats["dropped"] += 1
+                continue
+            text, keyboard = self.render(form)
+            future = self.send_queue.send_message(
+                ADMIN_GROUP_ID, text, PRIORITY_ADMIN, parse_mode="HTML", reply_markup=keyboard
+            )
+            sending.append((outbox_id, attempts, form, text, future))
+
+        results = await asyncio.gather(*(future for *_, future in sending), return_exceptions=True)
+
+        failed = []
+        now = time.time()
+        for (outbox_id, attempts, form, text, _), result in zip(sending, results):
+            if isinstance(result, Exception):
+                delay = min(OUTBOX_RETRY_BASE * 2 ** attempts, OUTBOX_RETRY_MAX)
+                failed.append((outbox_id, now + delay, str(result)))
+                self.stats["retries"] += 1
+                continue
+            delivered.append((outbox_id, form.id, form.user_id, result.message_id))
+            self.stats["delivered"] += 1
+            if self.on_delivered:
+                self.on_delivered(result.message_id, text)
+
+        if delivered:
+            await complete_outbox(delivered)
+        if failed:
+            await retry_outbox(failed)
\ No newline at end of file
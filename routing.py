@@ -0,0 +1,81 @@
+from operator import attrgetter
+
+from aiogram.dispatcher.event.handler import CallableObject
+
+
+class LookupRouter:
+    """Набор обработчиков, которые выбираются по ключу события через словарь.
+
+    aiogram проверяет фильтры обработчиков по очереди, так что десяток
+    кнопок с фильтром-лямбдой — это десяток проверок на каждое сообщение.
+    Здесь весь набор регистрируется в aiogram одним обработчиком, а нужная
+    функция находится за один-два поиска в словаре: сначала по ключу
+    целиком, потом по префиксу до первого разделителя.
+
+    key(event) достаёт из события ключ (None — событие не для этого набора);
+    separator — разделитель префикса, None — только точные совпадения."""
+
+    def __init__(self, key, separator="_"):
+        self.key = key
+        self.separator = separator
+        self.exact = {}
+        self.prefixes = {}
+
+    def __call__(self, *keys):
+        """Декоратор: обработчик для событий с ключом, равным одному из keys"""
+        def decorator(handler):
+            for key in keys:
+                self.exact[key] = CallableObject(handler)
+            return handler
+        return decorator
+
+    def prefix(self, prefix):
+        """Декоратор: обработчик для ключей вида prefix + что угодно.
+        Префикс должен заканчиваться разделителем, например "accept_" """
+        assert prefix.endswith(self.separator)
+
+        def decorator(handler):
+            self.prefixes[prefix] = CallableObject(handler)
+            return handler
+        return decorator
+
+    def resolve(self, key):
+        handler = self.exact.get(key)
+        if handler is None and self.separator:
+            head, separator, _ = key.partition(self.separator)
+            if separator:
+                handler = self.prefixes.get(head + separator)
+        return handler
+
+    async def _filter(self, event):
+        # Синхронный фильтр aiogram вызвал бы через пул потоков
+        key = self.key(event)
+        if key is None:
+            return False
+        handler = self.resolve(key)
+        if handler is None:
+            return False
+        return {"route_handler": handler}
+
+    @staticmethod
+    async def _dispatch(event, route_handler, **data):
+        # Обработчик получит только те аргументы, что есть в его сигнатуре
+        return await route_handler.call(event, **data)
+
+    def attach(self, observer):
+        """Зарегистрировать весь набор в aiogram одним обработчиком"""
+        observer.register(self._dispatch, self._filter)
+
+
+class TextRouter(LookupRouter):
+    """Кнопки reply-клавиатуры: ключ — текст сообщения, только точное совпадение"""
+
+    def __init__(self):
+        super().__init__(attrgetter("text"), separator=None)
+
+
+class CallbackRouter(LookupRouter):
+    """Inline-кнопки: ключ — callback_data"""
+
+    def __init__(self):
+        super().__init__(attrgetter("data"))
\ No newline at end of file
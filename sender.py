@@ -0,0 +1,283 @@
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+from cache import TTLCache
+
+# Лимиты Telegram: около 30 сообщений в секунду на бота,
+# около 1 в секунду в личный чат и 20 в минуту в группу
+GLOBAL_RATE = 30
+PRIVATE_CHAT_RATE = 1
+GROUP_CHAT_RATE = 20 / 60
+
+# Приоритеты очереди: ответы пользователям уходят раньше уведомлений в админ-группу,
+# а массовые рассылки — в последнюю очередь, чтобы не задерживать живые диалоги
+PRIORITY_USER = 0
+PRIORITY_ADMIN = 1
+PRIORITY_BULK = 2
+
+SEND_WORKERS = 8
+MAX_ATTEMPTS = 5
+
+
+class TokenBucket:
+    """Ведро токенов: не больше rate операций в секунду с запасом capacity"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def pause(self, seconds):
+        """Не выдавать токены seconds секунд (после RetryAfter)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def try_acquire(self):
+        """Взять токен, если он есть. Возвращает 0 или через сколько секунд он появится"""
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+def _ignore_exception(future):
+    if not future.cancelled():
+        future.exception()
+
+
+class _Job:
+    __slots__ = ("method", "chat_id", "priority", "kwargs", "future", "attempts")
+
+    def __init__(self, method, chat_id, priority, kwargs, future):
+        self.method = method
+        self.chat_id = chat_id
+        self.priority = priority
+        self.kwargs = kwargs
+        self.future = future
+        self.attempts = 0
+
+
+class SendQueue:
+    """Очередь исходящих запросов к Telegram с ограничением скорости.
+
+    Обработчики ставят сообщение в очередь и сразу возвращаются; результат
+    (или ошибку) при необходимости можно получить из возвращаемого future.
+
+    У каждого чата своя FIFO-очередь, поэтому сообщения в один чат уходят
+    в том порядке, в каком попали в очередь. Воркеры берут из общей очереди
+    готовности не сообщения, а чаты; чат, у которого нет токена или который
+    ждёт RetryAfter, возвращается туда по таймеру и не держит воркера —
+    медленная админ-группа не задерживает ответы пользователям."""
+
+    def __init__(self, bot, workers=SEND_WORKERS, global_rate=GLOBAL_RATE):
+        self.bot = bot
+        self.workers = workers
+        self.stats = {"sent": 0, "retries": 0, "failed": 0}
+        # (приоритет первого сообщения чата, порядковый номер, chat_id)
+        self._ready = asyncio.PriorityQueue()
+        self._counter = itertools.count()
+        self._global_bucket = TokenBucket(global_rate, global_rate)
+        self._chat_buckets = TTLCache(maxsize=50000, ttl=600)
+        # Чат с неотправленными сообщениями всегда ровно в одном месте:
+        # в _ready, на таймере или у воркера
+        self._chats = {}
+        self._pending = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks = []
+
+    def start(self):
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    async def stop(self, timeout=10):
+        """Дождаться отправки того, что уже в очереди, и остановить воркеров"""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Очередь отправки не опустела за {timeout} с, осталось {self._pending}")
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def qsize(self):
+        return self._pending
+
+    def submit(self, method, chat_id, priority=PRIORITY_USER, **kwargs):
+        """Поставить вызов метода бота в очередь"""
+        future = asyncio.get_running_loop().create_future()
+        # Ошибка уже залогирована воркером; не ругаемся на неполученное исключение
+        future.add_done_callback(_ignore_exception)
+        job = _Job(method, chat_id, priority, kwargs, future)
+
+        self._pending += 1
+        self._idle.clear()
+        jobs = self._chats.get(chat_id)
+        if jobs is None:
+            self._chats[chat_id] = deque([job])
+            self._make_ready(chat_id)
+        else:
+            jobs.append(job)
+        return future
+
+    def send_message(self, chat_id, text, priority=PRIORITY_USER, **kwargs):
+        return self.submit("send_message", chat_id, priority, text=text, **kwargs)
+
+    def edit_message_text(self, chat_id, message_id, text, priority=PRIORITY_ADMIN, **kwargs):
+        return self.submit("edit_message_text", chat_id, priority, message_id=message_id, text=text, **kwargs)
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id, None)
+        if bucket is None:
+            if chat_id < 0:
+                bucket = TokenBucket(GROUP_CHAT_RATE, 3)
+            else:
+                bucket = TokenBucket(PRIVATE_CHAT_RATE, 3)
+            self._chat_buckets.set(chat_id, bucket)
+        return bucket
+
+    def _make_ready(self, chat_id):
+        jobs = self._chats.get(chat_id)
+        if jobs:
+            self._ready.put_nowait((jobs[0].priority, next(self._counter), chat_id))
+
+    def _finish(self):
+        self._pending -= 1
+        if not self._pending:
+            self._idle.set()
+
+    async def _worker(self):
+        while True:
+            _, _, chat_id = await self._ready.get()
+            jobs = self._chats[chat_id]
+            job = jobs.popleft()
+
+            try:
+                retry_in = await self._deliver(job)
+            except Exception as e:
+                logging.error(f"Ошибка очереди отправки для чата {chat_id}: {e}")
+                self._fail(job, e)
+                retry_in = None
+
+            if retry_in is None:
+                self._finish()
+            else:
+                # Повтор — первым в своём чате, чтобы не нарушить порядок
+                jobs.appendleft(job)
+
+            if not jobs:
+                del self._chats[chat_id]
+            elif retry_in:
+                asyncio.get_running_loop().call_later(retry_in, self._make_ready, chat_id)
+            else:
+                self._make_ready(chat_id)
+
+    def _fail(self, job, error):
+        self.stats["failed"] += 1
+        if not job.future.done():
+            job.future.set_exception(error)
+
+    async def _deliver(self, job):
+        """Одна попытка отправки. Возвращает None, если с задачей покончено,
+        или через сколько секунд попробовать снова"""
+        if job.future.cancelled():
+            return None
+
+        try:
+            bucket = self._chat_bucket(job.chat_id)
+            wait = bucket.try_acquire()
+            if wait:
+                # Чат исчерпал лимит: освобождаем воркера до появления токена
+                return wait
+
+            await self._global_bucket.acquire()
+            job.attempts += 1
+            result = await getattr(self.bot, job.method)(chat_id=job.chat_id, **job.kwargs)
+        except TelegramRetryAfter as e:
+            # Telegram сам говорит, сколько ждать: притормаживаем этот чат
+            self.stats["retries"] += 1
+            bucket.pause(e.retry_after)
+            logging.warning(f"RetryAfter {e.retry_after} с для чата {job.chat_id}")
+            error, retry_in = e, e.retry_after
+        except (TelegramNetworkError, TelegramServerError) as e:
+            self.stats["retries"] += 1
+            error, retry_in = e, min(2 ** job.attempts, 30)
+        except Exception as e:
+            error, retry_in = e, None
+        else:
+            self.stats["sent"] += 1
+            if not job.future.done():
+                job.future.set_result(result)
+            return None
+
+        if retry_in is None or job.attempts >= MAX_ATTEMPTS:
+            logging.error(f"Не удалось выполнить {job.method} для чата {job.chat_id}: {error}")
+            self._fail(job, error)
+            return None
+        return retry_in
+
+class Debouncer:
+    """Схлопывает частые вызовы по ключу в один.
+
+    Первый schedule(key) запускает таймер на window секунд; повторные
+    вызовы с тем же ключом до срабатывания таймера ничего не добавляют.
+    По таймеру вызывается корутина callback(key) — она должна сама
+    прочитать актуальное состояние, поэтому увидит итог всех изменений."""
+
+    def __init__(self, callback, window):
+        self.callback = callback
+        self.window = window
+        self.coalesced = 0
+        self._timers = {}
+        self._tasks = set()
+
+    def schedule(self, key):
+        if key in self._timers:
+            self.coalesced += 1
+            return
+        loop = asyncio.get_running_loop()
+        self._timers[key] = loop.call_later(self.window, self._fire, key)
+
+    def _fire(self, key):
+        self._timers.pop(key, None)
+        task = asyncio.create_task(self._run(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, key):
+        try:
+            await self.callback(key)
+        except Exception as e:
+            logging.error(f"Ошибка отложенного обновления {key}: {e}")
+
+    async def flush(self):
+        """Выполнить все отложенные вызовы сразу (при остановке бота)"""
+        for key, timer in list(self._timers.items()):
+            timer.cancel()
+            self._fire(key)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
\ No newline at end of file
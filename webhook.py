@@ -0,0 +1,90 @@
+import asyncio
+import logging
+import secrets
+import signal
+
+from aiohttp import web
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from config import WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_SECRET
+
+# Сколько ждать завершения уже начатых обработчиков при остановке (секунды)
+WEBHOOK_DRAIN_TIMEOUT = 30
+
+
+class DrainingRequestHandler(SimpleRequestHandler):
+    """Приёмник вебхуков, который при остановке дожидается начатых обработчиков.
+
+    Каждое обновление обрабатывается в своей задаче, а Telegram сразу
+    получает ответ 200, поэтому обновления разных пользователей идут
+    параллельно. После начала остановки новые обновления получают 503 —
+    Telegram повторит их позже, уже следующему процессу."""
+
+    def __init__(self, dispatcher, bot, secret_token=None):
+        super().__init__(dispatcher, bot, handle_in_background=True, secret_token=secret_token)
+        self.closing = False
+
+    async def handle(self, request):
+        if self.closing:
+            return web.Response(text="Shutting down", status=503)
+        return await super().handle(request)
+
+    async def close(self):
+        self.closing = True
+        tasks = list(self._background_feed_update_tasks)
+        if not tasks:
+            return
+
+        logging.info(f"Жду завершения обработчиков: {len(tasks)}")
+        done, pending = await asyncio.wait(tasks, timeout=WEBHOOK_DRAIN_TIMEOUT)
+        if pending:
+            logging.warning(f"Не дождались {len(pending)} обработчиков за {WEBHOOK_DRAIN_TIMEOUT} с")
+            for task in pending:
+                task.cancel()
+        # Сессию бота не закрываем: после обработчиков ещё досылается очередь
+
+
+def stop_event():
+    """Событие, которое выставляется по SIGINT/SIGTERM"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            # Windows: остановка по Ctrl+C придёт как отмена задачи
+            pass
+    return stop
+
+
+async def run_webhook(dp, bot, handler_class=DrainingRequestHandler):
+    """Поднять HTTP-сервер для вебхука и работать до SIGINT/SIGTERM"""
+    secret = WEBHOOK_SECRET
+    if WEBHOOK_URL and not secret:
+        secret = secrets.token_urlsafe(32)
+
+    app = web.Application()
+    handler = handler_class(dp, bot, secret_token=secret or None)
+    # Порядок важен: сначала дожидаемся обработчиков, потом останавливаем диспетчер
+    handler.register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+        await site.start()
+        logging.info(f"Вебхук слушает {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+        if WEBHOOK_URL:
+            await bot.set_webhook(
+                WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                secret_token=secret,
+                allowed_updates=dp.resolve_used_update_types()
+            )
+        elif not secret:
+            logging.warning("WEBHOOK_SECRET не задан: проверка секрета отключена")
+
+        await stop_event().wait()
+    finally:
+        await runner.cleanup()
\ No newline at end of file
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import multiprocessing
+import signal
+
+from aiohttp import web
+
+from webhook import DrainingRequestHandler, stop_event
+
+# Таймаут long polling в приёмнике (секунды)
+POLL_TIMEOUT = 30
+
+# Сколько ждать, пока воркер доработает очередь при остановке (секунды)
+WORKER_STOP_TIMEOUT = 60
+
+
+def update_user_id(update):
+    """user_id автора сырого обновления (0, если автора нет)"""
+    for key, event in update.items():
+        if key == "update_id" or not isinstance(event, dict):
+            continue
+        author = event.get("from") or event.get("user") or event.get("chat") or {}
+        return author.get("id", 0)
+    return 0
+
+
+class WorkerPool:
+    """Процессы-воркеры, между которыми обновления делятся по user_id.
+
+    Все обновления одного пользователя попадают в один и тот же воркер,
+    поэтому его шаги FSM обрабатываются по порядку, а кэши воркера
+    (анкеты, состояния FSM) остаются согласованными."""
+
+    def __init__(self, target, count):
+        # spawn, а не fork: у дочернего процесса должно быть своё соединение
+        # с базой и свой цикл событий, а не копии родительских
+        context = multiprocessing.get_context("spawn")
+        self.queues = [context.Queue() for _ in range(count)]
+        self.processes = [
+            context.Process(target=target, args=(index, queue), name=f"worker-{index}")
+            for index, queue in enumerate(self.queues)
+        ]
+        self.routed = [0] * count
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+
+    def route(self, update):
+        index = update_user_id(update) % len(self.queues)
+        self.routed[index] += 1
+        self.queues[index].put(update)
+
+    async def stop(self, timeout=WORKER_STOP_TIMEOUT):
+        """Попросить воркеров доработать очереди и дождаться их завершения"""
+        for queue in self.queues:
+            queue.put(None)
+
+        for process in self.processes:
+            await asyncio.to_thread(process.join, timeout)
+            if process.is_alive():
+                logging.warning(f"{process.name} не остановился за {timeout} с")
+                process.terminate()
+
+
+def ignore_stop_signals():
+    """Воркер останавливается по команде приёмника, а не по Ctrl+C"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+
+class UserOrderedFeeder:
+    """Передаёт обновления в диспетчер: разные пользователи обрабатываются
+    параллельно, обновления одного пользователя — строго по очереди"""
+
+    def __init__(self, dp, bot):
+        self.dp = dp
+        self.bot = bot
+        self.processed = 0
+        self._user_locks = {}
+        self._tasks = set()
+
+    def feed(self, update):
+        task = asyncio.create_task(self._process(update_user_id(update), update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, user_id, update):
+        # Замок берётся до первого await, поэтому задачи одного пользователя
+        # получают его в том порядке, в каком обновления пришли
+        entry = self._user_locks.setdefault(user_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await self.dp.feed_raw_update(self.bot, update)
+        except Exception:
+            logging.exception(f"Ошибка обработки обновления {update.get('update_id')}")
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._user_locks[user_id]
+            self.processed += 1
+
+    async def consume(self, queue):
+        """Читать обновления из очереди процесса до None, затем доработать начатое"""
+        loop = asyncio.get_running_loop()
+        while True:
+            update = await loop.run_in_executor(None, queue.get)
+            if update is None:
+                break
+            self.feed(update)
+
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+class RoutingRequestHandler(DrainingRequestHandler):
+    """Приёмник вебхуков, который не обрабатывает обновления сам,
+    а сразу передаёт их воркерам"""
+
+    def __init__(self, dispatcher, bot, secret_token=None, route=None):
+        super().__init__(dispatcher, bot, secret_token=secret_token)
+        self.route = route
+
+    async def _handle_request_background(self, bot, request):
+        self.route(await request.json(loads=bot.session.json_loads))
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+
+async def poll_updates(dp, bot, route):
+    """Long polling без обработки: каждое обновление отдаётся в route()"""
+    stop = stop_event()
+    allowed_updates = dp.resolve_used_update_types()
+    offset = None
+
+    while not stop.is_set():
+        request = asyncio.create_task(bot.get_updates(
+            offset=offset, timeout=POLL_TIMEOUT, allowed_updates=allowed_updates
+        ))
+        stopping = asyncio.create_task(stop.wait())
+        await asyncio.wait({request, stopping}, return_when=asyncio.FIRST_COMPLETED)
+        stopping.cancel()
+        if not request.done():
+            request.cancel()
+            break
+
+        try:
+            updates = request.result()
+        except Exception as e:
+            logging.error(f"Ошибка получения обновлений: {e}")
+            await asyncio.sleep(5)
+            continue
+
+        for update in updates:
+            route(update.model_dump(mode="json", by_alias=True, exclude_none=True))
+            offset = update.update_id + 1
+
+    if offset is not None:
+        # Подтверждаем уже розданные обновления, иначе после рестарта
+        # Telegram пришлёт их ещё раз
+        await bot.get_updates(offset=offset, timeout=0, limit=1)
\ No newline at end of file